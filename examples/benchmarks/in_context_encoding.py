@@ -0,0 +1,70 @@
+"""Time the in-context scene graph encoders on synthetic graphs of increasing size, e.g.
+
+    python in_context_encoding.py
+    python in_context_encoding.py --n-objects 1000 10000 100000 400000 --repeats 5
+
+The time per object should stay flat as the graph grows, i.e. encoding is
+linear in the number of nodes. "cold" times include reading the layer arrays
+and hierarchy index out of the scene graph, "warm" times reuse them.
+"""
+
+import argparse
+import time
+
+from heracles_agents.pipelines.dsg_arrays import DsgArraysRegistry
+from heracles_agents.pipelines.dsg_hierarchy import DsgHierarchyRegistry
+from heracles_agents.pipelines.in_context_utils import (
+    scene_graph_to_prompt,
+    scene_graph_to_prompt_full,
+)
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+PLACE_LAYER_NAME = "MESH_PLACES"
+
+
+def clear_registries():
+    DsgArraysRegistry.clear()
+    DsgHierarchyRegistry.clear()
+
+
+def best_time(fn, repeats, setup=None):
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--n-objects", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    encoders = {
+        "scene_graph_to_prompt": scene_graph_to_prompt,
+        "scene_graph_to_prompt_full": lambda G: scene_graph_to_prompt_full(
+            G, PLACE_LAYER_NAME
+        ),
+    }
+    print(
+        f"{'encoder':<28}{'objects':>10}{'chars':>12}{'cold s':>10}{'warm s':>10}{'us/object':>12}"
+    )
+    for n_objects in args.n_objects:
+        G = make_synthetic_scene_graph(n_objects, place_layer_name=PLACE_LAYER_NAME)
+        for name, encoder in encoders.items():
+            n_chars = len(encoder(G))
+            cold = best_time(lambda: encoder(G), args.repeats, clear_registries)
+            warm = best_time(lambda: encoder(G), args.repeats)
+            print(
+                f"{name:<28}{n_objects:>10}{n_chars:>12}{cold:>10.3f}{warm:>10.3f}{1e6 * cold / n_objects:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare the prompt tokens of the default and compact in-context scene graph encodings, e.g.
+
+    python in_context_tokens.py
+    python in_context_tokens.py ../scene_graphs/west_point_fused_map_wregions_labelspace.json --model gpt-4.1
+    python in_context_tokens.py --synthetic 1000 10000
+
+Without arguments, the example scene graphs are used if they are available
+(under $HERACLES_AGENTS_PATH/examples/scene_graphs), otherwise synthetic graphs.
+"""
+
+import argparse
+import os
+
+import spark_dsg
+
+from heracles_agents.pipelines.in_context_utils import iter_scene_graph_to_prompt_full
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+from heracles_agents.token_utils import count_tokens, get_token_encoder
+
+EXAMPLE_SCENE_GRAPHS = [
+    "$HERACLES_AGENTS_PATH/examples/scene_graphs/west_point_fused_map_wregions_labelspace.json",
+    "$HERACLES_AGENTS_PATH/examples/scene_graphs/b45_clip_final_wregions_labelspace.json",
+]
+ENCODINGS = ["default", "compact"]
+
+
+def load_scene_graphs(args):
+    paths = args.dsg_filepaths
+    if not paths and not args.synthetic:
+        paths = [
+            p
+            for p in (os.path.expandvars(p) for p in EXAMPLE_SCENE_GRAPHS)
+            if os.path.exists(p)
+        ]
+        if not paths:
+            print("Example scene graphs not found, using synthetic scene graphs")
+            args.synthetic = [1000, 10000]
+    for path in paths:
+        yield os.path.basename(path), spark_dsg.DynamicSceneGraph.load(path)
+    for n_objects in args.synthetic or []:
+        scene_graph = make_synthetic_scene_graph(
+            n_objects, place_layer_name=args.place_layer_name
+        )
+        yield f"synthetic ({n_objects} objects)", scene_graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("dsg_filepaths", nargs="*")
+    parser.add_argument("--synthetic", type=int, nargs="*", metavar="N_OBJECTS")
+    parser.add_argument("--place-layer-name", default="MESH_PLACES")
+    parser.add_argument("--model", default="gpt-4.1")
+    args = parser.parse_args()
+
+    enc = get_token_encoder(args.model)
+    scene_graphs = list(load_scene_graphs(args))
+    print(
+        f"{'scene graph':<50}"
+        + "".join(f"{e + ' tokens':>18}" for e in ENCODINGS)
+        + f"{'reduction':>12}"
+    )
+    for name, scene_graph in scene_graphs:
+        # Counted chunk by chunk, without building the whole prompt
+        n_tokens = [
+            count_tokens(
+                iter_scene_graph_to_prompt_full(
+                    scene_graph, args.place_layer_name, encoding=encoding
+                ),
+                enc,
+            )
+            for encoding in ENCODINGS
+        ]
+        reduction = 1 - n_tokens[1] / n_tokens[0]
+        print(
+            f"{name:<50}"
+            + "".join(f"{n:>18}" for n in n_tokens)
+            + f"{reduction:>12.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
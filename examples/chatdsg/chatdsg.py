@@ -2,7 +2,6 @@
 import argparse
 import logging
 import os
-import threading
 
 import spark_dsg
 import yaml
@@ -15,6 +14,7 @@ from textual.widgets import Footer, Input, Label, RichLog, Rule, Static, TextAre
 
 from heracles_agents.llm_agent import LlmAgent
 from heracles_agents.llm_interface import AgentContext
+from heracles_agents.pipelines.dsg_updates import DsgUpdateTracker
 
 logger = logging.getLogger(__name__)
 
@@ -37,9 +37,28 @@ class MyTextArea(TextArea):
         self.app.action_submit()
 
 
+class SceneGraphWatcher:
+    """Reloads a scene graph file when it changes, and describes the changes to the agent"""
+
+    def __init__(self, dsg_filepath, place_layer_name=None):
+        self.dsg_filepath = dsg_filepath
+        self.tracker = DsgUpdateTracker(place_layer_name)
+        self.mtime = None
+
+    def update_message(self):
+        """The scene graph (the first time) or its changes, if the file changed since the last call"""
+        mtime = os.path.getmtime(self.dsg_filepath)
+        if mtime == self.mtime:
+            return None
+        self.mtime = mtime
+        scene_graph = spark_dsg.DynamicSceneGraph.load(self.dsg_filepath)
+        return self.tracker.update_message(scene_graph)
+
+
 class InputDisplayApp(App):
-    def __init__(self, agent):
+    def __init__(self, agent, dsg_watcher=None):
         self.agent = agent
+        self.dsg_watcher = dsg_watcher
         self.messages = generate_initial_prompt(agent).to_openai_json(
             "Now you will interact with the user:"
         )
@@ -80,27 +99,26 @@ class InputDisplayApp(App):
         text_log.write("")
         input_text_box.text = ""
 
+        if self.dsg_watcher is not None:
+            dsg_update = self.dsg_watcher.update_message()
+            if dsg_update is not None:
+                input_text = f"{dsg_update}\n\n{input_text}"
         self.messages += new_user_message(input_text)
         initial_length = len(self.messages)
 
         cxt = AgentContext(self.agent)
         cxt.history = self.messages
 
-        def run_agent():
-            success, answer = cxt.run()
+        async def run_agent():
+            success, answer = await cxt.arun()
             responses = cxt.get_agent_responses()
             for r in responses[initial_length:]:
                 text_log.write(r.parsed_response)
                 text_log.write("")
 
-        thread = threading.Thread(target=run_agent)
-        thread.start()
-
-        # success, answer = cxt.run()
-        # responses = cxt.get_agent_responses()
-        # for r in responses[initial_length:]:
-        #    text_log.write(r.parsed_response)
-        #    text_log.write("")
+        # The agent runs on the app's event loop, so the UI stays responsive
+        # while waiting on the LLM
+        self.run_worker(run_agent())
 
 
 if __name__ == "__main__":
@@ -124,6 +142,17 @@ if __name__ == "__main__":
         help="Path to room labelspace",
         default="b45_label_space.yaml",
     )
+    parser.add_argument(
+        "--scene-graph-in-context",
+        action="store_true",
+        help="Also put the scene graph in the agent's context, and tell the agent about changes to the scene graph file",
+    )
+    parser.add_argument(
+        "--place-layer-name",
+        type=str,
+        default=None,
+        help="Layer of the places to include with --scene-graph-in-context",
+    )
     parser.add_argument("--db_ip", type=str, help="Heracles database ip")
     parser.add_argument("--db_port", type=int, help="Heracles database ip")
     args = parser.parse_args()
@@ -158,5 +187,10 @@ if __name__ == "__main__":
     with open("agent_config.yaml", "r") as fo:
         yml = yaml.safe_load(fo)
     agent = LlmAgent(**yml)
-    app = InputDisplayApp(agent)
+    dsg_watcher = None
+    if args.scene_graph_in_context:
+        if not args.scene_graph:
+            parser.error("--scene-graph-in-context requires --scene-graph")
+        dsg_watcher = SceneGraphWatcher(args.scene_graph, args.place_layer_name)
+    app = InputDisplayApp(agent, dsg_watcher)
     app.run()
@@ -1,33 +1,15 @@
-import logging
+"""Run an experiment description, e.g.
 
-import yaml
+    python experiment_runner.py run experiments/openai_codegen_agentic_test.yaml
+    python experiment_runner.py run experiments/master_experiment.yaml --n-shards 4 --shard-index 0
+    python experiment_runner.py merge experiments/master_experiment.yaml output/master_experiment_shard*of4_out.yaml
 
-from heracles_agents.experiment_definition import ExperimentDescription
-from heracles_agents.llm_interface import AnalyzedExperiment
-from heracles_agents.summarize_results import display_experiment_results
+Completed questions are checkpointed as they finish, and re-running the same
+command resumes from the checkpoint. See `python experiment_runner.py --help`.
+This is the same as the `heracles-experiment` command installed with the package.
+"""
 
-logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, force=True)
+from heracles_agents.experiment_cli import main
 
-# experiment_fn = "experiments/ollama_test.yaml"
-# experiment_fn = "experiments/structured_sldp.yaml"
-# experiment_fn = "experiments/master_experiment.yaml"
-experiment_fn = "experiments/openai_codegen_agentic_test.yaml"
-with open(experiment_fn, "r") as fo:
-    yml = yaml.safe_load(fo)
-
-experiment = ExperimentDescription(**yml)
-logger.debug(f"Loaded experiment: {experiment}")
-
-results = {}
-for configuration_name, experiment_config in experiment.configurations.items():
-    logger.info(f"Testing configuration {configuration_name}")
-    analyzed_questions = experiment_config.pipeline.function(experiment_config)
-
-    display_experiment_results(analyzed_questions)
-    results[configuration_name] = analyzed_questions
-
-ae = AnalyzedExperiment(experiment_configurations=results)
-
-with open("output/master_experiment_out.yaml", "w") as fo:
-    fo.write(yaml.dump(ae.model_dump()))
+if __name__ == "__main__":
+    main()
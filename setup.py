@@ -10,6 +10,11 @@ setup(
     package_dir={"": "src"},
     packages=find_packages("src"),
     package_data={"": ["*.yaml", "*.pddl", "*.lark"]},
+    entry_points={
+        "console_scripts": [
+            "heracles-experiment=heracles_agents.experiment_cli:main",
+        ],
+    },
     install_requires=[
         "pydantic-settings",
         "plum-dispatch",
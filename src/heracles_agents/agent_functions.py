@@ -145,6 +145,12 @@ def count_message_tokens(agent: LlmAgent, message: type(None)):
     return 0
 
 
+@dispatch
+def get_cache_usage(agent, response):
+    """(cache read, cache write) input tokens of a response, for providers that report them"""
+    return 0, 0
+
+
 @dispatch
 def count_tool_description_tokens(agent: LlmAgent, explicit_tools: dict):
     enc = get_token_encoder(agent.model_info.model)
@@ -0,0 +1,173 @@
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from typing import Literal, NamedTuple, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+logger = logging.getLogger(__name__)
+
+
+class BatchConfig(BaseModel):
+    """Send the first turn of every question as a single batch job"""
+
+    # provider: the provider's batch endpoint (OpenAI and Anthropic)
+    # local: a file-based stand-in batch server, answered with ordinary requests
+    backend: Literal["provider", "local"] = "provider"
+    # Where the local batch server keeps its jobs
+    batch_dir: Optional[str] = None
+    poll_interval_s: float = Field(default=30.0, gt=0)
+    # Give up on the batch after this long, and request the questions individually
+    timeout_s: float = Field(default=24 * 60 * 60, gt=0)
+
+    @model_validator(mode="after")
+    def check_batch_dir(self):
+        if self.backend == "local" and self.batch_dir is None:
+            raise ValueError("The local batch backend requires a batch_dir")
+        return self
+
+
+class BatchRequest(NamedTuple):
+    # The LLM cache key of the request, which identifies the response in the batch
+    custom_id: str
+    model_info: object
+    tools: list
+    response_format: object
+    messages: list
+
+
+class LocalBatchServer:
+    """File-based stand-in for a provider batch endpoint.
+
+    Each job is a directory under `batch_dir` holding the pickled requests. A
+    background thread answers the requests one at a time with the client's
+    ordinary `call`, and writes the results next to them when the whole job is
+    done. Provides the same `submit_batch` / `poll_batch` interface as the
+    provider client configs.
+    """
+
+    def __init__(self, batch_dir: str, client):
+        self.batch_dir = os.path.expandvars(batch_dir)
+        self.client = client
+        os.makedirs(self.batch_dir, exist_ok=True)
+
+    def _job_path(self, batch_id, name):
+        return os.path.join(self.batch_dir, batch_id, name)
+
+    def submit_batch(self, requests: list[BatchRequest]) -> str:
+        batch_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.batch_dir, batch_id))
+        self._write(self._job_path(batch_id, "requests.pkl"), list(requests))
+        thread = threading.Thread(target=self.process_job, args=(batch_id,))
+        thread.daemon = True
+        thread.start()
+        return batch_id
+
+    def process_job(self, batch_id):
+        with open(self._job_path(batch_id, "requests.pkl"), "rb") as fo:
+            requests = pickle.load(fo)
+        results = {}
+        for r in requests:
+            try:
+                results[r.custom_id] = self.client.call(
+                    r.model_info, r.tools, r.response_format, r.messages
+                )
+            except Exception as ex:
+                # Like the provider endpoints, a failed request doesn't fail the job
+                logger.error(f"Local batch request {r.custom_id} failed: {ex}")
+        self._write(self._job_path(batch_id, "results.pkl"), results)
+
+    def poll_batch(self, batch_id) -> Optional[dict]:
+        path = self._job_path(batch_id, "results.pkl")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as fo:
+            return pickle.load(fo)
+
+    def _write(self, path, value):
+        # Write to a temporary file and rename, so pollers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fo:
+                pickle.dump(value, fo)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class BatchResponseRegistry:
+    """Responses from batch jobs, waiting to be picked up by an AgentContext.
+
+    Keyed by the same request key as the LLM cache, so the agent finds the
+    batch response for exactly the request it was about to send.
+    """
+
+    responses = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def add(cls, responses: dict):
+        with cls._lock:
+            cls.responses.update(responses)
+
+    @classmethod
+    def discard(cls, keys):
+        with cls._lock:
+            for k in keys:
+                cls.responses.pop(k, None)
+
+    @classmethod
+    def lookup(cls, key):
+        return cls.responses.get(key)
+
+    @classmethod
+    def is_empty(cls):
+        return len(cls.responses) == 0
+
+
+def get_batch_backend(client, config: BatchConfig):
+    if config.backend == "local":
+        return LocalBatchServer(config.batch_dir, client)
+    if not hasattr(client, "submit_batch"):
+        raise ValueError(
+            f"Batch inference is not supported for {client.client_type} clients. Use the local batch backend instead."
+        )
+    return client
+
+
+def run_batch(client, requests: list[BatchRequest], config: BatchConfig) -> dict:
+    """Submit `requests` as one batch job and wait for the responses.
+
+    Returns a dict from custom_id to response. Requests that failed, or that
+    did not finish before the timeout, are missing from the result.
+    """
+    if len(requests) == 0:
+        return {}
+    backend = get_batch_backend(client, config)
+    batch_id = backend.submit_batch(requests)
+    logger.info(f"Submitted batch {batch_id} with {len(requests)} requests")
+
+    deadline = time.monotonic() + config.timeout_s
+    while True:
+        results = backend.poll_batch(batch_id)
+        if results is not None:
+            break
+        if time.monotonic() > deadline:
+            logger.error(
+                f"Batch {batch_id} did not finish within {config.timeout_s} seconds"
+            )
+            return {}
+        time.sleep(config.poll_interval_s)
+
+    n_missing = len(requests) - len(results)
+    if n_missing > 0:
+        logger.warning(
+            f"Batch {batch_id} is missing {n_missing} responses, they will be requested individually"
+        )
+    logger.info(f"Batch {batch_id} finished")
+    return results
@@ -1,4 +1,5 @@
 import os
+import threading
 from typing import Literal, Optional, Union
 
 import spark_dsg
@@ -12,7 +13,21 @@ from pydantic import (
 )
 from pydantic_settings import BaseSettings
 
-from .pipelines.codegen_utils import load_dsg, load_dsg_api_prompt
+from .pipelines.codegen_utils import (
+    CodeExecutionLimits,
+    file_content_hash,
+    load_dsg,
+    load_dsg_api_prompt,
+)
+from .pipelines.dsg_hierarchy import DsgHierarchyRegistry
+from .pipelines.dsg_snapshot import DsgSnapshotCache
+
+
+def check_files_exist(**filepaths):
+    """Fail when a configuration is parsed, rather than when its files are first loaded"""
+    for name, filepath in filepaths.items():
+        if filepath is not None and not os.path.exists(os.path.expandvars(filepath)):
+            raise ValueError(f"{name} {filepath} does not exist")
 
 
 class HeraclesDsgInterface(BaseSettings):
@@ -32,17 +47,58 @@ class InContextDsgInterfaceConfig(BaseModel):
     dsg_interface_type: Literal["in_context"]
     dsg_filepath: Optional[str] = None
     dsg_place_layer_name: str
-    _dsg: PrivateAttr() = None
+    # If set, only a question-relevant part of the scene graph that fits in this
+    # many tokens is put in the prompt
+    subgraph_token_budget: Optional[int] = Field(default=None, gt=0)
+    # Encoding of the scene graph with places (see `scene_graph_to_prompt_full`)
+    dsg_encoding: Literal["default", "compact"] = "default"
+    # Loaded on the first `get_dsg`, so that parsing an experiment doesn't load
+    # the scene graphs of configurations that never run
+    _dsg: Optional[spark_dsg.DynamicSceneGraph] = PrivateAttr(default=None)
+    _load_lock: object = PrivateAttr(default_factory=threading.Lock)
+
+    # Text encodings of _dsg, keyed by encoder and encoding parameters
+    _serialization_cache: dict = PrivateAttr(default_factory=dict)
+    _serialized_dsg: Optional[spark_dsg.DynamicSceneGraph] = PrivateAttr(default=None)
+    _serialization_lock: object = PrivateAttr(default_factory=threading.Lock)
 
     @model_validator(mode="after")
-    def load_dsg(self):
-        self._dsg = spark_dsg.DynamicSceneGraph.load(
-            os.path.expandvars(self.dsg_filepath)
-        )
+    def check_dsg_filepath(self):
+        check_files_exist(dsg_filepath=self.dsg_filepath)
         return self
 
     def get_dsg(self):
-        return self._dsg
+        with self._load_lock:
+            if self._dsg is None and self.dsg_filepath is not None:
+                self._dsg = load_dsg(os.path.expandvars(self.dsg_filepath))
+            return self._dsg
+
+    def get_serialized_dsg(self, encoder, **encoding_params):
+        """Return `encoder(dsg, **encoding_params)`, computed once per encoder and parameters.
+
+        The scene graph doesn't change between questions, so its (potentially
+        very large) prompt encoding is only built for the first question.
+        """
+        key = (encoder, tuple(sorted(encoding_params.items())))
+        dsg = self.get_dsg()
+        # Holding the lock while encoding means that concurrent questions wait
+        # for the first encoding instead of all building their own
+        with self._serialization_lock:
+            if self._serialized_dsg is not dsg:
+                # The scene graph was replaced, earlier encodings are stale
+                self._serialization_cache = {}
+                self._serialized_dsg = dsg
+            if key not in self._serialization_cache:
+                self._serialization_cache[key] = encoder(dsg, **encoding_params)
+            return self._serialization_cache[key]
+
+    def get_hierarchy_index(self):
+        """Object/place/room hierarchy of the scene graph, shared with the prompt encoders"""
+        return DsgHierarchyRegistry.get(self.get_dsg(), self.dsg_place_layer_name)
+
+    def get_dsg_snapshot(self):
+        """Node arrays of the scene graph file, read without loading the scene graph if possible"""
+        return DsgSnapshotCache.get(os.path.expandvars(self.dsg_filepath))
 
     def get_place_layer_name(self):
         return self.dsg_place_layer_name
@@ -59,33 +115,79 @@ class PythonDsgInterface(BaseModel):
     dsg_api_filepath: str
     dsg_api_descriptions: Optional[bool] = False
     dsg_api_examples: Optional[bool] = False
-
-    _dsg: PrivateAttr() = None
+    # Generated code runs on its own copy of the scene graph, so that it can't
+    # change what later code sees. Set this to run it on the one scene graph
+    # its worker loaded instead, which saves copying a large scene graph for
+    # every run, but is only safe for code that never modifies the scene graph.
+    share_dsg: bool = False
+    # Time, memory, CPU time and output size limits on running generated code
+    code_execution_limits: CodeExecutionLimits = Field(
+        default_factory=CodeExecutionLimits
+    )
+    # Whether generated code that already ran on the (read-only) scene graph
+    # returns its earlier result instead of running again
+    cache_code_results: bool = True
+
+    # Loaded on first use, like `InContextDsgInterfaceConfig`
+    _dsg: Optional[spark_dsg.DynamicSceneGraph] = PrivateAttr(default=None)
+    _dsg_api_prompt: Optional[str] = PrivateAttr(default=None)
+    _load_lock: object = PrivateAttr(default_factory=threading.Lock)
 
     @model_validator(mode="after")
-    def load_dsg(self):
-        self._dsg = load_dsg(
-            os.path.expandvars(self.dsg_filepath),
-            os.path.expandvars(self.dsg_labels_filepath)
-            if self.dsg_labels_filepath
-            else None,
+    def check_filepaths(self):
+        check_files_exist(
+            dsg_filepath=self.dsg_filepath,
+            dsg_labels_filepath=self.dsg_labels_filepath,
+            dsg_api_filepath=self.dsg_api_filepath,
         )
         return self
 
-    @model_validator(mode="after")
-    def load_dsg_api(self):
-        self._dsg_api_prompt = load_dsg_api_prompt(
-            os.path.expandvars(self.dsg_api_filepath),
-            include_descriptions=self.dsg_api_descriptions,
-            include_examples=self.dsg_api_examples,
+    def get_dsg(self):
+        """The scene graph, shared with everything else that loads the same files.
+
+        It must not be modified, generated code gets a copy of it instead (see
+        `execute_generated_code_timed`).
+        """
+        with self._load_lock:
+            if self._dsg is None:
+                self._dsg = load_dsg(
+                    os.path.expandvars(self.dsg_filepath),
+                    os.path.expandvars(self.dsg_labels_filepath)
+                    if self.dsg_labels_filepath
+                    else None,
+                )
+            return self._dsg
+
+    def __reduce__(self):
+        # Sent to sandbox workers as just the configuration. A worker loads the
+        # scene graph itself, once, and copies it for every job.
+        return (self.__class__.model_validate, (self.model_dump(),))
+
+    def get_hierarchy_index(self):
+        return DsgHierarchyRegistry.get(self.get_dsg())
+
+    def get_dsg_hash(self):
+        """Content hashes of the scene graph and label files"""
+        return (
+            file_content_hash(os.path.expandvars(self.dsg_filepath)),
+            file_content_hash(os.path.expandvars(self.dsg_labels_filepath))
+            if self.dsg_labels_filepath
+            else None,
         )
-        return self
 
-    def get_dsg(self):
-        return self._dsg
+    def get_dsg_snapshot(self):
+        """Node arrays of the scene graph file, read without loading the scene graph if possible"""
+        return DsgSnapshotCache.get(os.path.expandvars(self.dsg_filepath))
 
     def get_dsg_api_prompt(self):
-        return self._dsg_api_prompt
+        with self._load_lock:
+            if self._dsg_api_prompt is None:
+                self._dsg_api_prompt = load_dsg_api_prompt(
+                    os.path.expandvars(self.dsg_api_filepath),
+                    include_descriptions=self.dsg_api_descriptions,
+                    include_examples=self.dsg_api_examples,
+                )
+            return self._dsg_api_prompt
 
 
 DsgInterfaceConfigType = Union[
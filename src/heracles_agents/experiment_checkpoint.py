@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+import threading
+
+from pydantic import ValidationError
+
+from heracles_agents.llm_interface import AnalyzedQuestion
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigurationCheckpoint:
+    """Append-only record of the questions completed for one experiment configuration.
+
+    Each completed AnalyzedQuestion is written as a single JSON line as soon as
+    it finishes, so an interrupted run loses at most the questions that were in
+    flight.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> dict[str | int, AnalyzedQuestion]:
+        """Return the completed questions keyed by question uid"""
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, "r") as fo:
+            for line_number, line in enumerate(fo):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    aq = AnalyzedQuestion.model_validate(json.loads(line))
+                except (json.JSONDecodeError, ValidationError):
+                    # Most likely a line that was being written when the run was killed
+                    logger.warning(
+                        f"Skipping unreadable line {line_number} of checkpoint {self.path}"
+                    )
+                    continue
+                completed[aq.question.uid] = aq
+        logger.info(f"Loaded {len(completed)} completed questions from {self.path}")
+        return completed
+
+    def append(self, analyzed_question: AnalyzedQuestion):
+        line = json.dumps(analyzed_question.model_dump(mode="json"))
+        with self._lock:
+            with open(self.path, "a") as fo:
+                fo.write(line + "\n")
+                fo.flush()
+                os.fsync(fo.fileno())
+
+
+class CheckpointStore:
+    """Directory of per-configuration checkpoints, keyed by configuration name"""
+
+    def __init__(self, checkpoint_dir: str):
+        self.checkpoint_dir = os.path.expandvars(checkpoint_dir)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self._checkpoints = {}
+        self._lock = threading.Lock()
+
+    def for_configuration(self, configuration_name: str) -> ConfigurationCheckpoint:
+        with self._lock:
+            if configuration_name not in self._checkpoints:
+                path = os.path.join(self.checkpoint_dir, f"{configuration_name}.jsonl")
+                self._checkpoints[configuration_name] = ConfigurationCheckpoint(path)
+            return self._checkpoints[configuration_name]
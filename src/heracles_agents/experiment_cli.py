@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Command line entry point for running and merging experiments.
+
+Run a whole experiment:
+    heracles-experiment run experiments/master_experiment.yaml
+
+Run one shard of an experiment (e.g., as one task of a batch array job), and
+merge the shard outputs once every shard has finished:
+    heracles-experiment run experiments/master_experiment.yaml --n-shards 8 --shard-index 3
+    heracles-experiment merge experiments/master_experiment.yaml output/master_experiment_shard*.yaml
+"""
+
+import argparse
+import logging
+import os
+
+import yaml
+
+from heracles_agents.experiment_checkpoint import CheckpointStore
+from heracles_agents.experiment_definition import ExperimentDescription
+from heracles_agents.experiment_scheduler import run_experiment
+from heracles_agents.experiment_sharding import (
+    load_analyzed_experiment,
+    merge_shard_results,
+    shard_experiment,
+)
+from heracles_agents.llm_cache import LlmCacheConfig
+from heracles_agents.summarize_results import display_experiment_results
+
+logger = logging.getLogger(__name__)
+
+
+def load_experiment(experiment_fn):
+    with open(experiment_fn, "r") as fo:
+        yml = yaml.safe_load(fo)
+    experiment = ExperimentDescription(**yml)
+    logger.debug(f"Loaded experiment: {experiment}")
+    return experiment
+
+
+def write_analyzed_experiment(ae, output_fn):
+    output_dir = os.path.dirname(output_fn)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_fn, "w") as fo:
+        fo.write(yaml.dump(ae.model_dump()))
+    logger.info(f"Wrote results to {output_fn}")
+
+
+def default_output_fn(experiment_fn, shard_index=None, n_shards=None):
+    name = os.path.splitext(os.path.basename(experiment_fn))[0]
+    if n_shards is not None:
+        name += f"_shard{shard_index}of{n_shards}"
+    return os.path.join("output", f"{name}_out.yaml")
+
+
+def run_command(args):
+    if (args.shard_index is None) != (args.n_shards is None):
+        raise ValueError("--shard-index and --n-shards must be given together")
+
+    experiment = load_experiment(args.experiment)
+    if args.llm_cache_dir is not None:
+        experiment.llm_cache = LlmCacheConfig(
+            cache_dir=args.llm_cache_dir, mode=args.llm_cache_mode
+        )
+    if args.n_shards is not None:
+        experiment = shard_experiment(experiment, args.shard_index, args.n_shards)
+
+    output_fn = args.output or default_output_fn(
+        args.experiment, args.shard_index, args.n_shards
+    )
+    # Each shard gets its own checkpoint, since shards may run concurrently
+    checkpoint_dir = (
+        args.checkpoint_dir or os.path.splitext(output_fn)[0] + "_checkpoints"
+    )
+    checkpoints = None if args.no_checkpoint else CheckpointStore(checkpoint_dir)
+
+    ae = run_experiment(experiment, checkpoints)
+
+    if not args.quiet:
+        for name, analyzed_questions in ae.experiment_configurations.items():
+            display_experiment_results(analyzed_questions, title=name)
+
+    write_analyzed_experiment(ae, output_fn)
+
+
+def merge_command(args):
+    experiment = load_experiment(args.experiment)
+    shard_results = [load_analyzed_experiment(fn) for fn in args.shard_outputs]
+    ae = merge_shard_results(experiment, shard_results)
+
+    if not args.quiet:
+        for name, analyzed_questions in ae.experiment_configurations.items():
+            display_experiment_results(analyzed_questions, title=name)
+
+    write_analyzed_experiment(ae, args.output or default_output_fn(args.experiment))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        "heracles-experiment", description="Run heracles_agents experiments"
+    )
+    parser.add_argument(
+        "--log-level", default="INFO", help="Python logging level (default: INFO)"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run an experiment (or one shard)")
+    run_parser.add_argument("experiment", help="Experiment description yaml")
+    run_parser.add_argument(
+        "--output",
+        help="Output yaml path (default: output/<experiment>[_shard<i>of<n>]_out.yaml)",
+    )
+    run_parser.add_argument(
+        "--checkpoint-dir",
+        help="Directory for per-question checkpoints (default: derived from --output)",
+    )
+    run_parser.add_argument(
+        "--no-checkpoint", action="store_true", help="Do not checkpoint or resume"
+    )
+    run_parser.add_argument(
+        "--llm-cache-dir",
+        help="Record / replay LLM responses in this directory (overrides llm_cache in the experiment)",
+    )
+    run_parser.add_argument(
+        "--llm-cache-mode",
+        choices=["record", "replay", "read_through"],
+        default="read_through",
+        help="record: always call the LLM and save the response. replay: only use cached responses, fail on a miss. read_through: use cached responses, call the LLM on a miss (default)",
+    )
+    run_parser.add_argument("--shard-index", type=int, help="Index of shard to run")
+    run_parser.add_argument("--n-shards", type=int, help="Total number of shards")
+    run_parser.add_argument(
+        "--quiet", action="store_true", help="Don't display the results tables"
+    )
+    run_parser.set_defaults(func=run_command)
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="Merge the outputs of every shard of an experiment"
+    )
+    merge_parser.add_argument("experiment", help="Experiment description yaml")
+    merge_parser.add_argument("shard_outputs", nargs="+", help="Shard output yamls")
+    merge_parser.add_argument(
+        "--output", help="Output yaml path (default: output/<experiment>_out.yaml)"
+    )
+    merge_parser.add_argument(
+        "--quiet", action="store_true", help="Don't display the results tables"
+    )
+    merge_parser.set_defaults(func=merge_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), force=True)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,27 @@ from __future__ import annotations
 
 import logging
 import os
-from typing import Callable
+from typing import Callable, Optional
 
 import yaml
 from pydantic import (
     BaseModel,
     Field,
+    PrivateAttr,
     ValidationError,
     field_serializer,
     field_validator,
     model_validator,
 )
 
+from heracles_agents.batch_inference import BatchConfig
 from heracles_agents.dsg_interfaces import DsgInterfaceConfigType
+from heracles_agents.experiment_checkpoint import CheckpointStore
+from heracles_agents.llm_cache import LlmCacheConfig
 from heracles_agents.llm_interface import AnalyzedQuestions, EvalQuestion, LlmAgent
+from heracles_agents.prompt import Prompt
+from heracles_agents.provider_budgets import ProviderBudgetConfig
+from heracles_agents.provider_retries import RetryPolicy
 from heracles_agents.pydantic_discriminated_dispatch import has_plum_generics
 
 logger = logging.getLogger(__name__)
@@ -33,6 +40,13 @@ class PipelineDescription(BaseModel):
     description: str
     phases: list[PipelinePhase]
     function: Callable[[ExperimentConfiguration], AnalyzedQuestions]
+    # Pipelines whose first LLM request doesn't depend on earlier requests can
+    # send it through a batch job (see batch_inference.py). `batch_prompt`
+    # builds the prompt of phase `batch_phase` for a question.
+    batch_phase: Optional[str] = None
+    batch_prompt: Optional[
+        Callable[[ExperimentConfiguration, EvalQuestion], Prompt]
+    ] = None
 
     def validate_agent_phases(self, experiment_configuration):
         phases_in_pipeline = [p.name for p in self.phases]
@@ -72,6 +86,19 @@ class ExperimentConfiguration(BaseModel):
     phases: dict[str, LlmAgent]
     dsg_interface: DsgInterfaceConfigType = Field(discriminator="dsg_interface_type")
     questions: list[EvalQuestion]
+    # Number of questions that the pipeline may evaluate concurrently
+    n_workers: int = Field(default=1, ge=1)
+    # Send the first turn of every question as one batch job
+    batch: Optional[BatchConfig] = None
+
+    # Optional record of already-completed questions (see experiment_checkpoint.py)
+    _checkpoint: Optional[CheckpointStore] = PrivateAttr(default=None)
+
+    def set_checkpoint(self, checkpoint):
+        self._checkpoint = checkpoint
+
+    def get_checkpoint(self):
+        return self._checkpoint
 
     @field_validator("questions", mode="before")
     @classmethod
@@ -133,6 +160,14 @@ class ExperimentConfiguration(BaseModel):
 class ExperimentDescription(BaseModel):
     metadata: dict
     configurations: dict[str, ExperimentConfiguration]
+    # Number of configurations that may run at the same time
+    max_parallel_configurations: int = Field(default=1, ge=1)
+    # Request limits shared by all configurations using the same provider / model
+    provider_budgets: list[ProviderBudgetConfig] = Field(default_factory=list)
+    # How failed LLM requests (rate limits, timeouts, ...) are retried
+    retry_policy: RetryPolicy = Field(default_factory=RetryPolicy)
+    # Optional record / replay cache for LLM responses
+    llm_cache: Optional[LlmCacheConfig] = None
 
 
 if __name__ == "__main__":
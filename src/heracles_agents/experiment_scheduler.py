@@ -0,0 +1,68 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from heracles_agents.experiment_checkpoint import CheckpointStore
+from heracles_agents.experiment_definition import (
+    ExperimentConfiguration,
+    ExperimentDescription,
+)
+from heracles_agents.llm_cache import LlmCacheRegistry
+from heracles_agents.llm_interface import AnalyzedExperiment, AnalyzedQuestions
+from heracles_agents.provider_budgets import ProviderBudgetRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def run_configuration(
+    configuration_name: str,
+    experiment_config: ExperimentConfiguration,
+    checkpoints: CheckpointStore = None,
+) -> AnalyzedQuestions:
+    logger.info(f"Testing configuration {configuration_name}")
+    if checkpoints is not None:
+        experiment_config.set_checkpoint(
+            checkpoints.for_configuration(configuration_name)
+        )
+    analyzed_questions = experiment_config.pipeline.function(experiment_config)
+    logger.info(f"Finished configuration {configuration_name}")
+    return analyzed_questions
+
+
+def run_experiment(
+    experiment: ExperimentDescription, checkpoints: CheckpointStore = None
+) -> AnalyzedExperiment:
+    """Run every configuration of an experiment.
+
+    Up to `experiment.max_parallel_configurations` configurations run at once.
+    Request concurrency and rate are not limited per configuration, but by the
+    experiment's `provider_budgets`, which are shared by every configuration
+    that talks to the same provider / model.
+    """
+    ProviderBudgetRegistry.configure(
+        experiment.provider_budgets, experiment.retry_policy
+    )
+    LlmCacheRegistry.configure(experiment.llm_cache)
+
+    configurations = experiment.configurations
+    n_parallel = max(
+        1, min(experiment.max_parallel_configurations, len(configurations))
+    )
+    if n_parallel == 1:
+        results = {
+            name: run_configuration(name, config, checkpoints)
+            for name, config in configurations.items()
+        }
+    else:
+        logger.info(
+            f"Running {len(configurations)} configurations, {n_parallel} at a time"
+        )
+        with ThreadPoolExecutor(max_workers=n_parallel) as executor:
+            futures = {
+                name: executor.submit(run_configuration, name, config, checkpoints)
+                for name, config in configurations.items()
+            }
+            results = {name: f.result() for name, f in futures.items()}
+
+    return AnalyzedExperiment(
+        experiment_configurations=results, metadata=experiment.metadata
+    )
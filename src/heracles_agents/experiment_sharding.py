@@ -0,0 +1,83 @@
+import hashlib
+import logging
+
+import yaml
+
+from heracles_agents.experiment_definition import ExperimentDescription
+from heracles_agents.llm_interface import AnalyzedExperiment, AnalyzedQuestions
+
+logger = logging.getLogger(__name__)
+
+
+def question_shard(uid: str | int, n_shards: int) -> int:
+    """Shard index of a question.
+
+    Uses a cryptographic hash of the uid rather than `hash()`, which is salted
+    per process, so that every process / host agrees on the assignment.
+    """
+    digest = hashlib.sha256(str(uid).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % n_shards
+
+
+def shard_experiment(
+    experiment: ExperimentDescription, shard_index: int, n_shards: int
+) -> ExperimentDescription:
+    """Return a copy of `experiment` that only contains the questions of one shard"""
+    if n_shards < 1:
+        raise ValueError(f"n_shards must be at least 1 (got {n_shards})")
+    if not 0 <= shard_index < n_shards:
+        raise ValueError(f"shard_index must be in [0, {n_shards}) (got {shard_index})")
+
+    configurations = {}
+    for name, config in experiment.configurations.items():
+        questions = [
+            q
+            for q in config.questions
+            if question_shard(q.uid, n_shards) == shard_index
+        ]
+        logger.info(
+            f"Shard {shard_index}/{n_shards} of {name}: {len(questions)} of {len(config.questions)} questions"
+        )
+        configurations[name] = config.model_copy(update={"questions": questions})
+
+    return experiment.model_copy(update={"configurations": configurations})
+
+
+def merge_shard_results(
+    experiment: ExperimentDescription, shard_results: list[AnalyzedExperiment]
+) -> AnalyzedExperiment:
+    """Reassemble the results of every shard of `experiment`.
+
+    Questions are put back in the order of the original experiment. Raises a
+    ValueError if any question is missing from all of the shard results.
+    """
+    results = {}
+    for name, config in experiment.configurations.items():
+        analyzed_by_uid = {}
+        for shard in shard_results:
+            if name not in shard.experiment_configurations:
+                continue
+            for aq in shard.experiment_configurations[name].analyzed_questions:
+                if aq.question.uid in analyzed_by_uid:
+                    logger.warning(
+                        f"Question {aq.question.uid} of {name} appears in multiple shards"
+                    )
+                analyzed_by_uid[aq.question.uid] = aq
+
+        missing = [q.uid for q in config.questions if q.uid not in analyzed_by_uid]
+        if len(missing) > 0:
+            raise ValueError(
+                f"Configuration {name} is missing results for {len(missing)} questions: {missing}"
+            )
+        results[name] = AnalyzedQuestions(
+            analyzed_questions=[analyzed_by_uid[q.uid] for q in config.questions]
+        )
+
+    return AnalyzedExperiment(
+        experiment_configurations=results, metadata=experiment.metadata
+    )
+
+
+def load_analyzed_experiment(path: str) -> AnalyzedExperiment:
+    with open(path, "r") as fo:
+        return AnalyzedExperiment.model_validate(yaml.safe_load(fo))
@@ -47,6 +47,9 @@ class AgentInfo(BaseModel):
     tools: dict[str, ToolDescription | StructuredToolDescription]
     tool_interface: str  # Openai vs. custom vs. ???
     max_iterations: int
+    # If set, tool results longer than this many tokens are summarized before
+    # they are added to the history (see `tool_result_shaping`)
+    tool_result_max_tokens: Optional[int] = Field(default=None, gt=0)
 
     @field_validator("tools", mode="before")
     @classmethod
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from typing import Literal
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class LlmCacheMiss(KeyError):
+    """Raised in replay mode when a request is not in the cache."""
+
+
+class LlmCacheConfig(BaseModel):
+    cache_dir: str
+    # record: always call the provider, and (over)write the cache
+    # replay: only read from the cache, fail on a miss (no network access)
+    # read_through: read from the cache, call the provider and record on a miss
+    mode: Literal["record", "replay", "read_through"] = "read_through"
+
+
+def to_canonical_json(value):
+    """Convert requests (which mix dicts and provider SDK objects) into plain json types"""
+    if isinstance(value, BaseModel):
+        return to_canonical_json(value.model_dump(mode="json", warnings=False))
+    if isinstance(value, dict):
+        return {str(k): to_canonical_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_canonical_json(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def make_request_key(provider, model_info, tools, response_format, messages):
+    """Hash that identifies an LLM request"""
+    request = {
+        "provider": provider,
+        "model_info": model_info,
+        "tools": tools,
+        "response_format": response_format,
+        "messages": messages,
+    }
+    canonical = json.dumps(
+        to_canonical_json(request), sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LlmResponseCache:
+    """On-disk cache of LLM responses, addressed by a hash of the request"""
+
+    def __init__(self, cache_dir: str, mode: str = "read_through"):
+        self.cache_dir = os.path.expandvars(cache_dir)
+        self.mode = mode
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        # Split into subdirectories so one directory doesn't hold every response
+        return os.path.join(self.cache_dir, key[:2], key + ".pkl")
+
+    def contains(self, key):
+        """True if `lookup` would return a response without calling the provider"""
+        return self.mode != "record" and os.path.exists(self._path(key))
+
+    def lookup(self, key):
+        """Return the cached response for `key`, or None if it should be requested"""
+        if self.mode == "record":
+            return None
+        path = self._path(key)
+        if os.path.exists(path):
+            logger.debug(f"LLM cache hit: {key}")
+            with open(path, "rb") as fo:
+                return pickle.load(fo)
+        if self.mode == "replay":
+            raise LlmCacheMiss(
+                f"LLM request {key} is not in the cache at {self.cache_dir} (replay mode)"
+            )
+        logger.debug(f"LLM cache miss: {key}")
+        return None
+
+    def store(self, key, response):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename, so that concurrent readers
+        # never see a partially written response
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fo:
+                pickle.dump(response, fo)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class LlmCacheRegistry:
+    """Process-wide LLM response cache used by every AgentContext (if configured)"""
+
+    cache = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, config: LlmCacheConfig | None):
+        with cls._lock:
+            if config is None:
+                cls.cache = None
+            else:
+                logger.info(f"Using LLM cache {config.cache_dir} in {config.mode} mode")
+                cls.cache = LlmResponseCache(config.cache_dir, config.mode)
+
+    @classmethod
+    def get_cache(cls):
+        return cls.cache
@@ -1,15 +1,15 @@
 # ruff: noqa: F811
+import asyncio
+import itertools
 import logging
 import time
 from typing import Literal, Optional, Union
 
-import boto3
-import openai
 from openai.types.responses.response_custom_tool_call import (
     ResponseCustomToolCall,
 )  # TODO: push this down into the provider integration
 from plum import dispatch
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field
 
 from heracles_agents.agent_functions import (
     call_function,
@@ -18,21 +18,28 @@ from heracles_agents.agent_functions import (
     extract_answer_tag,
     generate_prompt_for_agent,
     generate_update_for_history,
+    get_cache_usage,
     get_text_body,
     is_custom_tool_call,
     is_function_call,
     iterate_messages,
     make_tool_response,
 )
+from heracles_agents.batch_inference import BatchResponseRegistry
 from heracles_agents.llm_agent import LlmAgent
+from heracles_agents.llm_cache import LlmCacheRegistry, make_request_key
+from heracles_agents.provider_budgets import ProviderBudgetRegistry
+from heracles_agents.provider_retries import (
+    LlmRetriesExhausted,
+    classify_provider_error,
+)
+from heracles_agents.token_utils import get_token_encoder
+from heracles_agents.tool_interface import ToolResult
+from heracles_agents.tool_result_shaping import shape_tool_result
+from heracles_agents.tools.timeouts import ResourceUsage
 
 logger = logging.getLogger(__name__)
 
-BedrockRuntime = boto3.client("bedrock-runtime", "us-east-1")
-ThrottlingException = BedrockRuntime.exceptions.ThrottlingException
-ModelTimeoutException = BedrockRuntime.exceptions.ModelTimeoutException
-ServiceUnavailableException = BedrockRuntime.exceptions.ServiceUnavailableException
-
 
 class SldpComparison(BaseModel):
     comparison_type: Literal["SLDP"]
@@ -95,6 +102,30 @@ class AgentSequence(BaseModel):
     responses: list[AgentResponse]
 
 
+class DsgSubgraph(BaseModel):
+    """Question-relevant part of a scene graph, selected to fit a token budget"""
+
+    token_budget: int
+    n_tokens: int
+    # Semantic labels (or node ids) from the question that matched nodes
+    matched_labels: list[str]
+    objects: list[str]
+    places: list[str]
+    rooms: list[str]
+    # Whether the whole scene graph fit in the budget
+    complete: bool
+
+
+class ShapedToolResult(BaseModel):
+    """A tool result that was summarized before it was added to the agent's history"""
+
+    # Index of the tool call among the question's tool calls
+    tool_call: int
+    n_tokens: int
+    n_tokens_shown: int
+    full_result: str
+
+
 class QuestionAnalysis(BaseModel):
     # Information that is relevant about evaluating the response quality of the
     # "whole question"
@@ -104,6 +135,31 @@ class QuestionAnalysis(BaseModel):
     input_tokens: int
     output_tokens: int
     n_tool_calls: int
+    # Input tokens read from / written to the provider's prompt cache
+    cached_input_tokens: int = 0
+    cache_write_input_tokens: int = 0
+    # The part of the scene graph that was put in the prompt, if it was trimmed
+    # to a token budget
+    dsg_subgraph: Optional[DsgSubgraph] = None
+    # Resources used by every run of generated code, in order
+    code_executions: list[ResourceUsage] = Field(default_factory=list)
+    # Full results of the tool calls whose results were summarized in the history
+    shaped_tool_results: list[ShapedToolResult] = Field(default_factory=list)
+
+    @computed_field
+    @property
+    def code_wall_time_s(self) -> float:
+        return sum(u.wall_time_s for u in self.code_executions)
+
+    @computed_field
+    @property
+    def code_cpu_time_s(self) -> float:
+        return sum(u.cpu_time_s or 0.0 for u in self.code_executions)
+
+    @computed_field
+    @property
+    def code_peak_rss_mb(self) -> float:
+        return max((u.peak_rss_mb or 0.0 for u in self.code_executions), default=0.0)
 
 
 class AnalyzedQuestion(BaseModel):
@@ -209,6 +265,8 @@ def get_bedrock_block_summary(m):
             summary += f"{k}={v},"
         summary += ")"
         return summary
+    elif "cachePoint" in m:
+        return ""
     else:
         raise NotImplementedError(f"Don't know how to summarize: {m}")
 
@@ -261,6 +319,12 @@ class AgentContext:
         self.n_tool_calls = 0
         self.initial_input_tokens = 0
         self.total_output_tokens = 0
+        self.cached_input_tokens = 0
+        self.cache_write_input_tokens = 0
+        # Resources used by the tool calls that ran generated code
+        self.code_executions = []
+        # Tool results that were too long for the history, in full
+        self.shaped_tool_results = []
 
     def initialize_agent(self, prompt):
         self.history = generate_prompt_for_agent(prompt, self.agent)
@@ -268,8 +332,7 @@ class AgentContext:
 
         logger.info(f"Agent inintialized with: \n{get_summary_text(self.history)}")
 
-    def call_llm(self, history):
-        model_info = self.agent.model_info
+    def prepare_request(self, history):
         logger.debug(f"Calling llm with history: {history}")
 
         explicit_tools = generate_tools_for_agent(self.agent.agent_info)
@@ -278,65 +341,151 @@ class AgentContext:
         # Needs to align with prompt, most likely
         response_format = "text"
 
-        n_ratelimit_retries = 5
-        wait_time_s = 60
-        for idx in range(n_ratelimit_retries):
-            try:
-                response = self.agent.client.call(
-                    model_info, explicit_tools, response_format, history
-                )
-            except openai.RateLimitError as ex:
-                # TODO: each client should catch their own rate limit errors and then emit a shared single error type that we catch here
-                print(ex)
-                logging.warning(
-                    f"Hit OpenAI rate limit error. Waiting {wait_time_s} seconds. Will retry ({idx} / {n_ratelimit_retries}"
-                )
-                time.sleep(wait_time_s)
-                continue
-            except ThrottlingException as ex:
-                print(ex)
-                logging.warning(
-                    f"Hit Bedrock rate limit error. Waiting {wait_time_s} seconds. Will retry ({idx} / {n_ratelimit_retries}"
-                )
-                time.sleep(wait_time_s)
-                continue
-
-            except ModelTimeoutException as ex:
-                print(ex)
-                logging.warning(
-                    f"Bedrock model timeout. Waiting {wait_time_s} seconds. Will retry ({idx} / {n_ratelimit_retries}"
-                )
-                time.sleep(wait_time_s)
-                continue
+        # The key is only needed to find responses that were recorded earlier
+        key = None
+        if LlmCacheRegistry.get_cache() is not None or not (
+            BatchResponseRegistry.is_empty()
+        ):
+            key = self.request_key(explicit_tools, response_format, history)
+        return key, explicit_tools, response_format
+
+    def request_key(self, explicit_tools, response_format, history):
+        return make_request_key(
+            self.agent.client.client_type,
+            self.agent.model_info,
+            explicit_tools,
+            response_format,
+            history,
+        )
+
+    def lookup_response(self, key):
+        """Find a batch or cached response for the request, instead of calling the LLM"""
+        if key is None:
+            return None, False
+        response = BatchResponseRegistry.lookup(key)
+        if response is not None:
+            logger.debug(f"Using batch response for {key}")
+            return response, False
+        cache = LlmCacheRegistry.get_cache()
+        if cache is not None:
+            response = cache.lookup(key)
+        return response, response is not None
+
+    def store_response(self, key, response):
+        cache = LlmCacheRegistry.get_cache()
+        if cache is not None:
+            cache.store(key, response)
 
-            except ServiceUnavailableException as ex:
-                print(ex)
-                logging.warning(
-                    f"Bedrock service unavailable. Waiting {wait_time_s} seconds. Will retry ({idx} / {n_ratelimit_retries}"
-                )
-                time.sleep(wait_time_s)
-                continue
-
-            except openai.APITimeoutError as ex:
-                # TODO: each client should catch their own rate limit errors and then emit a shared single error type that we catch here
-                print(ex)
-                logging.warning(
-                    f"Hit OpenAI Timeout error. Waiting {wait_time_s} seconds. Will retry ({idx} / {n_ratelimit_retries}"
-                )
-                time.sleep(wait_time_s)
-                continue
-            except openai.APIStatusError as ex:
-                # TODO: each client should catch their own rate limit errors and then emit a shared single error type that we catch here
-                print(ex)
-                logging.warning(
-                    f"Hit OpenAI API error. Waiting {wait_time_s} seconds. Will retry ({idx} / {n_ratelimit_retries}"
-                )
-                time.sleep(wait_time_s)
-                continue
+    def call_llm(self, history):
+        model_info = self.agent.model_info
+        key, explicit_tools, response_format = self.prepare_request(history)
+        response, from_cache = self.lookup_response(key)
+        if from_cache:
+            return response
+        if response is None:
+            response = self.call_client(
+                model_info, explicit_tools, response_format, history
+            )
+        self.store_response(key, response)
+        return response
 
-            break
+    async def acall_llm(self, history):
+        model_info = self.agent.model_info
+        key, explicit_tools, response_format = self.prepare_request(history)
+        response, from_cache = self.lookup_response(key)
+        if from_cache:
+            return response
+        if response is None:
+            response = await self.acall_client(
+                model_info, explicit_tools, response_format, history
+            )
+        self.store_response(key, response)
         return response
 
+    def count_request_tokens(self, model_info, history):
+        """Input tokens of a request, if a provider budget limits tokens per minute"""
+        if not ProviderBudgetRegistry.tracks_tokens(
+            self.agent.client.client_type, model_info.model
+        ):
+            return 0
+        return count_message_tokens(self.agent, history)
+
+    def report_response_tokens(self, reservation, response):
+        if not any(b.tracks_tokens for b in reservation.budgets):
+            return
+        n_tokens = sum(
+            count_message_tokens(self.agent, m)
+            for m in iterate_messages(self.agent, response)
+        )
+        reservation.charge_tokens(n_tokens)
+
+    def get_retry_wait(self, ex, retry_index, model_info):
+        """Seconds to wait before retrying after `ex`, or None if it shouldn't be retried.
+
+        Raises LlmRetriesExhausted once the retry policy gives up.
+        """
+        error = classify_provider_error(ex)
+        if error is None:
+            return None
+        provider = self.agent.client.client_type
+        policy = ProviderBudgetRegistry.retry_policy
+        if retry_index >= policy.max_retries:
+            raise LlmRetriesExhausted(
+                provider, model_info.model, retry_index + 1, ex
+            ) from ex
+        wait_s = policy.backoff_s(retry_index, error.retry_after_s)
+        if error.is_rate_limit:
+            # Everyone sharing the budget backs off, not just this request
+            ProviderBudgetRegistry.pause(provider, model_info.model, wait_s)
+        logger.warning(
+            f"{error.description}: {ex}. Waiting {wait_s:.1f} seconds. "
+            f"Will retry ({retry_index + 1} / {policy.max_retries})"
+        )
+        return wait_s
+
+    def call_client(self, model_info, explicit_tools, response_format, history):
+        provider = self.agent.client.client_type
+        n_tokens = self.count_request_tokens(model_info, history)
+        for retry_index in itertools.count():
+            try:
+                with ProviderBudgetRegistry.reserve(
+                    provider, model_info.model, n_tokens
+                ) as reservation:
+                    response = self.agent.client.call(
+                        model_info, explicit_tools, response_format, history
+                    )
+                    self.report_response_tokens(reservation, response)
+                return response
+            except Exception as ex:
+                wait_s = self.get_retry_wait(ex, retry_index, model_info)
+                if wait_s is None:
+                    raise
+            time.sleep(wait_s)
+
+    async def acall_client(self, model_info, explicit_tools, response_format, history):
+        provider = self.agent.client.client_type
+        n_tokens = self.count_request_tokens(model_info, history)
+        for retry_index in itertools.count():
+            try:
+                async with ProviderBudgetRegistry.areserve(
+                    provider, model_info.model, n_tokens
+                ) as reservation:
+                    response = await self.agent.client.acall(
+                        model_info, explicit_tools, response_format, history
+                    )
+                    self.report_response_tokens(reservation, response)
+                return response
+            except Exception as ex:
+                wait_s = self.get_retry_wait(ex, retry_index, model_info)
+                if wait_s is None:
+                    raise
+            await asyncio.sleep(wait_s)
+
+    def record_cache_usage(self, response):
+        cache_read, cache_write = get_cache_usage(self.agent, response)
+        self.cached_input_tokens += cache_read
+        self.cache_write_input_tokens += cache_write
+
     def handle_response(self, response):
         executed_tool_calls = []
         logger.debug(f"Handling response: {response}")
@@ -352,13 +501,41 @@ class AgentContext:
             self.n_tool_calls += 1
 
             result = call_function(self.agent, message)
+            if isinstance(result, ToolResult):
+                if result.resource_usage is not None:
+                    self.code_executions.append(result.resource_usage)
+                result = result.value
             logger.debug(f"function_result: {result}")
+            result = self.shape_tool_result(result)
             tool_response = make_tool_response(self.agent, message, result)
             logger.debug(f"Tool response: {result}")
             executed_tool_calls.append(tool_response)
 
         return executed_tool_calls
 
+    def shape_tool_result(self, result):
+        """The result as it is added to the history, within the agent's tool result token budget"""
+        max_tokens = self.agent.agent_info.tool_result_max_tokens
+        if max_tokens is None:
+            return result
+        text, n_tokens_shown, n_tokens = shape_tool_result(
+            result, get_token_encoder(self.agent.model_info.model), max_tokens
+        )
+        if n_tokens <= max_tokens:
+            return result
+        logger.info(
+            f"Summarized a tool result of {n_tokens} tokens in {n_tokens_shown} tokens"
+        )
+        self.shaped_tool_results.append(
+            ShapedToolResult(
+                tool_call=self.n_tool_calls - 1,
+                n_tokens=n_tokens,
+                n_tokens_shown=n_tokens_shown,
+                full_result=str(result),
+            )
+        )
+        return text
+
     def update_history(self, response):
         logger.info(f"History update: \n{get_summary_text(response)}")
         update = generate_update_for_history(self.agent, response)
@@ -374,9 +551,9 @@ class AgentContext:
 
     def step(self):
         logger.debug("Agent stepping")
-        # TODO: Handle timeout and RateLimit errors
         response = self.call_llm(self.history)
         logger.debug(f"Got response: {response}")
+        self.record_cache_usage(response)
         update = self.handle_response(response)
         logger.debug(f"Tool update: {update}")
         self.update_history(response)
@@ -384,6 +561,20 @@ class AgentContext:
         done = self.check_if_done(self.history, response, update)
         return done
 
+    async def astep(self):
+        logger.debug("Agent stepping")
+        response = await self.acall_llm(self.history)
+        logger.debug(f"Got response: {response}")
+        self.record_cache_usage(response)
+        # Tools are ordinary blocking functions (database queries, generated
+        # code), so they run in a worker thread instead of on the event loop
+        update = await asyncio.to_thread(self.handle_response, response)
+        logger.debug(f"Tool update: {update}")
+        self.update_history(response)
+        self.update_history(update)
+        done = self.check_if_done(self.history, response, update)
+        return done
+
     def get_agent_responses(self):
         # TODO: parse the LLM responses into a more useful representation in "parsed_response"
         responses = [
@@ -395,10 +586,22 @@ class AgentContext:
         return responses
 
     def run(self):
+        done = False
         for i in range(self.agent.agent_info.max_iterations):
             done = self.step()
             if done:
                 break
+        return self.finish(done)
+
+    async def arun(self):
+        done = False
+        for i in range(self.agent.agent_info.max_iterations):
+            done = await self.astep()
+            if done:
+                break
+        return self.finish(done)
+
+    def finish(self, done):
         if done:
             answer = process_answer(self.agent, self.history[-1])
         else:
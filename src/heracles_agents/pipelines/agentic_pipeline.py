@@ -1,5 +1,6 @@
 import copy
 import logging
+from functools import partial
 
 from heracles_agents.experiment_definition import (
     PipelineDescription,
@@ -10,13 +11,16 @@ from heracles_agents.llm_interface import (
     AgentContext,
     AgentSequence,
     AnalyzedQuestion,
-    AnalyzedQuestions,
     EvalQuestion,
     LlmAgent,
     QuestionAnalysis,
 )
 from heracles_agents.pipelines.comparisons import evaluate_answer
 from heracles_agents.pipelines.prompt_utils import get_answer_formatting_guidance
+from heracles_agents.pipelines.question_executor import (
+    INFRASTRUCTURE_ERRORS,
+    run_questions,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -52,66 +56,72 @@ def generate_prompt(
     return prompt
 
 
+def analyze_question(exp, question: EvalQuestion, api_string: str = None):
+    answer = None
+    sequences = []
+    try:
+        logger.info(f"\n=======================\nQuestion: {question.question}\n")
+        cxt = AgentContext(exp.phases["main"])
+
+        prompt = generate_prompt(question, exp.phases["main"], api_prompt=api_string)
+        logger.info(f"\nLLM Prompt: {prompt}\n")
+
+        cxt.initialize_agent(prompt)
+        success, answer = cxt.run()
+        logger.info(f"\nLLM Answer: {answer}\n")
+
+        agent_sequence = AgentSequence(
+            description="cypher-agent", responses=cxt.get_agent_responses()
+        )
+        sequences = [agent_sequence]
+
+        valid_format, correct = evaluate_answer(
+            question.correctness_comparator, answer, question.solution
+        )
+
+        logger.info(f"\n\nCorrect? {correct}\n\n")
+
+        analysis = QuestionAnalysis(
+            correct=correct,
+            valid_answer_format=valid_format,
+            input_tokens=cxt.initial_input_tokens,
+            output_tokens=cxt.total_output_tokens,
+            n_tool_calls=cxt.n_tool_calls,
+            cached_input_tokens=cxt.cached_input_tokens,
+            cache_write_input_tokens=cxt.cache_write_input_tokens,
+            code_executions=cxt.code_executions,
+            shaped_tool_results=cxt.shaped_tool_results,
+        )
+
+    except INFRASTRUCTURE_ERRORS:
+        # Not the question's fault, it is asked again when the run is resumed
+        raise
+    except Exception as ex:
+        print(ex)
+        logger.error("Bad Question!")
+        logger.error(str(ex))
+        analysis = QuestionAnalysis(
+            correct=False,
+            valid_answer_format=False,
+            input_tokens=0,
+            output_tokens=0,
+            n_tool_calls=0,
+        )
+
+    return AnalyzedQuestion(
+        question=question,
+        answer=answer,
+        sequences=sequences,
+        analysis=analysis,
+    )
+
+
 def agentic_pipeline(exp):
-    analyzed_questions = []
     api_string = None
     if exp.dsg_interface.dsg_interface_type == "python":
         api_string = exp.dsg_interface.get_dsg_api_prompt()
 
-    for question in exp.questions:
-        try:
-            logger.info(f"\n=======================\nQuestion: {question.question}\n")
-            cxt = AgentContext(exp.phases["main"])
-
-            prompt = generate_prompt(
-                question, exp.phases["main"], api_prompt=api_string
-            )
-            logger.info(f"\nLLM Prompt: {prompt}\n")
-
-            cxt.initialize_agent(prompt)
-            success, answer = cxt.run()
-            logger.info(f"\nLLM Answer: {answer}\n")
-
-            agent_sequence = AgentSequence(
-                description="cypher-agent", responses=cxt.get_agent_responses()
-            )
-
-            valid_format, correct = evaluate_answer(
-                question.correctness_comparator, answer, question.solution
-            )
-
-            logger.info(f"\n\nCorrect? {correct}\n\n")
-
-            analysis = QuestionAnalysis(
-                correct=correct,
-                valid_answer_format=valid_format,
-                input_tokens=cxt.initial_input_tokens,
-                output_tokens=cxt.total_output_tokens,
-                n_tool_calls=cxt.n_tool_calls,
-            )
-
-        except Exception as ex:
-            print(ex)
-            logger.error("Bad Question!")
-            logger.error(str(ex))
-            analysis = QuestionAnalysis(
-                correct=False,
-                valid_answer_format=False,
-                input_tokens=0,
-                output_tokens=0,
-                n_tool_calls=0,
-            )
-
-        aq = AnalyzedQuestion(
-            question=question,
-            answer=answer,
-            sequences=[agent_sequence],
-            analysis=analysis,
-        )
-        analyzed_questions.append(aq)
-
-    aqs = AnalyzedQuestions(analyzed_questions=analyzed_questions)
-    return aqs
+    return run_questions(exp, partial(analyze_question, exp, api_string=api_string))
 
 
 main_phase = PipelinePhase(
@@ -1,33 +1,121 @@
+import functools
 import logging
 import math
-from typing import Any, Dict
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 
 import spark_dsg
 import yaml
-
-from heracles_agents.tools.timeouts import FunctionTimeoutError, run_with_timeout
+from pydantic import Field
+
+from heracles_agents.pipelines.dsg_arrays import DsgArraysRegistry
+from heracles_agents.pipelines.dsg_hierarchy import mark_dsg_changed
+from heracles_agents.pipelines.dsg_queries import dsg_query
+from heracles_agents.pipelines.dsg_snapshot import (
+    DsgSnapshotCache,
+    file_sha256,
+    snapshots_enabled,
+)
+from heracles_agents.pipelines.generated_code_cache import (
+    CodeResultCache,
+    CompiledCodeCache,
+    code_hash,
+    is_deterministic,
+)
+from heracles_agents.tools.timeouts import (
+    FunctionTimeoutError,
+    ResourceLimits,
+    ResourceUsage,
+    SandboxPool,
+)
 
 logger = logging.getLogger(__name__)
 
-dsg_cache = {}
+
+def file_stamp(path):
+    """Path, modification time and size of a file, which change when the file is replaced or edited"""
+    stat = os.stat(path)
+    return (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=64)
+def _stamped_sha256(stamp):
+    return file_sha256(stamp[0])
+
+
+def file_content_hash(path):
+    """sha256 of a file, only hashed again when its `file_stamp` changes"""
+    return _stamped_sha256(file_stamp(path))
 
 
-def load_dsg(dsg_filepath, label_path=None):
+class DsgLoadCache:
+    """Scene graphs loaded by `load_dsg`, shared by everything that loads the same files.
+
+    Entries are keyed by the scene graph and label files, including their
+    modification times, so a file that changed on disk is loaded again. Only
+    the most recently used scene graphs are kept.
+
+    If `snapshots_enabled`, the node arrays of a loaded scene graph are read
+    from (and on first load, saved to) a snapshot of the file, see `dsg_snapshot`.
+    """
+
+    max_entries = 4
+    # (scene graph file stamp, label file stamp) -> scene graph
+    graphs = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, dsg_filepath, label_path=None):
+        key = (file_stamp(dsg_filepath), file_stamp(label_path) if label_path else None)
+        # Loading while holding the lock means that configurations loading the
+        # same scene graph concurrently wait for the first load
+        with cls._lock:
+            G = cls.graphs.get(key)
+            if G is not None:
+                logger.info(
+                    f"Found {dsg_filepath} already loaded! Using cached version"
+                )
+                cls.graphs.move_to_end(key)
+                return G
+            G = read_dsg(dsg_filepath, label_path)
+            if snapshots_enabled():
+                DsgArraysRegistry.attach(G, DsgSnapshotCache.get(dsg_filepath, G))
+            cls.graphs[key] = G
+            while len(cls.graphs) > cls.max_entries:
+                cls.graphs.popitem(last=False)
+            return G
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.graphs.clear()
+
+
+def load_dsg(dsg_filepath, label_path=None, mutable=False):
     """
     Loads a Spark Dynamic Scene Graph (DSG) from the specified file path and optionally augments it with label metadata.
+    Each scene graph is only read from disk once (see `DsgLoadCache`).
     Args:
         dsg_filepath (str or Path): Path to the DSG file to load.
         label_path (str or Path, optional): Path to a YAML file containing label definitions. If provided, label metadata
             will be added to the DSG's metadata.
+        mutable (bool, optional): If False, the returned DSG is shared with every other caller that loads the same files,
+            and must not be modified (nothing prevents it, so anything that may modify the DSG, like generated code,
+            has to ask for a copy). If True, the returned DSG is a copy that the caller may modify.
     Returns:
         DynamicSceneGraph: The loaded DSG object, potentially augmented with label and layer metadata.
     """
-    if dsg_filepath in dsg_cache:
-        print(f"\n\n Found {dsg_filepath} already loaded! Using cached version\n\n")
-        logger.info(
-            f"\n\n Found {dsg_filepath} already loaded! Using cached version\n\n"
-        )
-        return dsg_cache[dsg_filepath]
+    G = DsgLoadCache.get(dsg_filepath, label_path)
+    if mutable:
+        return G.clone()
+    return G
+
+
+def read_dsg(dsg_filepath, label_path=None):
+    """Load a DSG from disk, without caching (see `load_dsg`)"""
     G = spark_dsg.DynamicSceneGraph.load(dsg_filepath)
     logger.info(f"DSG loaded from {dsg_filepath}")
 
@@ -82,7 +170,7 @@ def load_dsg(dsg_filepath, label_path=None):
         G.metadata.add({"LayerIdToLayerStr": layers})
         logger.info(f"Labels loaded from {label_path}")
 
-    # dsg_cache[dsg_filepath] = G # TODO: can enalbe when we don't worry about mutating DSG
+    mark_dsg_changed(G)
     return G
 
 
@@ -257,13 +345,78 @@ def format_callable_api(
     return "\n".join(parts)
 
 
-def execute_generated_code_timed(python_code: str, scene_graph):
+class CodeExecutionLimits(ResourceLimits):
+    """Limits on running generated code (see `execute_generated_code_timed`)"""
+
+    # Characters of the result's text that are returned; the rest is cut off
+    max_output_chars: Optional[int] = Field(default=None, gt=0)
+
+
+def execute_generated_code_timed(python_code: str, dsg_interface):
+    """`execute_generated_code` on the interface's scene graph, in a sandbox worker.
+
+    Only the interface's configuration is sent to the worker, which loads the
+    scene graph once and keeps it for later code. Every run gets its own copy
+    of it (unless the interface sets `share_dsg`), so code that modifies the
+    scene graph doesn't change what later code sees. The code runs within the interface's `code_execution_limits`.
+
+    Returns whether the code succeeded, its result and the `ResourceUsage` of
+    running it. Deterministic code (see `is_deterministic`) that already ran
+    successfully on a copy of the same scene graph isn't run again, its usage
+    is marked as a cache hit instead.
+    """
+    limits = dsg_interface.code_execution_limits
+    key = None
+    if (
+        dsg_interface.cache_code_results
+        and not dsg_interface.share_dsg
+        and is_deterministic(python_code)
+    ):
+        start = time.perf_counter()
+        # The output limit is applied in the worker, so it is part of the result
+        key = (
+            code_hash(python_code),
+            dsg_interface.get_dsg_hash(),
+            limits.max_output_chars,
+        )
+        found, result = CodeResultCache.get(key)
+        if found:
+            logger.info("Generated code already ran, using its cached result")
+            usage = ResourceUsage(
+                wall_time_s=time.perf_counter() - start, cache_hit=True
+            )
+            return True, result, usage
     try:
-        return run_with_timeout(
-            execute_generated_code, args=(python_code, scene_graph), timeout=60
+        (success, result), usage = SandboxPool.shared().run_measured(
+            execute_generated_code_on_interface,
+            args=(python_code, dsg_interface),
+            timeout=limits.timeout_s,
+            limits=limits,
         )
     except FunctionTimeoutError:
-        return "Your code timed out. In 60 seconds."
+        usage = ResourceUsage(wall_time_s=limits.timeout_s, timed_out=True)
+        return False, f"Your code timed out. In {limits.timeout_s:g} seconds.", usage
+    if success and key is not None:
+        CodeResultCache.put(key, result)
+    return success, result, usage
+
+
+def execute_generated_code_on_interface(python_code: str, dsg_interface):
+    scene_graph = dsg_interface.get_dsg()
+    if not dsg_interface.share_dsg:
+        # The loaded scene graph is kept for the worker's later jobs
+        scene_graph = scene_graph.clone()
+    success, result = execute_generated_code(python_code, scene_graph)
+    max_chars = dsg_interface.code_execution_limits.max_output_chars
+    if max_chars is not None:
+        text = str(result)
+        if len(text) > max_chars:
+            # Cut off in the worker, so that a huge result isn't sent back
+            result = (
+                f"{text[:max_chars]}... (output cut off after {max_chars} of "
+                f"{len(text)} characters)"
+            )
+    return success, result
 
 
 def execute_generated_code(python_code: str, scene_graph: spark_dsg.DynamicSceneGraph):
@@ -281,10 +434,11 @@ def execute_generated_code(python_code: str, scene_graph: spark_dsg.DynamicScene
         exec_globals = {
             "spark_dsg": spark_dsg,
             "math": math,
-        }  # make spark dsg and math available inside the execution blcok
+            "dsg_query": dsg_query,
+        }  # make spark dsg, math and the query helpers available inside the execution blcok
 
         # Execute the code, which defines the 'solve_task' function in the local scope (generated code)
-        exec(python_code, exec_globals, local_scope)
+        exec(CompiledCodeCache.get(python_code), exec_globals, local_scope)
         solve_task_func = local_scope.get("solve_task")
         if callable(solve_task_func):
             logger.info("Executing function 'solve_task'...")
@@ -295,6 +449,9 @@ def execute_generated_code(python_code: str, scene_graph: spark_dsg.DynamicScene
             logger.info("'solve_task' function not found in the generated code.")
             return False, "'solve_task' function not found in the generated code."
 
+    except MemoryError:
+        logger.info("Generated code ran out of memory")
+        return False, "Your code ran out of memory."
     except Exception as e:
         logger.info(f"Error executing generated code: {e}", exc_info=True)
         return False, str(e)
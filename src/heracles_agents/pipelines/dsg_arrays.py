@@ -0,0 +1,159 @@
+"""Node ids, positions and semantic labels of scene graph layers as NumPy arrays.
+
+Reading an attribute of a spark_dsg node goes through pybind, which dominates
+the cost of encoding large graphs one node at a time. `LayerArrays` reads
+every node of a layer once, and `DsgArraysRegistry` shares the arrays between
+the in-context encoders and tools (e.g. spatial queries) that read the same
+scene graph. A scene graph loaded from a file with a snapshot (see
+`dsg_snapshot`) gets its arrays from the snapshot instead.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import spark_dsg
+
+from heracles_agents.pipelines.dsg_hierarchy import dsg_version
+
+# A spark_dsg node id keeps its symbol's category character in the top byte
+SYMBOL_INDEX_BITS = 56
+SYMBOL_INDEX_MASK = (1 << SYMBOL_INDEX_BITS) - 1
+
+
+def node_symbols(node_ids):
+    """`spark_dsg.NodeSymbol(node_id).str(True)` of every node id"""
+    symbols = []
+    for node_id in node_ids:
+        category = chr(node_id >> SYMBOL_INDEX_BITS)
+        if category.isascii() and category.isalpha():
+            symbols.append(f"{category}{node_id & SYMBOL_INDEX_MASK}")
+        else:
+            symbols.append(spark_dsg.NodeSymbol(node_id).str(True))
+    return symbols
+
+
+class LayerArrays:
+    """Ids, positions and semantic labels of the nodes of one layer, in layer order.
+
+    `ids` is an (n,) uint64 array, `positions` an (n, 3) float array and
+    `labels` an (n,) int array, or None if the layer's nodes have no semantic
+    labels.
+    """
+
+    def __init__(self, ids, positions, labels=None):
+        self.ids = ids
+        self.positions = positions
+        self.labels = labels
+        self._rows = None
+
+    @classmethod
+    def from_layer(cls, scene_graph, layer):
+        nodes = scene_graph.get_layer(layer)
+        n_nodes = nodes.num_nodes()
+        ids = np.empty(n_nodes, dtype=np.uint64)
+        positions = np.empty((n_nodes, 3))
+        labels = np.empty(n_nodes, dtype=np.int64)
+        for row, node in enumerate(nodes.nodes):
+            attrs = node.attributes
+            if row == 0 and not hasattr(attrs, "semantic_label"):
+                labels = None
+            ids[row] = node.id.value
+            positions[row] = attrs.position
+            if labels is not None:
+                labels[row] = attrs.semantic_label
+        return cls(ids, positions, labels)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, node_id):
+        """Row of a node in the arrays, or None if it isn't in the layer"""
+        if self._rows is None:
+            self._rows = {node_id: row for row, node_id in enumerate(self.ids.tolist())}
+        return self._rows.get(node_id)
+
+    def __getitem__(self, rows):
+        """The arrays of only some rows (a slice, mask or row indices)"""
+        return LayerArrays(
+            self.ids[rows],
+            self.positions[rows],
+            None if self.labels is None else self.labels[rows],
+        )
+
+    def select(self, node_ids=None):
+        """The arrays of only the nodes in `node_ids`, still in layer order"""
+        if node_ids is None:
+            return self
+        return self[np.isin(self.ids, np.fromiter(node_ids, dtype=np.uint64))]
+
+
+class DsgArraysRegistry:
+    """Layer arrays shared by everything that reads the same scene graph.
+
+    Arrays are rebuilt when their scene graph's version changes. Only the most
+    recently used ones are kept.
+    """
+
+    max_entries = 16
+    # (id(scene_graph), layer) -> (scene_graph, version, arrays). Holding on to
+    # the scene graph keeps its id from being reused by another graph.
+    arrays = OrderedDict()
+    # id(scene_graph) -> (scene_graph, version, snapshot) of scene graphs loaded
+    # from a file, with their version when the snapshot was attached
+    snapshots = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def attach(cls, scene_graph, snapshot):
+        """Read the scene graph's arrays from a snapshot of it, until the scene graph changes"""
+        version = dsg_version(scene_graph)
+        if tuple(snapshot.version) != version[1:]:
+            return
+        with cls._lock:
+            cls.snapshots[id(scene_graph)] = (scene_graph, version, snapshot)
+            cls.snapshots.move_to_end(id(scene_graph))
+            while len(cls.snapshots) > cls.max_entries:
+                cls.snapshots.popitem(last=False)
+
+    @classmethod
+    def _from_snapshot(cls, scene_graph, layer, version):
+        entry = cls.snapshots.get(id(scene_graph))
+        if entry is None or entry[0] is not scene_graph or entry[1] != version:
+            return None
+        try:
+            return entry[2].layer_arrays(layer)
+        except KeyError:
+            return None
+
+    @classmethod
+    def get(cls, scene_graph, layer) -> LayerArrays:
+        key = (id(scene_graph), layer)
+        with cls._lock:
+            version = dsg_version(scene_graph)
+            entry = cls.arrays.get(key)
+            if entry is not None and entry[0] is scene_graph and entry[1] == version:
+                cls.arrays.move_to_end(key)
+                return entry[2]
+            arrays = cls._from_snapshot(scene_graph, layer, version)
+            if arrays is None:
+                arrays = LayerArrays.from_layer(scene_graph, layer)
+            cls.arrays[key] = (scene_graph, version, arrays)
+            cls.arrays.move_to_end(key)
+            while len(cls.arrays) > cls.max_entries:
+                cls.arrays.popitem(last=False)
+            return arrays
+
+    @classmethod
+    def invalidate(cls, scene_graph):
+        """Forget everything about a scene graph, e.g. after changing its attributes in place"""
+        with cls._lock:
+            for key in [k for k in cls.arrays if k[0] == id(scene_graph)]:
+                del cls.arrays[key]
+            cls.snapshots.pop(id(scene_graph), None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.arrays.clear()
+            cls.snapshots.clear()
@@ -0,0 +1,175 @@
+"""Object -> place -> room hierarchy of a scene graph, indexed in one pass.
+
+The in-context encoders and tools that answer containment questions ("which
+room is this object in", "what is in this room") share one index per scene
+graph through `DsgHierarchyRegistry`, instead of walking parents with a
+`get_node` lookup per hop for every object.
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+
+import spark_dsg
+
+_generations = itertools.count(1)
+_generation_lock = threading.Lock()
+
+
+def mark_dsg_changed(scene_graph):
+    """Give a scene graph a new generation, so that everything derived from it is rebuilt.
+
+    Whatever changes a scene graph in place (moving or relabeling nodes, or
+    replacing them) calls this, since `dsg_version` can't see such changes.
+    """
+    with _generation_lock:
+        scene_graph._heracles_generation = next(_generations)
+
+
+def dsg_version(scene_graph):
+    """Cheap stamp of a scene graph's contents.
+
+    The generation is unique to the scene graph object, so a graph that reuses
+    another one's id doesn't match, and changes with `mark_dsg_changed`. The
+    node and edge counts catch nodes and edges that were added or removed
+    without marking the scene graph as changed.
+    """
+    generation = getattr(scene_graph, "_heracles_generation", None)
+    if generation is None:
+        with _generation_lock:
+            if getattr(scene_graph, "_heracles_generation", None) is None:
+                scene_graph._heracles_generation = next(_generations)
+        generation = scene_graph._heracles_generation
+    return (generation, scene_graph.num_nodes(), scene_graph.num_edges())
+
+
+def _unique(node_ids):
+    # dict keeps the first occurrence order, so sets built from the result have
+    # the same iteration order as sets built from `node_ids` directly
+    return tuple(dict.fromkeys(node_ids))
+
+
+class DsgHierarchyIndex:
+    """Parents, children and siblings of the objects, places and rooms of a scene graph.
+
+    Node ids are the integer ids of spark_dsg nodes, and every sequence keeps
+    the order that spark_dsg returns the parents or siblings in.
+    """
+
+    def __init__(self, scene_graph, place_layer_name=None):
+        self.version = dsg_version(scene_graph)
+        self.place_layer_name = place_layer_name
+        self.object_places = {}
+        self.place_rooms = {}
+        self.siblings = {}
+
+        for node in scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes:
+            self.object_places[node.id.value] = tuple(node.parents())
+        if place_layer_name is not None:
+            for node in scene_graph.get_layer(place_layer_name).nodes:
+                self._add_place(node)
+        # Objects may also hang off places outside of the named place layer
+        for places in self.object_places.values():
+            for place_id in places:
+                if place_id not in self.place_rooms:
+                    self._add_place(scene_graph.get_node(place_id))
+        for node in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes:
+            self.siblings[node.id.value] = tuple(node.siblings())
+
+        self.object_rooms = {
+            object_id: _unique(
+                room_id for place_id in places for room_id in self.place_rooms[place_id]
+            )
+            for object_id, places in self.object_places.items()
+        }
+
+        self.place_objects = {}
+        for object_id, places in self.object_places.items():
+            for place_id in places:
+                self.place_objects.setdefault(place_id, []).append(object_id)
+        self.room_objects = {}
+        for object_id, rooms in self.object_rooms.items():
+            for room_id in rooms:
+                self.room_objects.setdefault(room_id, []).append(object_id)
+        self.room_places = {}
+        for place_id, rooms in self.place_rooms.items():
+            for room_id in rooms:
+                self.room_places.setdefault(room_id, []).append(place_id)
+
+    def _add_place(self, node):
+        self.place_rooms[node.id.value] = tuple(node.parents())
+        self.siblings[node.id.value] = tuple(node.siblings())
+
+    def places_of_object(self, object_id):
+        return self.object_places.get(object_id, ())
+
+    def rooms_of_object(self, object_id):
+        return self.object_rooms.get(object_id, ())
+
+    def rooms_of_place(self, place_id):
+        return self.place_rooms.get(place_id, ())
+
+    def siblings_of(self, node_id):
+        return self.siblings.get(node_id, ())
+
+    def objects_in_place(self, place_id):
+        return tuple(self.place_objects.get(place_id, ()))
+
+    def objects_in_room(self, room_id):
+        return tuple(self.room_objects.get(room_id, ()))
+
+    def places_in_room(self, room_id):
+        return tuple(self.room_places.get(room_id, ()))
+
+
+class DsgHierarchyRegistry:
+    """Hierarchy indices shared by everything that reads the same scene graph.
+
+    An index is rebuilt when its scene graph's version changes. Only the most
+    recently used indices are kept.
+    """
+
+    max_entries = 8
+    # (id(scene_graph), place_layer_name) -> (scene_graph, index). Holding on to
+    # the scene graph keeps its id from being reused by another graph.
+    indices = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, scene_graph, place_layer_name=None) -> DsgHierarchyIndex:
+        key = (id(scene_graph), place_layer_name)
+        # Building while holding the lock means that concurrent questions wait
+        # for the first index instead of all building their own
+        with cls._lock:
+            version = dsg_version(scene_graph)
+            candidates = [key]
+            if place_layer_name is None:
+                # Indices that include a place layer cover everything else too
+                candidates += [k for k in cls.indices if k[0] == key[0]]
+            for k in candidates:
+                entry = cls.indices.get(k)
+                if (
+                    entry is not None
+                    and entry[0] is scene_graph
+                    and entry[1].version == version
+                ):
+                    cls.indices.move_to_end(k)
+                    return entry[1]
+            index = DsgHierarchyIndex(scene_graph, place_layer_name)
+            cls.indices[key] = (scene_graph, index)
+            cls.indices.move_to_end(key)
+            while len(cls.indices) > cls.max_entries:
+                cls.indices.popitem(last=False)
+            return index
+
+    @classmethod
+    def invalidate(cls, scene_graph):
+        """Forget everything about a scene graph, e.g. after changing its attributes in place"""
+        with cls._lock:
+            for key in [k for k in cls.indices if k[0] == id(scene_graph)]:
+                del cls.indices[key]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.indices.clear()
@@ -0,0 +1,364 @@
+"""Spatial and semantic queries on a scene graph, for generated code.
+
+Generated code that answers "what is the closest X to Y" or "how many X are
+in room R" would otherwise loop over `G.get_layer(...).nodes` in Python,
+reading every node through pybind for every reference node. `DsgQuery` reads
+the ids, positions and labels of a layer once (from `DsgArraysRegistry`),
+and answers nearest neighbour and radius queries from a KD-tree built once
+per layer and label. Room membership comes from the `DsgHierarchyRegistry`
+index. `execute_generated_code` makes `dsg_query(G)` available to the code
+it runs, and `DsgQueryRegistry` shares one `DsgQuery` per scene graph between
+programs.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import spark_dsg
+
+from heracles_agents.pipelines.dsg_arrays import DsgArraysRegistry
+from heracles_agents.pipelines.dsg_hierarchy import DsgHierarchyRegistry, dsg_version
+
+
+class KDTree:
+    """KD-tree over an (n, d) array of points, for nearest neighbour and radius queries.
+
+    Nodes split the widest dimension of their points at the median, down to
+    leaves of at most `leaf_size` points whose distances are computed in bulk.
+    Queries return rows of `points`, closest first (ties by row).
+    """
+
+    leaf_size = 32
+
+    def __init__(self, points, leaf_size=None):
+        if leaf_size is not None:
+            self.leaf_size = leaf_size
+        self.points = np.asarray(points, dtype=float)
+        # Rows of the points, reordered so that every node covers a contiguous range
+        self.order = np.arange(len(self.points))
+        # Per node: range of `order`, split dimension (-1 for leaves), children
+        # and bounding box of its points
+        self.ranges = []
+        self.split_dims = []
+        self.children = []
+        self.box_min = []
+        self.box_max = []
+        if len(self.points) > 0:
+            self._build(0, len(self.points))
+
+    def _build(self, start, end):
+        node = len(self.ranges)
+        rows = self.order[start:end]
+        points = self.points[rows]
+        box_min, box_max = points.min(axis=0), points.max(axis=0)
+        self.ranges.append((start, end))
+        self.split_dims.append(-1)
+        self.children.append(None)
+        self.box_min.append(box_min)
+        self.box_max.append(box_max)
+
+        dim = int(np.argmax(box_max - box_min))
+        # Leaves are small, or all of their points are at the same position
+        if end - start <= self.leaf_size or box_max[dim] == box_min[dim]:
+            return node
+        mid = (start + end) // 2
+        self.order[start:end] = rows[
+            np.argpartition(points[:, dim], mid - start, kind="introselect")
+        ]
+        self.split_dims[node] = dim
+        self.children[node] = (self._build(start, mid), self._build(mid, end))
+        return node
+
+    def __len__(self):
+        return len(self.points)
+
+    def _box_distance2(self, node, point):
+        """Squared distance from `point` to the bounding box of a node"""
+        gap = np.maximum(self.box_min[node] - point, 0) + np.maximum(
+            point - self.box_max[node], 0
+        )
+        return float(gap @ gap)
+
+    def _leaf_distances2(self, node, point):
+        start, end = self.ranges[node]
+        rows = self.order[start:end]
+        offsets = self.points[rows] - point
+        return rows, np.einsum("ij,ij->i", offsets, offsets)
+
+    def query(self, point, k=1):
+        """Distances and rows of the `k` points closest to `point`"""
+        point = np.asarray(point, dtype=float)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_d2 = np.empty(0)
+        if len(self) == 0 or k <= 0:
+            return best_d2, best_rows
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if len(best_d2) == k and self._box_distance2(node, point) > best_d2[-1]:
+                continue
+            children = self.children[node]
+            if children is None:
+                rows, d2 = self._leaf_distances2(node, point)
+                rows = np.concatenate([best_rows, rows])
+                d2 = np.concatenate([best_d2, d2])
+                keep = np.lexsort((rows, d2))[:k]
+                best_rows, best_d2 = rows[keep], d2[keep]
+                continue
+            near, far = children
+            dim = self.split_dims[node]
+            if point[dim] >= self.box_min[far][dim]:
+                near, far = far, near
+            # The nearer child is searched first, so that it prunes the other
+            stack.append(far)
+            stack.append(near)
+        return np.sqrt(best_d2), best_rows
+
+    def query_radius(self, point, radius):
+        """Distances and rows of the points within `radius` of `point`"""
+        point = np.asarray(point, dtype=float)
+        radius2 = float(radius) ** 2
+        found_rows, found_d2 = [], []
+        stack = [0] if len(self) > 0 else []
+        while stack:
+            node = stack.pop()
+            if self._box_distance2(node, point) > radius2:
+                continue
+            children = self.children[node]
+            if children is None:
+                rows, d2 = self._leaf_distances2(node, point)
+                inside = d2 <= radius2
+                found_rows.append(rows[inside])
+                found_d2.append(d2[inside])
+            else:
+                stack.extend(children)
+        if not found_rows:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        rows = np.concatenate(found_rows)
+        d2 = np.concatenate(found_d2)
+        order = np.lexsort((rows, d2))
+        return np.sqrt(d2[order]), rows[order]
+
+
+_SYMBOL_RE = re.compile(r"^([A-Za-z])\(?(\d+)\)?$")
+
+
+def node_id_of(node):
+    """Integer id of a NodeSymbol, node, integer id or symbol string (e.g. "O12")"""
+    if isinstance(node, str):
+        match = _SYMBOL_RE.match(node.strip())
+        if match is None:
+            raise ValueError(f"Not a node symbol: {node!r}")
+        return spark_dsg.NodeSymbol(match.group(1), int(match.group(2))).value
+    if isinstance(node, spark_dsg.NodeSymbol):
+        return node.value
+    if hasattr(node, "id") and isinstance(node.id, spark_dsg.NodeSymbol):
+        return node.id.value
+    return int(node)
+
+
+class DsgQuery:
+    """Nearest neighbour, radius, label and room queries on one scene graph.
+
+    Layers are anything `G.get_layer` takes (e.g. `spark_dsg.DsgLayers.OBJECTS`
+    or "MESH_PLACES"), labels are semantic labels or their names in the
+    layer's labelspace (e.g. "chair"), and nodes are NodeSymbols, integer
+    node ids or symbol strings. Nodes are returned as NodeSymbols.
+    """
+
+    def __init__(self, scene_graph):
+        self.scene_graph = scene_graph
+        self.version = dsg_version(scene_graph)
+        # (layer, label) -> (ids, KDTree) of the layer's nodes with the label
+        self._trees = {}
+        self._label_names = {}
+        self._lock = threading.Lock()
+
+    def _arrays(self, layer):
+        return DsgArraysRegistry.get(self.scene_graph, layer)
+
+    def _labelspace(self, layer):
+        """Semantic label -> name of a layer's labelspace, empty if it has none"""
+        if layer not in self._label_names:
+            layer_view = self.scene_graph.get_layer(layer)
+            labelspace = self.scene_graph.get_labelspace(
+                layer_view.id, layer_view.partition
+            )
+            self._label_names[layer] = (
+                dict(labelspace.labels_to_names) if labelspace else {}
+            )
+        return self._label_names[layer]
+
+    def _label(self, layer, label):
+        if label is None or not isinstance(label, str):
+            return label
+        names = self._labelspace(layer)
+        for semantic_label, name in names.items():
+            if name == label:
+                return semantic_label
+        for semantic_label, name in names.items():
+            if name.lower() == label.strip().lower():
+                return semantic_label
+        raise ValueError(
+            f"Unknown label {label!r} for layer {layer}, known labels: "
+            f"{sorted(names.values())}"
+        )
+
+    def _label_mask(self, arrays, layer, label):
+        if arrays.labels is None:
+            raise ValueError(f"The nodes of layer {layer} have no semantic labels")
+        return arrays.labels == self._label(layer, label)
+
+    def _tree(self, layer, label):
+        # Label names and their semantic labels share a tree
+        key = (layer, self._label(layer, label))
+        with self._lock:
+            entry = self._trees.get(key)
+            if entry is None:
+                arrays = self._arrays(layer)
+                if label is not None:
+                    arrays = arrays[self._label_mask(arrays, layer, label)]
+                entry = (np.asarray(arrays.ids), KDTree(arrays.positions))
+                self._trees[key] = entry
+        return entry
+
+    def _position(self, target):
+        """Position of a node, or `target` itself if it already is a position"""
+        if isinstance(target, (list, tuple, np.ndarray)) and len(target) == 3:
+            return np.asarray(target, dtype=float), None
+        node_id = node_id_of(target)
+        return np.asarray(self.scene_graph.get_node(node_id).attributes.position), (
+            node_id
+        )
+
+    def _results(self, ids, distances, rows, exclude=None):
+        results = []
+        for distance, row in zip(distances.tolist(), rows.tolist()):
+            node_id = int(ids[row])
+            if node_id != exclude:
+                results.append((spark_dsg.NodeSymbol(node_id), distance))
+        return results
+
+    def nearest(self, target, layer=spark_dsg.DsgLayers.OBJECTS, k=1, label=None):
+        """The `k` nodes of `layer` (with `label`) closest to a node or position.
+
+        Returns (NodeSymbol, distance) pairs, closest first. A node is never
+        its own neighbour.
+        """
+        position, exclude = self._position(target)
+        ids, tree = self._tree(layer, label)
+        # One extra in case the target itself is among the closest
+        distances, rows = tree.query(position, k + (exclude is not None))
+        return self._results(ids, distances, rows, exclude)[:k]
+
+    def within_radius(
+        self, target, radius, layer=spark_dsg.DsgLayers.OBJECTS, label=None
+    ):
+        """Nodes of `layer` (with `label`) within `radius` of a node or position.
+
+        Returns (NodeSymbol, distance) pairs, closest first, without the target node.
+        """
+        position, exclude = self._position(target)
+        ids, tree = self._tree(layer, label)
+        distances, rows = tree.query_radius(position, radius)
+        return self._results(ids, distances, rows, exclude)
+
+    def nodes_with_label(self, label, layer=spark_dsg.DsgLayers.OBJECTS):
+        """Nodes of `layer` with a semantic label"""
+        arrays = self._arrays(layer)
+        ids = arrays.ids[self._label_mask(arrays, layer, label)]
+        return [spark_dsg.NodeSymbol(node_id) for node_id in ids.tolist()]
+
+    def count_labels(self, layer=spark_dsg.DsgLayers.OBJECTS, room=None):
+        """Number of nodes of `layer` with each semantic label.
+
+        With a `room`, only the objects in that room are counted. Labels are
+        keyed by name if the layer has a labelspace.
+        """
+        arrays = self._arrays(layer)
+        if arrays.labels is None:
+            raise ValueError(f"The nodes of layer {layer} have no semantic labels")
+        if room is not None:
+            arrays = arrays.select(self._objects_in_room(room))
+        labels, counts = np.unique(arrays.labels, return_counts=True)
+        names = self._labelspace(layer)
+        return {
+            names.get(label, label): count
+            for label, count in zip(labels.tolist(), counts.tolist())
+        }
+
+    def _objects_in_room(self, room):
+        index = DsgHierarchyRegistry.get(self.scene_graph)
+        return index.objects_in_room(node_id_of(room))
+
+    def objects_in_room(self, room, label=None):
+        """Objects (with `label`) whose place is in `room`"""
+        object_ids = self._objects_in_room(room)
+        if label is not None:
+            layer = spark_dsg.DsgLayers.OBJECTS
+            arrays = self._arrays(layer).select(object_ids)
+            object_ids = arrays.ids[self._label_mask(arrays, layer, label)].tolist()
+        return [spark_dsg.NodeSymbol(object_id) for object_id in object_ids]
+
+    def rooms_of(self, node):
+        """Rooms that an object or place is in"""
+        node_id = node_id_of(node)
+        index = DsgHierarchyRegistry.get(self.scene_graph)
+        if node_id in index.object_places:
+            room_ids = index.rooms_of_object(node_id)
+        elif node_id in index.place_rooms:
+            room_ids = index.rooms_of_place(node_id)
+        else:
+            room_ids = self.scene_graph.get_node(node_id).parents()
+        return [spark_dsg.NodeSymbol(room_id) for room_id in room_ids]
+
+
+class DsgQueryRegistry:
+    """Queries shared by all generated code that reads the same scene graph.
+
+    A `DsgQuery` (and its KD-trees) is rebuilt when its scene graph's version
+    changes. Only the most recently used ones are kept.
+    """
+
+    max_entries = 8
+    # id(scene_graph) -> (scene_graph, query). Holding on to the scene graph
+    # keeps its id from being reused by another graph.
+    queries = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, scene_graph) -> DsgQuery:
+        key = id(scene_graph)
+        with cls._lock:
+            entry = cls.queries.get(key)
+            if (
+                entry is not None
+                and entry[0] is scene_graph
+                and entry[1].version == dsg_version(scene_graph)
+            ):
+                cls.queries.move_to_end(key)
+                return entry[1]
+            query = DsgQuery(scene_graph)
+            cls.queries[key] = (scene_graph, query)
+            cls.queries.move_to_end(key)
+            while len(cls.queries) > cls.max_entries:
+                cls.queries.popitem(last=False)
+            return query
+
+    @classmethod
+    def invalidate(cls, scene_graph):
+        """Forget everything about a scene graph, e.g. after changing its attributes in place"""
+        with cls._lock:
+            cls.queries.pop(id(scene_graph), None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.queries.clear()
+
+
+def dsg_query(scene_graph) -> DsgQuery:
+    """The `DsgQuery` of a scene graph, as made available to generated code"""
+    return DsgQueryRegistry.get(scene_graph)
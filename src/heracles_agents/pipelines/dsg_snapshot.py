@@ -0,0 +1,363 @@
+"""Binary snapshots of scene graph files, stored in a cache directory.
+
+Parsing a large scene graph file takes seconds, and reading its nodes'
+attributes back out through pybind takes a pass over every node. A snapshot
+keeps the node ids, layers, semantic labels, positions, bounding boxes and
+parent/child edges of a scene graph file as NumPy arrays, plus its
+labelspaces, in a directory under `snapshot_dir()`. `load_dsg` only uses
+snapshots when `$HERACLES_DSG_SNAPSHOT_DIR` is set. The arrays are
+memory-mapped, so they are read without loading the scene graph, and worker
+processes that open the same snapshot share it through the page cache.
+
+A snapshot records the modification time, size and content hash of the file
+it was built from, and is rebuilt when the file changes. The file is only
+hashed again when its modification time or size differ from the recorded ones.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import spark_dsg
+
+from heracles_agents.pipelines.dsg_arrays import LayerArrays
+from heracles_agents.pipelines.dsg_hierarchy import dsg_version
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the arrays or the manifest change meaning
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_ARRAYS = [
+    "ids",
+    "labels",
+    "positions",
+    "bbox_min",
+    "bbox_max",
+    "edge_children",
+    "edge_parents",
+]
+HASH_CHUNK_SIZE = 1 << 20
+# Label of the nodes whose attributes have no semantic label
+NO_LABEL = -1
+
+
+def snapshots_enabled():
+    """Whether `load_dsg` saves and reads snapshots, which `$HERACLES_DSG_SNAPSHOT_DIR` turns on"""
+    return bool(os.environ.get("HERACLES_DSG_SNAPSHOT_DIR"))
+
+
+def snapshot_dir():
+    """Directory of the snapshots, `$HERACLES_DSG_SNAPSHOT_DIR` or a directory in the user's cache"""
+    path = os.environ.get("HERACLES_DSG_SNAPSHOT_DIR")
+    if not path:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+        path = os.path.join(cache_home, "heracles_agents", "dsg_snapshots")
+    return os.path.expanduser(os.path.expandvars(path))
+
+
+def snapshot_path(dsg_filepath):
+    """Snapshot directory of a scene graph file, named after the file and a hash of its full path"""
+    realpath = os.path.realpath(dsg_filepath)
+    path_hash = hashlib.sha256(realpath.encode("utf-8")).hexdigest()[:16]
+    name = f"{os.path.basename(realpath)}-{path_hash}.snapshot"
+    return os.path.join(snapshot_dir(), name)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fo:
+        while chunk := fo.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DsgSnapshot:
+    """Node and edge arrays of a scene graph, grouped by layer.
+
+    Nodes are stored layer by layer, in the order spark_dsg iterates them, so
+    the nodes of one layer are a contiguous range of rows. `ids` and `labels`
+    are (n,) arrays, `positions`, `bbox_min` and `bbox_max` (n, 3) arrays
+    (NaN for nodes without a bounding box). Every parent/child edge is a pair
+    of rows in `edge_children` and `edge_parents`, sorted by child.
+    """
+
+    def __init__(self, arrays, manifest):
+        self.manifest = manifest
+        for name in SNAPSHOT_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.version = tuple(manifest["version"])
+        # Sorted ids and the rows they are in, built on the first lookup by id
+        self._rows_by_id = None
+        self._edges_by_parent = None
+
+    @classmethod
+    def from_scene_graph(cls, scene_graph, source_sha256=None, source_stat=None):
+        n_nodes = scene_graph.num_nodes()
+        ids = np.empty(n_nodes, dtype=np.uint64)
+        labels = np.full(n_nodes, NO_LABEL, dtype=np.int64)
+        positions = np.empty((n_nodes, 3))
+        bbox_min = np.full((n_nodes, 3), np.nan)
+        bbox_max = np.full((n_nodes, 3), np.nan)
+        parent_ids = []
+
+        layer_names = {}
+        for name, key in scene_graph.layer_names.items():
+            layer_names.setdefault((key.layer, key.partition), []).append(name)
+        layers = []
+        labelspaces = []
+        row = 0
+        for key in scene_graph.layer_keys:
+            start = row
+            has_labels = None
+            for node in scene_graph.get_layer(key.layer, key.partition).nodes:
+                attrs = node.attributes
+                if has_labels is None:
+                    has_labels = hasattr(attrs, "semantic_label")
+                ids[row] = node.id.value
+                positions[row] = attrs.position
+                if has_labels:
+                    labels[row] = attrs.semantic_label
+                bbox = getattr(attrs, "bounding_box", None)
+                if bbox is not None and bbox.is_valid():
+                    bbox_min[row] = bbox.min
+                    bbox_max[row] = bbox.max
+                parent_ids.extend((row, parent) for parent in node.parents())
+                row += 1
+            layers.append(
+                {
+                    "layer": key.layer,
+                    "partition": key.partition,
+                    "names": layer_names.get((key.layer, key.partition), []),
+                    "start": start,
+                    "stop": row,
+                    "has_labels": bool(has_labels),
+                }
+            )
+            labelspace = scene_graph.get_labelspace(key.layer, key.partition)
+            if labelspace:
+                labelspaces.append(
+                    {
+                        "layer": key.layer,
+                        "partition": key.partition,
+                        "labels_to_names": list(labelspace.labels_to_names.items()),
+                    }
+                )
+
+        rows = {node_id: r for r, node_id in enumerate(ids.tolist())}
+        edges = np.array(
+            [(child, rows[parent]) for child, parent in parent_ids], dtype=np.int64
+        ).reshape(-1, 2)
+        arrays = {
+            "ids": ids,
+            "labels": labels,
+            "positions": positions,
+            "bbox_min": bbox_min,
+            "bbox_max": bbox_max,
+            "edge_children": edges[:, 0].copy(),
+            "edge_parents": edges[:, 1].copy(),
+        }
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "source_sha256": source_sha256,
+            "source_mtime_ns": source_stat.st_mtime_ns if source_stat else None,
+            "source_size": source_stat.st_size if source_stat else None,
+            # Node and edge counts, the generation only means something in this process
+            "version": list(dsg_version(scene_graph)[1:]),
+            "layers": layers,
+            "labelspaces": labelspaces,
+        }
+        return cls(arrays, manifest)
+
+    @classmethod
+    def read(cls, path):
+        """Memory-map a snapshot directory, or None if it isn't a complete snapshot"""
+        try:
+            with open(os.path.join(path, "manifest.json"), "r") as fo:
+                manifest = json.load(fo)
+            if manifest.get("format") != SNAPSHOT_FORMAT:
+                return None
+            arrays = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in SNAPSHOT_ARRAYS
+            }
+        except (OSError, ValueError):
+            return None
+        return cls(arrays, manifest)
+
+    def write(self, path):
+        """Save the snapshot to the directory `path`, replacing whatever is there"""
+        parent, name = os.path.split(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=f".{name}-", dir=parent)
+        try:
+            for array_name in SNAPSHOT_ARRAYS:
+                np.save(
+                    os.path.join(tmp_path, f"{array_name}.npy"),
+                    getattr(self, array_name),
+                )
+            # Written last, so that a snapshot with a manifest is complete
+            with open(os.path.join(tmp_path, "manifest.json"), "w") as fo:
+                json.dump(self.manifest, fo)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp_path, path)
+        except OSError:
+            # e.g. another process wrote the snapshot first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def write_manifest(self, path):
+        """Replace the manifest of the snapshot saved in `path` with this snapshot's"""
+        manifest_path = os.path.join(path, "manifest.json")
+        fd, tmp_path = tempfile.mkstemp(prefix=".manifest-", dir=path)
+        try:
+            with os.fdopen(fd, "w") as fo:
+                json.dump(self.manifest, fo)
+            os.replace(tmp_path, manifest_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def built_from(self, stat):
+        """True if the snapshot records the modification time and size in `stat`"""
+        return (
+            self.manifest.get("source_mtime_ns") == stat.st_mtime_ns
+            and self.manifest.get("source_size") == stat.st_size
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def layer(self, layer, partition=0):
+        """Manifest entry of a layer, by name (e.g. "MESH_PLACES") or by id and partition"""
+        for entry in self.manifest["layers"]:
+            if isinstance(layer, str):
+                if layer in entry["names"]:
+                    return entry
+            elif entry["layer"] == layer and entry["partition"] == partition:
+                return entry
+        raise KeyError(layer)
+
+    def layer_arrays(self, layer, partition=0) -> LayerArrays:
+        """`LayerArrays` of a layer, the same as `LayerArrays.from_layer` of the scene graph"""
+        entry = self.layer(layer, partition)
+        rows = slice(entry["start"], entry["stop"])
+        labels = self.labels[rows] if entry["has_labels"] else None
+        if labels is None and entry["start"] == entry["stop"]:
+            labels = np.empty(0, dtype=np.int64)
+        return LayerArrays(self.ids[rows], self.positions[rows], labels)
+
+    def labelspace(self, layer, partition=0):
+        """Semantic label -> category name of a layer, or None if it has no labelspace"""
+        for entry in self.manifest["labelspaces"]:
+            if entry["layer"] == layer and entry["partition"] == partition:
+                return dict((int(k), v) for k, v in entry["labels_to_names"])
+        return None
+
+    def rows_of(self, node_ids):
+        """Rows of an array of node ids, -1 for ids that aren't in the snapshot"""
+        node_ids = np.asarray(node_ids, dtype=np.uint64)
+        rows = np.full(node_ids.shape, -1, dtype=np.int64)
+        if len(self.ids) == 0:
+            return rows
+        if self._rows_by_id is None:
+            order = np.argsort(self.ids)
+            self._rows_by_id = (self.ids[order], order)
+        sorted_ids, order = self._rows_by_id
+        found = np.minimum(np.searchsorted(sorted_ids, node_ids), len(sorted_ids) - 1)
+        hit = sorted_ids[found] == node_ids
+        rows[hit] = order[found[hit]]
+        return rows
+
+    def row_of(self, node_id):
+        row = int(self.rows_of([node_id])[0])
+        if row < 0:
+            raise KeyError(node_id)
+        return row
+
+    def parents_of(self, node_id):
+        """Ids of the parents of a node"""
+        row = self.row_of(node_id)
+        start, stop = np.searchsorted(self.edge_children, [row, row + 1])
+        return self.ids[self.edge_parents[start:stop]].tolist()
+
+    def children_of(self, node_id):
+        """Ids of the children of a node"""
+        if self._edges_by_parent is None:
+            self._edges_by_parent = np.argsort(self.edge_parents, kind="stable")
+        row = self.row_of(node_id)
+        parents = self.edge_parents[self._edges_by_parent]
+        start, stop = np.searchsorted(parents, [row, row + 1])
+        return self.ids[self.edge_children[self._edges_by_parent[start:stop]]].tolist()
+
+
+class DsgSnapshotCache:
+    """Snapshots of scene graph files, built on first use and shared within the process.
+
+    `get` memory-maps the snapshot of the scene graph file if it was built
+    from the file's current contents, and otherwise builds it from the scene
+    graph (loading the file if no scene graph is given) and saves it. Only the
+    most recently used snapshots are kept open.
+    """
+
+    max_entries = 8
+    # (path, modification time, size) of the scene graph file -> snapshot
+    snapshots = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, dsg_filepath, scene_graph=None) -> DsgSnapshot:
+        stat = os.stat(dsg_filepath)
+        key = (os.path.realpath(dsg_filepath), stat.st_mtime_ns, stat.st_size)
+        with cls._lock:
+            snapshot = cls.snapshots.get(key)
+            if snapshot is not None:
+                cls.snapshots.move_to_end(key)
+                return snapshot
+            snapshot = cls._open(dsg_filepath, stat, scene_graph)
+            cls.snapshots[key] = snapshot
+            while len(cls.snapshots) > cls.max_entries:
+                cls.snapshots.popitem(last=False)
+            return snapshot
+
+    @classmethod
+    def _open(cls, dsg_filepath, stat, scene_graph):
+        path = snapshot_path(dsg_filepath)
+        snapshot = DsgSnapshot.read(path)
+        if snapshot is not None and snapshot.built_from(stat):
+            return snapshot
+
+        # Only hashed when the file was replaced or touched since the snapshot
+        source_sha256 = file_sha256(dsg_filepath)
+        if snapshot is not None and snapshot.manifest["source_sha256"] == source_sha256:
+            snapshot.manifest["source_mtime_ns"] = stat.st_mtime_ns
+            snapshot.manifest["source_size"] = stat.st_size
+            try:
+                snapshot.write_manifest(path)
+            except OSError as e:
+                logger.warning(f"Could not update scene graph snapshot {path}: {e}")
+            return snapshot
+
+        logger.info(f"Building scene graph snapshot {path}")
+        if scene_graph is None:
+            scene_graph = spark_dsg.DynamicSceneGraph.load(dsg_filepath)
+        snapshot = DsgSnapshot.from_scene_graph(scene_graph, source_sha256, stat)
+        try:
+            snapshot.write(path)
+        except OSError as e:
+            logger.warning(f"Could not save scene graph snapshot {path}: {e}")
+            return snapshot
+        # Reopened so that the arrays are shared through the page cache
+        return DsgSnapshot.read(path) or snapshot
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.snapshots.clear()
@@ -0,0 +1,304 @@
+"""Question-relevant parts of a scene graph that fit in a prompt token budget.
+
+Nodes are ranked by relevance to the question: first objects and rooms whose
+semantic label (or node id) is named in the question, then the contents of
+matching rooms, then everything else by distance to the closest matching node.
+Every object is added together with its ancestors (places and rooms), and the
+selection stops at the first node that does not fit in the budget.
+"""
+
+import logging
+import re
+
+import numpy as np
+import spark_dsg
+
+from heracles_agents.llm_interface import DsgSubgraph
+from heracles_agents.pipelines.dsg_arrays import DsgArraysRegistry
+from heracles_agents.pipelines.dsg_hierarchy import DsgHierarchyRegistry
+from heracles_agents.pipelines.in_context_utils import (
+    OBJECT_LAYER_ID,
+    ROOM_LAYER_ID,
+    SceneGraphStrings,
+    object_group_compact,
+    object_row_compact,
+    object_to_string_full,
+    object_to_string_room_parent,
+    place_group_compact,
+    place_row_compact,
+    place_to_string_full,
+    room_row_compact,
+    room_to_string,
+    room_to_string_full,
+    scene_graph_to_prompt,
+    scene_graph_to_prompt_full,
+)
+from heracles_agents.token_utils import get_token_encoder
+
+logger = logging.getLogger(__name__)
+
+# Distances to the matched nodes are only computed for this many of them
+MAX_NEIGHBORHOOD_SEEDS = 256
+# Rows of the node x seed distance matrix computed at a time
+DISTANCE_CHUNK_SIZE = 2048
+
+NODE_ID_PATTERN = re.compile(r"\b[A-Z]\d+\b")
+
+
+def normalize_text(text):
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def label_in_question(label, normalized_question):
+    """Whether `label` (or its plural) is named in the (normalized) question"""
+    label = normalize_text(label)
+    if not label:
+        return False
+    return re.search(rf"\b{re.escape(label)}(e?s)?\b", normalized_question) is not None
+
+
+def distances_to_seeds(positions, seeds):
+    """Distance from each position to the closest seed"""
+    distances = np.empty(len(positions))
+    seed_norms = (seeds**2).sum(axis=1)
+    for start in range(0, len(positions), DISTANCE_CHUNK_SIZE):
+        chunk = positions[start : start + DISTANCE_CHUNK_SIZE]
+        # |p - s|^2 = |p|^2 - 2 p.s + |s|^2, with the cross term as one matrix product
+        squared = seed_norms[None, :] - 2 * chunk @ seeds.T
+        closest = squared.min(axis=1) + (chunk**2).sum(axis=1)
+        distances[start : start + DISTANCE_CHUNK_SIZE] = np.sqrt(np.maximum(closest, 0))
+    return distances
+
+
+class SubgraphSelector:
+    """Select the nodes of a scene graph to encode for a question.
+
+    With a `place_layer_name` the selection is encoded with
+    `scene_graph_to_prompt_full` (in the given `encoding`), otherwise with
+    `scene_graph_to_prompt`.
+    """
+
+    def __init__(
+        self, scene_graph, token_encoder, place_layer_name=None, encoding="default"
+    ):
+        self.scene_graph = scene_graph
+        self.token_encoder = token_encoder
+        self.place_layer_name = place_layer_name
+        self.full = place_layer_name is not None
+        self.compact = self.full and encoding == "compact"
+        self.encoding = encoding
+        self.strings = SceneGraphStrings(scene_graph)
+        self.index = DsgHierarchyRegistry.get(scene_graph, place_layer_name)
+
+        self.objects = {
+            n.id.value: n
+            for n in scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes
+        }
+        self.places = (
+            {n.id.value: n for n in scene_graph.get_layer(place_layer_name).nodes}
+            if self.full
+            else {}
+        )
+        self.rooms = {
+            n.id.value: n
+            for n in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes
+        }
+        layers = [spark_dsg.DsgLayers.OBJECTS, spark_dsg.DsgLayers.ROOMS]
+        if self.full:
+            layers.insert(1, place_layer_name)
+        self.layer_arrays = [
+            DsgArraysRegistry.get(scene_graph, layer) for layer in layers
+        ]
+        self._line_tokens = {}
+
+    def encode(self, node_ids=None):
+        if self.full:
+            return scene_graph_to_prompt_full(
+                self.scene_graph,
+                self.place_layer_name,
+                node_ids=node_ids,
+                encoding=self.encoding,
+            )
+        return scene_graph_to_prompt(self.scene_graph, node_ids=node_ids)
+
+    def node_line(self, node_id):
+        G, strings, index = self.scene_graph, self.strings, self.index
+        if self.compact:
+            if node_id in self.objects:
+                return object_row_compact(self.objects[node_id], strings)
+            if node_id in self.places:
+                return place_row_compact(self.places[node_id], strings, index)
+            return room_row_compact(self.rooms[node_id], strings, index)
+        if node_id in self.objects:
+            encoder = (
+                object_to_string_full if self.full else object_to_string_room_parent
+            )
+            return encoder(self.objects[node_id], G, strings, index)
+        if node_id in self.places:
+            return place_to_string_full(self.places[node_id], G, strings, index)
+        if self.full:
+            return room_to_string_full(self.rooms[node_id], G, strings, index)
+        return room_to_string(self.rooms[node_id], G, strings)
+
+    def node_group(self, node_id):
+        """The line that the node's row is grouped under, if the encoding groups rows"""
+        if not self.compact:
+            return None
+        if node_id in self.objects:
+            return object_group_compact(self.objects[node_id], self.strings, self.index)
+        if node_id in self.places:
+            return place_group_compact(self.places[node_id], self.strings, self.index)
+        return None
+
+    def line_tokens(self, line):
+        n_tokens = self._line_tokens.get(line)
+        if n_tokens is None:
+            n_tokens = len(self.token_encoder.encode(line))
+            self._line_tokens[line] = n_tokens
+        return n_tokens
+
+    def ancestors(self, node_id):
+        """Places and rooms that have to be in the prompt along with the node"""
+        if node_id in self.objects:
+            places = self.index.places_of_object(node_id) if self.full else ()
+            rooms = self.index.rooms_of_object(node_id)
+        elif node_id in self.places:
+            places, rooms = (), self.index.rooms_of_place(node_id)
+        else:
+            return []
+        return [i for i in places if i in self.places] + [
+            i for i in rooms if i in self.rooms
+        ]
+
+    def match_question(self, question):
+        """Nodes named in the question, by semantic label or node id, and the names that matched"""
+        normalized_question = normalize_text(question)
+        mentioned_ids = set(NODE_ID_PATTERN.findall(question))
+        matched_names = []
+        matches = []
+        for layer_id, nodes in (
+            (OBJECT_LAYER_ID, self.objects),
+            (None, self.places),
+            (ROOM_LAYER_ID, self.rooms),
+        ):
+            label_matches = {}
+            for node_id, node in nodes.items():
+                symbol = self.strings.symbol(node_id)
+                if symbol in mentioned_ids:
+                    matches.append(node_id)
+                    matched_names.append(symbol)
+                    continue
+                if layer_id is None:
+                    continue
+                category = self.strings.category(
+                    layer_id, node.attributes.semantic_label
+                )
+                if category not in label_matches:
+                    label_matches[category] = label_in_question(
+                        category, normalized_question
+                    )
+                    if label_matches[category]:
+                        matched_names.append(category)
+                if label_matches[category]:
+                    matches.append(node_id)
+        return matches, matched_names
+
+    def rank(self, question):
+        """All nodes, from most to least relevant to the question"""
+        matches, matched_names = self.match_question(question)
+        ranked = list(matches)
+        # The contents of the rooms that the question names
+        for node_id in matches:
+            if node_id in self.rooms:
+                ranked.extend(self.index.places_in_room(node_id) if self.full else ())
+                ranked.extend(self.index.objects_in_room(node_id))
+
+        ranked_ids = np.fromiter(dict.fromkeys(ranked), dtype=np.uint64)
+        rest = [
+            arrays[~np.isin(arrays.ids, ranked_ids)] for arrays in self.layer_arrays
+        ]
+        rest_ids = [node_id for arrays in rest for node_id in arrays.ids.tolist()]
+        if matches and rest_ids:
+            # Everything else by distance to the closest matched node
+            seeds = np.array(
+                [self.position(node_id) for node_id in matches[:MAX_NEIGHBORHOOD_SEEDS]]
+            )
+            positions = np.concatenate([arrays.positions for arrays in rest])
+            order = np.argsort(distances_to_seeds(positions, seeds), kind="stable")
+            rest_ids = [rest_ids[i] for i in order.tolist()]
+        return ranked + rest_ids, matched_names
+
+    def position(self, node_id):
+        for arrays in self.layer_arrays:
+            row = arrays.row_of(node_id)
+            if row is not None:
+                return arrays.positions[row]
+        raise KeyError(node_id)
+
+    def select(self, question, token_budget):
+        """Encoding of the most relevant nodes that fit in `token_budget` tokens, and a record of the selection"""
+        ranked, matched_names = self.rank(question)
+        chosen = set()
+        groups = set()
+        # Per-node token counts add up to (almost exactly) the count of the
+        # joined encoding, since every node starts on a new line
+        n_tokens = len(self.token_encoder.encode(self.encode(node_ids=chosen)))
+        complete = True
+        for node_id in ranked:
+            if node_id in chosen:
+                continue
+            new_ids = [
+                i
+                for i in dict.fromkeys([node_id, *self.ancestors(node_id)])
+                if i not in chosen
+            ]
+            new_groups = {self.node_group(i) for i in new_ids} - groups - {None}
+            cost = sum(self.line_tokens(self.node_line(i)) for i in new_ids)
+            cost += sum(self.line_tokens(g) for g in new_groups)
+            if n_tokens + cost > token_budget:
+                complete = False
+                break
+            chosen.update(new_ids)
+            groups.update(new_groups)
+            n_tokens += cost
+
+        description = self.encode(node_ids=chosen)
+        subgraph = DsgSubgraph(
+            token_budget=token_budget,
+            n_tokens=len(self.token_encoder.encode(description)),
+            matched_labels=matched_names,
+            objects=[self.strings.symbol(i) for i in self.objects if i in chosen],
+            places=[self.strings.symbol(i) for i in self.places if i in chosen],
+            rooms=[self.strings.symbol(i) for i in self.rooms if i in chosen],
+            complete=complete,
+        )
+        if not complete:
+            logger.info(
+                f"Selected {len(chosen)} scene graph nodes ({subgraph.n_tokens} tokens) for question: {question}"
+            )
+        return description, subgraph
+
+
+def describe_dsg_for_question(
+    dsg_interface, question, model_name, place_layer_name=None, encoding="default"
+):
+    """Scene graph description to put in the prompt for `question`.
+
+    Returns the description and, if the interface has a subgraph token budget,
+    the selected subgraph (otherwise None and the whole scene graph).
+    """
+    if dsg_interface.subgraph_token_budget is None:
+        if place_layer_name is None:
+            return dsg_interface.get_serialized_dsg(scene_graph_to_prompt), None
+        return dsg_interface.get_serialized_dsg(
+            scene_graph_to_prompt_full,
+            place_layer_name=place_layer_name,
+            encoding=encoding,
+        ), None
+    selector = SubgraphSelector(
+        dsg_interface.get_dsg(),
+        get_token_encoder(model_name),
+        place_layer_name,
+        encoding,
+    )
+    return selector.select(question, dsg_interface.subgraph_token_budget)
@@ -0,0 +1,110 @@
+"""Scene graph updates for agents that keep talking about a changing scene graph.
+
+`DsgUpdateTracker` remembers the encoding of every node that was last sent to
+the agent. The first message is the whole scene graph; after that, only the
+nodes that were added, changed or removed are sent, so the agent's history
+grows with the changes instead of with the size of the scene graph.
+"""
+
+import spark_dsg
+
+from heracles_agents.pipelines.dsg_arrays import DsgArraysRegistry
+from heracles_agents.pipelines.dsg_hierarchy import (
+    DsgHierarchyRegistry,
+    mark_dsg_changed,
+)
+from heracles_agents.pipelines.in_context_utils import (
+    SceneGraphStrings,
+    object_lines_full,
+    object_lines_room_parent,
+    place_lines_full,
+    room_lines,
+    room_lines_full,
+    scene_graph_to_prompt,
+    scene_graph_to_prompt_full,
+)
+
+
+class DsgUpdateTracker:
+    """The scene graph as last sent to an agent, and the messages that update it.
+
+    Nodes are encoded like `scene_graph_to_prompt_full` with a
+    `place_layer_name`, otherwise like `scene_graph_to_prompt`.
+    """
+
+    def __init__(self, place_layer_name=None):
+        self.place_layer_name = place_layer_name
+        # node id -> line last sent for the node, None before the first message
+        self.sent_lines = None
+
+    def layers(self):
+        if self.place_layer_name is None:
+            return [
+                (spark_dsg.DsgLayers.OBJECTS, object_lines_room_parent),
+                (spark_dsg.DsgLayers.ROOMS, room_lines),
+            ]
+        return [
+            (spark_dsg.DsgLayers.OBJECTS, object_lines_full),
+            (self.place_layer_name, place_lines_full),
+            (spark_dsg.DsgLayers.ROOMS, room_lines_full),
+        ]
+
+    def node_lines(self, scene_graph):
+        """The line of every node, in layer order"""
+        # A live scene graph can move nodes or rewire edges between updates,
+        # so whatever the registries have for it may be stale
+        mark_dsg_changed(scene_graph)
+        strings = SceneGraphStrings(scene_graph)
+        index = DsgHierarchyRegistry.get(scene_graph, self.place_layer_name)
+        lines = {}
+        for layer, layer_lines in self.layers():
+            arrays = DsgArraysRegistry.get(scene_graph, layer)
+            lines.update(zip(arrays.ids.tolist(), layer_lines(arrays, strings, index)))
+        return lines
+
+    def full_message(self, scene_graph):
+        """The whole scene graph, which later updates are relative to"""
+        return self._full_message(scene_graph, self.node_lines(scene_graph))
+
+    def _full_message(self, scene_graph, lines):
+        # Encoded from the registries that `node_lines` just refreshed
+        self.sent_lines = lines
+        if self.place_layer_name is None:
+            return scene_graph_to_prompt(scene_graph)
+        return scene_graph_to_prompt_full(scene_graph, self.place_layer_name)
+
+    def update_message(self, scene_graph):
+        """What changed in the scene graph since the last message, or None if nothing did.
+
+        The first message, and any update that would be as long as the
+        whole scene graph, is the full encoding instead.
+        """
+        if self.sent_lines is None:
+            return self.full_message(scene_graph)
+        lines = self.node_lines(scene_graph)
+        added = [line for i, line in lines.items() if i not in self.sent_lines]
+        updated = [
+            line
+            for i, line in lines.items()
+            if i in self.sent_lines and self.sent_lines[i] != line
+        ]
+        removed = [i for i in self.sent_lines if i not in lines]
+        if not (added or updated or removed):
+            return None
+        if len(added) + len(updated) + len(removed) >= len(lines):
+            return self._full_message(scene_graph, lines)
+        self.sent_lines = lines
+
+        strings = SceneGraphStrings(scene_graph)
+        parts = ["<Scene Graph Update>"]
+        if added:
+            parts.append("\nAdded: ")
+            parts.extend(added)
+        if updated:
+            parts.append("\nUpdated: ")
+            parts.extend(updated)
+        if removed:
+            removed_symbols = ", ".join(strings.symbol(i) for i in removed)
+            parts.append(f"\nRemoved: {removed_symbols}")
+        parts.append("\n</Scene Graph Update>")
+        return "".join(parts)
@@ -1,6 +1,6 @@
 import copy
 import logging
-import os
+from functools import partial
 
 from heracles_agents.experiment_definition import (
     PipelineDescription,
@@ -11,17 +11,19 @@ from heracles_agents.llm_interface import (
     AgentContext,
     AgentSequence,
     AnalyzedQuestion,
-    AnalyzedQuestions,
     EvalQuestion,
     LlmAgent,
     QuestionAnalysis,
 )
 from heracles_agents.pipelines.codegen_utils import (
-    execute_generated_code,
-    load_dsg,
+    execute_generated_code_timed,
 )
 from heracles_agents.pipelines.comparisons import evaluate_answer
 from heracles_agents.pipelines.prompt_utils import get_answer_formatting_guidance
+from heracles_agents.pipelines.question_executor import (
+    INFRASTRUCTURE_ERRORS,
+    run_questions,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -59,93 +61,98 @@ def generate_prompt(
     return prompt
 
 
+def analyze_question(exp, question: EvalQuestion, api_string=None):
+    answer = None
+    sequences = []
+    try:
+        logger.info(f"\n=======================\nQuestion: {question.question}\n")
+        cxt = AgentContext(exp.phases["generate-code"])
+
+        prompt = generate_prompt(
+            question, exp.phases["generate-code"], api_prompt=api_string
+        )
+
+        cxt.initialize_agent(prompt)
+        success, answer = cxt.run()
+        logger.info(f"\nLLM Intermediate Answer: {answer}\n")
+
+        codgen_sequence = AgentSequence(
+            description="codegen-agent", responses=cxt.get_agent_responses()
+        )
+        sequences = [codgen_sequence]
+
+        success, code_results, code_usage = execute_generated_code_timed(
+            answer, exp.dsg_interface
+        )
+
+        cxt2 = AgentContext(exp.phases["refine"])
+        refinement_prompt = generate_prompt(
+            question,
+            exp.phases["refine"],
+            {"python_results": code_results, "python_code": answer},
+        )
+
+        cxt2.initialize_agent(refinement_prompt)
+        success, answer = cxt2.run()
+        logger.info(f"LLM Final Answer: {answer}")
+
+        valid_format, correct = evaluate_answer(
+            question.correctness_comparator, answer, question.solution
+        )
+
+        logger.info(f"\n\nCorrect? {correct}\n\n")
+
+        refinement_sequence = AgentSequence(
+            description="refinement-agent", responses=cxt2.get_agent_responses()
+        )
+
+        sequences = [codgen_sequence, refinement_sequence]
+
+        n_input_tokens = cxt.initial_input_tokens + cxt2.initial_input_tokens
+        n_output_tokens = cxt.total_output_tokens + cxt2.total_output_tokens
+
+        analysis = QuestionAnalysis(
+            correct=correct,
+            valid_answer_format=valid_format,
+            input_tokens=n_input_tokens,
+            output_tokens=n_output_tokens,
+            n_tool_calls=cxt.n_tool_calls + cxt2.n_tool_calls,
+            cached_input_tokens=cxt.cached_input_tokens + cxt2.cached_input_tokens,
+            cache_write_input_tokens=(
+                cxt.cache_write_input_tokens + cxt2.cache_write_input_tokens
+            ),
+            code_executions=[code_usage],
+            shaped_tool_results=cxt.shaped_tool_results + cxt2.shaped_tool_results,
+        )
+    except INFRASTRUCTURE_ERRORS:
+        # Not the question's fault, it is asked again when the run is resumed
+        raise
+    except Exception as ex:
+        print(ex)
+        logger.error("Bad Question!")
+        logger.error(str(ex))
+        analysis = QuestionAnalysis(
+            correct=False,
+            valid_answer_format=False,
+            input_tokens=0,
+            output_tokens=0,
+            n_tool_calls=0,
+        )
+
+    return AnalyzedQuestion(
+        question=question, answer=answer, sequences=sequences, analysis=analysis
+    )
+
+
 # TODO update this function here
 def feedforward_codegen(exp):
-    analyzed_questions = []
-    # Note this won't work for inserting into the scene graph. To do that a copy.deepcopy will be needed in the loop (not including for efficiency, since loading the scene graph is slow)
-    # TODO modify experiment config to include this)
-    dsg_filepath = os.path.expandvars(exp.dsg_interface.dsg_filepath)
-    dsg_labels_filepath = (
-        os.path.expandvars(exp.dsg_interface.dsg_labels_filepath)
-        if hasattr(exp.dsg_interface, "dsg_labels_filepath")
-        and exp.dsg_interface.dsg_labels_filepath
-        else None
-    )
-    scene_graph = load_dsg(dsg_filepath, dsg_labels_filepath)
+    # Generated code runs in sandbox workers, which load the scene graph
+    # themselves. Loading it here first means that workers forked from this
+    # process start with it.
+    exp.dsg_interface.get_dsg()
     # Set api in prompt
     api_string = exp.dsg_interface.get_dsg_api_prompt()
-    for question in exp.questions:
-        try:
-            logger.info(f"\n=======================\nQuestion: {question.question}\n")
-            cxt = AgentContext(exp.phases["generate-code"])
-
-            prompt = generate_prompt(
-                question, exp.phases["generate-code"], api_prompt=api_string
-            )
-
-            cxt.initialize_agent(prompt)
-            success, answer = cxt.run()
-            logger.info(f"\nLLM Intermediate Answer: {answer}\n")
-
-            codgen_sequence = AgentSequence(
-                description="codegen-agent", responses=cxt.get_agent_responses()
-            )
-
-            # TODO udpate this
-            success, code_results = execute_generated_code(answer, scene_graph)
-
-            cxt2 = AgentContext(exp.phases["refine"])
-            refinement_prompt = generate_prompt(
-                question,
-                exp.phases["refine"],
-                {"python_results": code_results, "python_code": answer},
-            )
-
-            cxt2.initialize_agent(refinement_prompt)
-            success, answer = cxt2.run()
-            logger.info(f"LLM Final Answer: {answer}")
-
-            valid_format, correct = evaluate_answer(
-                question.correctness_comparator, answer, question.solution
-            )
-
-            logger.info(f"\n\nCorrect? {correct}\n\n")
-
-            refinement_sequence = AgentSequence(
-                description="refinement-agent", responses=cxt2.get_agent_responses()
-            )
-
-            sequences = [codgen_sequence, refinement_sequence]
-
-            n_input_tokens = cxt.initial_input_tokens + cxt2.initial_input_tokens
-            n_output_tokens = cxt.total_output_tokens + cxt2.total_output_tokens
-
-            analysis = QuestionAnalysis(
-                correct=correct,
-                valid_answer_format=valid_format,
-                input_tokens=n_input_tokens,
-                output_tokens=n_output_tokens,
-                n_tool_calls=cxt.n_tool_calls + cxt2.n_tool_calls,
-            )
-        except Exception as ex:
-            print(ex)
-            logger.error("Bad Question!")
-            logger.error(str(ex))
-            analysis = QuestionAnalysis(
-                correct=False,
-                valid_answer_format=False,
-                input_tokens=0,
-                output_tokens=0,
-                n_tool_calls=0,
-            )
-
-        aq = AnalyzedQuestion(
-            question=question, answer=answer, sequences=sequences, analysis=analysis
-        )
-        analyzed_questions.append(aq)
-
-    aqs = AnalyzedQuestions(analyzed_questions=analyzed_questions)
-    return aqs
+    return run_questions(exp, partial(analyze_question, exp, api_string=api_string))
 
 
 codegen_phase = PipelinePhase(
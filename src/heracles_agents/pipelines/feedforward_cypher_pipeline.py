@@ -1,5 +1,6 @@
 import copy
 import logging
+from functools import partial
 
 from heracles_agents.experiment_definition import (
     PipelineDescription,
@@ -10,7 +11,6 @@ from heracles_agents.llm_interface import (
     AgentContext,
     AgentSequence,
     AnalyzedQuestion,
-    AnalyzedQuestions,
     EvalQuestion,
     LlmAgent,
     QuestionAnalysis,
@@ -18,6 +18,10 @@ from heracles_agents.llm_interface import (
 from heracles_agents.pipelines.comparisons import evaluate_answer
 from heracles_agents.pipelines.db_utils import query_db
 from heracles_agents.pipelines.prompt_utils import get_answer_formatting_guidance
+from heracles_agents.pipelines.question_executor import (
+    INFRASTRUCTURE_ERRORS,
+    run_questions,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -48,79 +52,92 @@ def generate_prompt(
     return prompt
 
 
-def feedforward_cypher(exp):
-    analyzed_questions = []
-    for question in exp.questions:
-        try:
-            logger.info(f"\n=======================\nQuestion: {question.question}\n")
-            cxt = AgentContext(exp.phases["generate-cypher"])
-
-            prompt = generate_prompt(question, exp.phases["generate-cypher"])
-
-            cxt.initialize_agent(prompt)
-            success, answer = cxt.run()
-            logger.info(f"\nLLM Intermediate Answer: {answer}\n")
-
-            cypher_generation_sequence = AgentSequence(
-                description="cypher-producing-agent",
-                responses=cxt.get_agent_responses(),
-            )
-
-            success, query_result = query_db(exp.dsg_interface, answer)
-
-            cxt2 = AgentContext(exp.phases["refine"])
-            refinement_prompt = generate_prompt(
-                question,
-                exp.phases["refine"],
-                {"cypher_results": query_result, "cypher_query": answer},
-            )
-
-            cxt2.initialize_agent(refinement_prompt)
-            success, answer = cxt2.run()
-            logger.info(f"LLM Final Answer: {answer}")
-
-            valid_format, correct = evaluate_answer(
-                question.correctness_comparator, answer, question.solution
-            )
-
-            logger.info(f"\n\nCorrect? {correct}\n\n")
-
-            refinement_sequence = AgentSequence(
-                description="refinement-agent", responses=cxt2.get_agent_responses()
-            )
-
-            sequences = [cypher_generation_sequence, refinement_sequence]
-
-            n_input_tokens = cxt.initial_input_tokens + cxt2.initial_input_tokens
-            n_output_tokens = cxt.total_output_tokens + cxt2.total_output_tokens
-
-            analysis = QuestionAnalysis(
-                correct=correct,
-                valid_answer_format=valid_format,
-                input_tokens=n_input_tokens,
-                output_tokens=n_output_tokens,
-                n_tool_calls=cxt.n_tool_calls + cxt2.n_tool_calls,  # Should be 0...
-            )
-
-        except Exception as ex:
-            print(ex)
-            logger.error("Bad Question!")
-            logger.error(str(ex))
-            analysis = QuestionAnalysis(
-                correct=False,
-                valid_answer_format=False,
-                input_tokens=0,
-                output_tokens=0,
-                n_tool_calls=0,
-            )
-
-        aq = AnalyzedQuestion(
-            question=question, answer=answer, sequences=sequences, analysis=analysis
+def cypher_generation_prompt(exp, question: EvalQuestion):
+    return generate_prompt(question, exp.phases["generate-cypher"])
+
+
+def analyze_question(exp, question: EvalQuestion):
+    answer = None
+    sequences = []
+    try:
+        logger.info(f"\n=======================\nQuestion: {question.question}\n")
+        cxt = AgentContext(exp.phases["generate-cypher"])
+
+        prompt = cypher_generation_prompt(exp, question)
+
+        cxt.initialize_agent(prompt)
+        success, answer = cxt.run()
+        logger.info(f"\nLLM Intermediate Answer: {answer}\n")
+
+        cypher_generation_sequence = AgentSequence(
+            description="cypher-producing-agent",
+            responses=cxt.get_agent_responses(),
+        )
+        sequences = [cypher_generation_sequence]
+
+        success, query_result = query_db(exp.dsg_interface, answer)
+
+        cxt2 = AgentContext(exp.phases["refine"])
+        refinement_prompt = generate_prompt(
+            question,
+            exp.phases["refine"],
+            {"cypher_results": query_result, "cypher_query": answer},
         )
-        analyzed_questions.append(aq)
 
-    aqs = AnalyzedQuestions(analyzed_questions=analyzed_questions)
-    return aqs
+        cxt2.initialize_agent(refinement_prompt)
+        success, answer = cxt2.run()
+        logger.info(f"LLM Final Answer: {answer}")
+
+        valid_format, correct = evaluate_answer(
+            question.correctness_comparator, answer, question.solution
+        )
+
+        logger.info(f"\n\nCorrect? {correct}\n\n")
+
+        refinement_sequence = AgentSequence(
+            description="refinement-agent", responses=cxt2.get_agent_responses()
+        )
+
+        sequences = [cypher_generation_sequence, refinement_sequence]
+
+        n_input_tokens = cxt.initial_input_tokens + cxt2.initial_input_tokens
+        n_output_tokens = cxt.total_output_tokens + cxt2.total_output_tokens
+
+        analysis = QuestionAnalysis(
+            correct=correct,
+            valid_answer_format=valid_format,
+            input_tokens=n_input_tokens,
+            output_tokens=n_output_tokens,
+            n_tool_calls=cxt.n_tool_calls + cxt2.n_tool_calls,  # Should be 0...
+            cached_input_tokens=cxt.cached_input_tokens + cxt2.cached_input_tokens,
+            cache_write_input_tokens=(
+                cxt.cache_write_input_tokens + cxt2.cache_write_input_tokens
+            ),
+            shaped_tool_results=cxt.shaped_tool_results + cxt2.shaped_tool_results,
+        )
+
+    except INFRASTRUCTURE_ERRORS:
+        # Not the question's fault, it is asked again when the run is resumed
+        raise
+    except Exception as ex:
+        print(ex)
+        logger.error("Bad Question!")
+        logger.error(str(ex))
+        analysis = QuestionAnalysis(
+            correct=False,
+            valid_answer_format=False,
+            input_tokens=0,
+            output_tokens=0,
+            n_tool_calls=0,
+        )
+
+    return AnalyzedQuestion(
+        question=question, answer=answer, sequences=sequences, analysis=analysis
+    )
+
+
+def feedforward_cypher(exp):
+    return run_questions(exp, partial(analyze_question, exp))
 
 
 cypher_phase = PipelinePhase(
@@ -134,6 +151,8 @@ d = PipelineDescription(
     description="Single cypher query, then refinement",
     phases=[cypher_phase, refine_phase],
     function=feedforward_cypher,
+    batch_phase="generate-cypher",
+    batch_prompt=cypher_generation_prompt,
 )
 
 register_pipeline(d)
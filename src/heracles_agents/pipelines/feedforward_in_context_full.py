@@ -1,5 +1,6 @@
 import copy
 import logging
+from functools import partial
 
 from heracles_agents.experiment_definition import (
     PipelineDescription,
@@ -10,14 +11,17 @@ from heracles_agents.llm_interface import (
     AgentContext,
     AgentSequence,
     AnalyzedQuestion,
-    AnalyzedQuestions,
     EvalQuestion,
     LlmAgent,
     QuestionAnalysis,
 )
 from heracles_agents.pipelines.comparisons import evaluate_answer
-from heracles_agents.pipelines.in_context_utils import scene_graph_to_prompt_full
+from heracles_agents.pipelines.dsg_subgraph import describe_dsg_for_question
 from heracles_agents.pipelines.prompt_utils import get_answer_formatting_guidance
+from heracles_agents.pipelines.question_executor import (
+    INFRASTRUCTURE_ERRORS,
+    run_questions,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,13 +34,17 @@ def generate_prompt(
 ):
     prompt = copy.deepcopy(agent_config.agent_info.prompt_settings.base_prompt)
 
-    dsg_desciption = scene_graph_to_prompt_full(
-        incontext_dsg_interface.get_dsg(),
-        incontext_dsg_interface.get_place_layer_name(),
+    dsg_desciption, dsg_subgraph = describe_dsg_for_question(
+        incontext_dsg_interface,
+        question.question,
+        agent_config.model_info.model,
+        place_layer_name=incontext_dsg_interface.get_place_layer_name(),
+        encoding=incontext_dsg_interface.dsg_encoding,
     )
     try:
-        prompt.novel_instruction = prompt.novel_instruction_template.format(
-            question=question.question, dsg_description=dsg_desciption
+        # The scene graph goes into the (cacheable) context of the instruction
+        prompt.format_novel_instruction(
+            question.question, dsg_description=dsg_desciption
         )
     except KeyError as ex:
         logger.error("Novel instruction template has unfilled parameter!")
@@ -50,58 +58,73 @@ def generate_prompt(
 
     print("prompt: ")
     print(prompt)
+    return prompt, dsg_subgraph
+
+
+def in_context_prompt(exp, question: EvalQuestion):
+    prompt, _ = generate_prompt(exp.dsg_interface, question, exp.phases["main"])
     return prompt
 
 
-def incontext_dsg(exp):
-    analyzed_questions = []
-    for question in exp.questions:
-        try:
-            cxt = AgentContext(exp.phases["main"])
-
-            prompt = generate_prompt(exp.dsg_interface, question, exp.phases["main"])
-
-            cxt.initialize_agent(prompt)
-            success, answer = cxt.run()
-            logger.info(f"\nLLM Final Answer: {answer}\n")
-
-            sequence = AgentSequence(
-                description="in-context pipeline", responses=cxt.get_agent_responses()
-            )
-
-            valid_format, correct = evaluate_answer(
-                question.correctness_comparator, answer, question.solution
-            )
-
-            logger.info(f"\n\nCorrect? {correct}\n\n")
-
-            analysis = QuestionAnalysis(
-                correct=correct,
-                valid_answer_format=valid_format,
-                input_tokens=cxt.initial_input_tokens,
-                output_tokens=cxt.total_output_tokens,
-                n_tool_calls=cxt.n_tool_calls,
-            )
-
-        except Exception as ex:
-            print(ex)
-            logger.error("Bad Question!")
-            logger.error(str(ex))
-            analysis = QuestionAnalysis(
-                correct=False,
-                valid_answer_format=False,
-                input_tokens=0,
-                output_tokens=0,
-                n_tool_calls=0,
-            )
-
-        aq = AnalyzedQuestion(
-            question=question, answer=answer, sequences=[sequence], analysis=analysis
+def analyze_question(exp, question: EvalQuestion):
+    answer = None
+    sequences = []
+    try:
+        cxt = AgentContext(exp.phases["main"])
+
+        prompt, dsg_subgraph = generate_prompt(
+            exp.dsg_interface, question, exp.phases["main"]
+        )
+
+        cxt.initialize_agent(prompt)
+        success, answer = cxt.run()
+        logger.info(f"\nLLM Final Answer: {answer}\n")
+
+        sequence = AgentSequence(
+            description="in-context pipeline", responses=cxt.get_agent_responses()
+        )
+        sequences = [sequence]
+
+        valid_format, correct = evaluate_answer(
+            question.correctness_comparator, answer, question.solution
+        )
+
+        logger.info(f"\n\nCorrect? {correct}\n\n")
+
+        analysis = QuestionAnalysis(
+            correct=correct,
+            valid_answer_format=valid_format,
+            input_tokens=cxt.initial_input_tokens,
+            output_tokens=cxt.total_output_tokens,
+            n_tool_calls=cxt.n_tool_calls,
+            shaped_tool_results=cxt.shaped_tool_results,
+            cached_input_tokens=cxt.cached_input_tokens,
+            cache_write_input_tokens=cxt.cache_write_input_tokens,
+            dsg_subgraph=dsg_subgraph,
+        )
+
+    except INFRASTRUCTURE_ERRORS:
+        # Not the question's fault, it is asked again when the run is resumed
+        raise
+    except Exception as ex:
+        print(ex)
+        logger.error("Bad Question!")
+        logger.error(str(ex))
+        analysis = QuestionAnalysis(
+            correct=False,
+            valid_answer_format=False,
+            input_tokens=0,
+            output_tokens=0,
+            n_tool_calls=0,
         )
-        analyzed_questions.append(aq)
 
-    aqs = AnalyzedQuestions(analyzed_questions=analyzed_questions)
-    return aqs
+    return AnalyzedQuestion(
+        question=question, answer=answer, sequences=sequences, analysis=analysis
+    )
+
+
+def incontext_dsg(exp):
+    return run_questions(exp, partial(analyze_question, exp))
 
 
 main_phase = PipelinePhase(
@@ -114,6 +137,8 @@ d = PipelineDescription(
     description="in-context scene graph",
     phases=[main_phase],
     function=incontext_dsg,
+    batch_phase="main",
+    batch_prompt=in_context_prompt,
 )
 
 register_pipeline(d)
@@ -0,0 +1,129 @@
+"""Caches for generated code that is run more than once.
+
+Models often write the same `solve_task` program again, across retries,
+sampled runs and configurations. `CompiledCodeCache` keeps the compiled code
+of every program that a process ran, and `CodeResultCache` keeps the results
+of deterministic programs that ran on their own copy of a scene graph, so the
+same program on the same scene graph file is only run once.
+"""
+
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def code_hash(python_code):
+    """Hash of a program that ignores comments and formatting"""
+    try:
+        normalized = ast.dump(ast.parse(python_code))
+    except (SyntaxError, ValueError):
+        normalized = "\n".join(
+            line.rstrip() for line in python_code.strip().splitlines()
+        )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+# Modules and functions whose results change from one run of a program to the next
+NONDETERMINISTIC_NAMES = {
+    "random",
+    "secrets",
+    "uuid",
+    "time",
+    "datetime",
+    "urandom",
+    "getpid",
+}
+
+
+def _referenced_names(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            yield node.id
+        elif isinstance(node, ast.Attribute):
+            yield node.attr
+        elif isinstance(node, ast.alias):
+            yield from node.name.split(".")
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            yield from node.module.split(".")
+
+
+def is_deterministic(python_code):
+    """False for programs that use randomness, the clock or the process, whose results can't be reused.
+
+    Set iteration order isn't a concern: results are only kept by this
+    process, and the workers it runs code in share one hash seed.
+    """
+    try:
+        tree = ast.parse(python_code)
+    except (SyntaxError, ValueError):
+        return False
+    return NONDETERMINISTIC_NAMES.isdisjoint(_referenced_names(tree))
+
+
+class CompiledCodeCache:
+    """Code objects of the programs this process ran, by their source.
+
+    Only the most recently used programs are kept.
+    """
+
+    max_entries = 256
+    # source -> code object
+    code = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, python_code):
+        with cls._lock:
+            code = cls.code.get(python_code)
+            if code is not None:
+                cls.code.move_to_end(python_code)
+                return code
+        # Raises SyntaxError for invalid code, which isn't cached
+        code = compile(python_code, "<generated code>", "exec")
+        with cls._lock:
+            cls.code[python_code] = code
+            while len(cls.code) > cls.max_entries:
+                cls.code.popitem(last=False)
+        return code
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.code.clear()
+
+
+class CodeResultCache:
+    """Results of deterministic programs that ran successfully on a copy of a scene graph.
+
+    Keys combine the program's `code_hash` with the content hash of the scene
+    graph files it ran on (and anything else that changes the result). Only
+    the most recently used results are kept.
+    """
+
+    max_entries = 1024
+    # key -> result
+    results = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key):
+        """The cached result for `key`, and whether there was one"""
+        with cls._lock:
+            if key not in cls.results:
+                return False, None
+            cls.results.move_to_end(key)
+            return True, cls.results[key]
+
+    @classmethod
+    def put(cls, key, result):
+        with cls._lock:
+            cls.results[key] = result
+            cls.results.move_to_end(key)
+            while len(cls.results) > cls.max_entries:
+                cls.results.popitem(last=False)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.results.clear()
@@ -4,168 +4,622 @@
 #
 # We want to test with a prompt that accurately reflects the hierarchy of the ontology
 # The entry function for that is: `scene_graph_to_prompt_full`
+#
+# Every encoder takes an optional `SceneGraphStrings`, which resolves node ids and
+# semantic labels to strings once per scene graph, and an optional hierarchy index
+# to look up parents and siblings. The scene graph encoders share both across all
+# nodes and join the node strings once, so encoding is linear in the size of the
+# graph.
+#
+# The scene graph encoders don't read the nodes one at a time: they take the ids,
+# positions and semantic labels of a whole layer from `DsgArraysRegistry` and
+# format them in bulk. The per-node encoders produce the same lines, for encoding
+# single nodes.
+#
+# Every scene graph encoder also has a streaming version (`iter_...`) that yields
+# the encoding in chunks of lines, layer by layer, so that very large graphs can
+# be token counted or truncated (see `heracles_agents.token_utils`) without
+# building the whole string.
 
+import re
+
+import numpy as np
 import spark_dsg
 
+from heracles_agents.pipelines.dsg_arrays import DsgArraysRegistry, node_symbols
+from heracles_agents.pipelines.dsg_hierarchy import DsgHierarchyRegistry
+
 
 class PromptingFailure(Exception):
     pass
 
 
+OBJECT_LAYER_ID = 2
+ROOM_LAYER_ID = 4
+LABELSPACE_NAMES = {OBJECT_LAYER_ID: "object", ROOM_LAYER_ID: "room"}
+
+
+# Node lines per chunk yielded by the streaming encoders
+STREAM_CHUNK_LINES = 512
+
+
+class SceneGraphStrings:
+    """Node symbols and semantic categories of a scene graph, each looked up once.
+
+    Many nodes reference the same parents and siblings, so their symbols are
+    kept in a table instead of fetching the node from the scene graph again for
+    every reference.
+    """
+
+    def __init__(self, scene_graph):
+        self.scene_graph = scene_graph
+        self._symbols = {}
+        self._labelspaces = {}
+        self._categories = {}
+
+    def symbol(self, node_id):
+        symbol = self._symbols.get(node_id)
+        if symbol is None:
+            symbol = spark_dsg.NodeSymbol(node_id).str(True)
+            self._symbols[node_id] = symbol
+        return symbol
+
+    def symbols(self, node_ids):
+        """Symbols of an array of node ids, computed in bulk"""
+        node_ids = node_ids.tolist()
+        symbols = node_symbols(node_ids)
+        self._symbols.update(zip(node_ids, symbols))
+        return symbols
+
+    def symbol_set(self, node_ids):
+        """The symbols of `node_ids` written like a set, or "none" if there are none.
+
+        The symbols are sorted, since the order of a set's repr depends on the
+        hash seed, which would change the prompt (and miss the provider's
+        prompt cache) from one process to the next.
+        """
+        symbols = sorted({self.symbol(node_id) for node_id in node_ids})
+        if not symbols:
+            return "none"
+        return "{" + ", ".join(repr(symbol) for symbol in symbols) + "}"
+
+    def labelspace(self, layer_id):
+        labelspace = self._labelspaces.get(layer_id)
+        if labelspace is None:
+            labelspace = self.scene_graph.get_labelspace(layer_id, 0)
+            if not labelspace:
+                raise PromptingFailure(
+                    f"No available {LABELSPACE_NAMES.get(layer_id, 'layer')} labelspace"
+                )
+            self._labelspaces[layer_id] = labelspace
+        return labelspace
+
+    def category(self, layer_id, semantic_label):
+        key = (layer_id, semantic_label)
+        category = self._categories.get(key)
+        if category is None:
+            category = self.labelspace(layer_id).get_category(semantic_label)
+            self._categories[key] = category
+        return category
+
+    def categories(self, layer_id, semantic_labels):
+        """Categories of an array of semantic labels, each distinct label looked up once"""
+        semantic_labels = semantic_labels.tolist()
+        categories = {
+            label: self.category(layer_id, label) for label in set(semantic_labels)
+        }
+        return [categories[label] for label in semantic_labels]
+
+
+def layer_blocks(scene_graph, layer, node_ids=None, chunk_lines=STREAM_CHUNK_LINES):
+    """Arrays of the nodes of a layer (optionally only the ones in `node_ids`), `chunk_lines` nodes at a time"""
+    if node_ids is not None and not node_ids:
+        return
+    arrays = DsgArraysRegistry.get(scene_graph, layer).select(node_ids)
+    for start in range(0, len(arrays), chunk_lines):
+        yield arrays[start : start + chunk_lines]
+
+
 """ Methods for encoding a scene graph with ONLY Objects and Regions/Rooms """
 
 
 def get_position_string(attrs):
-    return f"({attrs.position[0]:.2f},{attrs.position[1]:.2f},{attrs.position[2]:.2f})"
-
-
-def get_room_parents_of_object(object_node, scene_graph):
-    """Method to return the string of the object node's grandparent room; this requires traversing the intermediate place layer"""
-    # Get the parents; returns a set of gtsam ids
-    parent_place_gtsam_ids = object_node.parents()
-    if not parent_place_gtsam_ids:
-        return "none"
-    # Get the parent rooms
-    parent_room_node_ids = set()
-    for parent_place_gtsam_id in parent_place_gtsam_ids:
-        parent_place_node = scene_graph.get_node(parent_place_gtsam_id)
-        parent_room_gtsam_ids = parent_place_node.parents()
-        if not parent_room_gtsam_ids:
-            continue
-        for parent_room_gtsam_id in parent_room_gtsam_ids:
-            parent_room_node = scene_graph.get_node(parent_room_gtsam_id)
-            parent_room_node_ids.add(parent_room_node.id.str(True))
-    if not parent_room_node_ids:
-        return "none"
-    return parent_room_node_ids
-
-
-def room_to_string(room_node, scene_graph):
-    attrs = room_node.attributes
-    symbol = room_node.id.str(True)
-    room_labelspace = scene_graph.get_labelspace(4, 0)
-    if not room_labelspace:
-        raise PromptingFailure("No available room labelspace")
-    semantic_type = room_labelspace.get_category(attrs.semantic_label)
-    room_string = f"\n-\t(id={symbol}, type={semantic_type})"
-    return room_string
+    # Every access to attrs.position converts the position to a new array
+    x, y, z = attrs.position
+    return f"({x:.2f},{y:.2f},{z:.2f})"
+
+
+def position_strings(positions):
+    """`get_position_string` of every row of an (n, 3) array of positions"""
+    # A single format call for all of the rows
+    text = ("(%.2f,%.2f,%.2f)\n" * len(positions)) % tuple(positions.ravel().tolist())
+    return text.split("\n")[:-1]
+
+
+def get_room_parents_of_object(object_node, scene_graph, strings=None, index=None):
+    """Method to return the string of the object node's grandparent room; the index has already traversed the intermediate place layer"""
+    if strings is None:
+        strings = SceneGraphStrings(scene_graph)
+    if index is None:
+        index = DsgHierarchyRegistry.get(scene_graph)
+    return strings.symbol_set(index.rooms_of_object(object_node.id.value))
+
+
+def format_room(symbol, semantic_type):
+    return f"\n-\t(id={symbol}, type={semantic_type})"
+
+
+def room_to_string(room_node, scene_graph, strings=None):
+    if strings is None:
+        strings = SceneGraphStrings(scene_graph)
+    symbol = strings.symbol(room_node.id.value)
+    semantic_type = strings.category(ROOM_LAYER_ID, room_node.attributes.semantic_label)
+    return format_room(symbol, semantic_type)
+
+
+def format_object_room_parent(symbol, semantic_type, position, parent_rooms):
+    return f"\n-\t(id={symbol}, type={semantic_type}, pos={position}, parent_rooms={parent_rooms})"
 
 
-def object_to_string_room_parent(object_node, scene_graph):
+def object_to_string_room_parent(object_node, scene_graph, strings=None, index=None):
     """Method to return the stirng of an object node; excludes the parent place and directly encodes the grandparent room"""
+    if strings is None:
+        strings = SceneGraphStrings(scene_graph)
     attrs = object_node.attributes
-    symbol = object_node.id.str(True)
-    object_labelspace = scene_graph.get_labelspace(2, 0)
-    if not object_labelspace:
-        raise PromptingFailure("No available object labelspace")
-    semantic_type = object_labelspace.get_category(attrs.semantic_label)
+    symbol = strings.symbol(object_node.id.value)
+    semantic_type = strings.category(OBJECT_LAYER_ID, attrs.semantic_label)
     position = get_position_string(attrs)
-    parent_rooms = get_room_parents_of_object(object_node, scene_graph)
-    object_string = f"\n-\t(id={symbol}, type={semantic_type}, pos={position}, parent_rooms={parent_rooms})"
-    return object_string
-
-
-def scene_graph_to_prompt(scene_graph):
-    """Method to produce a text encoding of a spark_dsg DynamicSceneGraph. This excludes 2D places and directly encodes a connection from objects to rooms"""
-    # Add the objects
-    objects_string = ""
-    for object_node in scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes:
-        objects_string += object_to_string_room_parent(
-            object_node, scene_graph
-        )  # Use the method that skips the place parent node
-    # Add the rooms
-    rooms_string = ""
-    for room_node in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes:
-        rooms_string += room_to_string(room_node, scene_graph)
-    # Compose the strings into a single text encoding
-    scene_graph_string = (
-        f"<Scene Graph>\nObjects: {objects_string}\nRooms: {rooms_string}</Scene Graph>"
+    parent_rooms = get_room_parents_of_object(object_node, scene_graph, strings, index)
+    return format_object_room_parent(symbol, semantic_type, position, parent_rooms)
+
+
+def object_lines_room_parent(block, strings, index):
+    """`object_to_string_room_parent` of every object in a block of layer arrays"""
+    return (
+        format_object_room_parent(
+            symbol,
+            semantic_type,
+            position,
+            strings.symbol_set(index.rooms_of_object(object_id)),
+        )
+        for object_id, symbol, semantic_type, position in zip(
+            block.ids.tolist(),
+            strings.symbols(block.ids),
+            strings.categories(OBJECT_LAYER_ID, block.labels),
+            position_strings(block.positions),
+        )
     )
-    return scene_graph_string
+
+
+def room_lines(block, strings, index=None):
+    """`room_to_string` of every room in a block of layer arrays"""
+    return map(
+        format_room,
+        strings.symbols(block.ids),
+        strings.categories(ROOM_LAYER_ID, block.labels),
+    )
+
+
+def iter_scene_graph_to_prompt(
+    scene_graph, node_ids=None, chunk_lines=STREAM_CHUNK_LINES
+):
+    """Streaming version of `scene_graph_to_prompt`, yielding the encoding in chunks"""
+    strings = SceneGraphStrings(scene_graph)
+    index = DsgHierarchyRegistry.get(scene_graph)
+    yield "<Scene Graph>\nObjects: "
+    # Add the objects, with the method that skips the place parent node
+    for block in layer_blocks(
+        scene_graph, spark_dsg.DsgLayers.OBJECTS, node_ids, chunk_lines
+    ):
+        yield "".join(object_lines_room_parent(block, strings, index))
+    # Add the rooms
+    yield "\nRooms: "
+    for block in layer_blocks(
+        scene_graph, spark_dsg.DsgLayers.ROOMS, node_ids, chunk_lines
+    ):
+        yield "".join(room_lines(block, strings))
+    yield "</Scene Graph>"
+
+
+def scene_graph_to_prompt(scene_graph, node_ids=None):
+    """Method to produce a text encoding of a spark_dsg DynamicSceneGraph. This excludes 2D places and directly encodes a connection from objects to rooms
+
+    If `node_ids` is given, only those nodes are encoded.
+    """
+    return "".join(iter_scene_graph_to_prompt(scene_graph, node_ids))
 
 
 """ Methods for encoding a scene graph with Objects, Places, and Regions/Rooms """
 
 
-def room_to_string_full(room_node, scene_graph):
+def format_room_full(symbol, semantic_type, position, siblings):
+    return (
+        f"\n-\t(id={symbol}, type={semantic_type}, pos={position}, siblings={siblings})"
+    )
+
+
+def room_to_string_full(room_node, scene_graph, strings=None, index=None):
     """Method to compose a string encoding of a room: unique id, semantic type, and position"""
+    if strings is None:
+        strings = SceneGraphStrings(scene_graph)
     attrs = room_node.attributes
-    symbol = room_node.id.str(True)
-    room_labelspace = scene_graph.get_labelspace(4, 0)
-    if not room_labelspace:
-        raise PromptingFailure("No available room labelspace")
-    semantic_type = room_labelspace.get_category(attrs.semantic_label)
+    symbol = strings.symbol(room_node.id.value)
+    semantic_type = strings.category(ROOM_LAYER_ID, attrs.semantic_label)
     position = get_position_string(attrs)
-    # Get the siblings
-    sibling_node_ids = set()
-    sibling_gtsam_ids = room_node.siblings()
-    for sibling_gtsam_id in sibling_gtsam_ids:
-        sibling_node = scene_graph.get_node(sibling_gtsam_id)
-        sibling_node_ids.add(sibling_node.id.str(True))
-    if not sibling_node_ids:
-        sibling_node_ids = "none"
-    room_string = f"\n-\t(id={symbol}, type={semantic_type}, pos={position}, siblings={sibling_node_ids})"
-    return room_string
-
-
-def place_to_string_full(place_node, scene_graph):
+    if index is None:
+        sibling_ids = room_node.siblings()
+    else:
+        sibling_ids = index.siblings_of(room_node.id.value)
+    sibling_node_ids = strings.symbol_set(sibling_ids)
+    return format_room_full(symbol, semantic_type, position, sibling_node_ids)
+
+
+def format_place_full(symbol, siblings, parent_rooms):
+    return f"\n-\t(id={symbol}, siblings={siblings}, parent_rooms={parent_rooms})"
+
+
+def place_to_string_full(place_node, scene_graph, strings=None, index=None):
     """Method to compose a string encoding of a mesh place: unique id, sibling place unique ids, parent room/room unique ids"""
-    symbol = place_node.id.str(True)
-    # Get the siblings
-    sibling_node_ids = set()
-    sibling_gtsam_ids = place_node.siblings()
-    for sibling_gtsam_id in sibling_gtsam_ids:
-        sibling_node = scene_graph.get_node(sibling_gtsam_id)
-        sibling_node_ids.add(sibling_node.id.str(True))
-    if not sibling_node_ids:
-        sibling_node_ids = "none"
-    # Get the parents
-    parent_room_node_ids = set()
-    parent_room_gtsam_ids = place_node.parents()
-    for parent_room_gtsam_id in parent_room_gtsam_ids:
-        parent_room_node = scene_graph.get_node(parent_room_gtsam_id)
-        parent_room_node_ids.add(parent_room_node.id.str(True))
-    if not parent_room_node_ids:
-        parent_room_node_ids = "none"
-    # Compose the string
-    place_string = f"\n-\t(id={symbol}, siblings={sibling_node_ids}, parent_rooms={parent_room_node_ids})"
-    return place_string
-
-
-def object_to_string_full(object_node, scene_graph):
+    if strings is None:
+        strings = SceneGraphStrings(scene_graph)
+    place_id = place_node.id.value
+    symbol = strings.symbol(place_id)
+    if index is None:
+        sibling_ids, parent_room_ids = place_node.siblings(), place_node.parents()
+    else:
+        sibling_ids = index.siblings_of(place_id)
+        parent_room_ids = index.rooms_of_place(place_id)
+    sibling_node_ids = strings.symbol_set(sibling_ids)
+    parent_room_node_ids = strings.symbol_set(parent_room_ids)
+    return format_place_full(symbol, sibling_node_ids, parent_room_node_ids)
+
+
+def format_object_full(symbol, semantic_type, position, parent_places):
+    return f"\n-\t(id={symbol}, type={semantic_type}, pos={position}, parent_places={parent_places})"
+
+
+def object_to_string_full(object_node, scene_graph, strings=None, index=None):
     """Method to compose a string encoding an object: unique id, semantic type, position, bounding box pos/dim, parent place unique ids"""
+    if strings is None:
+        strings = SceneGraphStrings(scene_graph)
     attrs = object_node.attributes
-    symbol = object_node.id.str(True)
-    object_labelspace = scene_graph.get_labelspace(2, 0)
-    if not object_labelspace:
-        raise PromptingFailure("No available object labelspace")
-    semantic_type = object_labelspace.get_category(attrs.semantic_label)
+    symbol = strings.symbol(object_node.id.value)
+    semantic_type = strings.category(OBJECT_LAYER_ID, attrs.semantic_label)
     position = get_position_string(attrs)
-    parent_place_node_ids = set()
-    parent_place_gtsam_ids = object_node.parents()
-    for parent_place_gtsam_id in parent_place_gtsam_ids:
-        parent_place_node = scene_graph.get_node(parent_place_gtsam_id)
-        parent_place_node_ids.add(parent_place_node.id.str(True))
-    if not parent_place_node_ids:
-        parent_place_node_ids = "none"
-    # Compose the string
-    object_string = f"\n-\t(id={symbol}, type={semantic_type}, pos={position}, parent_places={parent_place_node_ids})"
-    return object_string
-
-
-def scene_graph_to_prompt_full(scene_graph, place_layer_name):
-    """Method to produce a text encoding of a spark_dsg DynamicSceneGraph. This includes 2D places."""
+    if index is None:
+        parent_place_ids = object_node.parents()
+    else:
+        parent_place_ids = index.places_of_object(object_node.id.value)
+    parent_place_node_ids = strings.symbol_set(parent_place_ids)
+    return format_object_full(symbol, semantic_type, position, parent_place_node_ids)
+
+
+def object_lines_full(block, strings, index):
+    """`object_to_string_full` of every object in a block of layer arrays"""
+    return (
+        format_object_full(
+            symbol,
+            semantic_type,
+            position,
+            strings.symbol_set(index.places_of_object(object_id)),
+        )
+        for object_id, symbol, semantic_type, position in zip(
+            block.ids.tolist(),
+            strings.symbols(block.ids),
+            strings.categories(OBJECT_LAYER_ID, block.labels),
+            position_strings(block.positions),
+        )
+    )
+
+
+def place_lines_full(block, strings, index):
+    """`place_to_string_full` of every place in a block of layer arrays"""
+    return (
+        format_place_full(
+            symbol,
+            strings.symbol_set(index.siblings_of(place_id)),
+            strings.symbol_set(index.rooms_of_place(place_id)),
+        )
+        for place_id, symbol in zip(block.ids.tolist(), strings.symbols(block.ids))
+    )
+
+
+def room_lines_full(block, strings, index):
+    """`room_to_string_full` of every room in a block of layer arrays"""
+    return (
+        format_room_full(
+            symbol,
+            semantic_type,
+            position,
+            strings.symbol_set(index.siblings_of(room_id)),
+        )
+        for room_id, symbol, semantic_type, position in zip(
+            block.ids.tolist(),
+            strings.symbols(block.ids),
+            strings.categories(ROOM_LAYER_ID, block.labels),
+            position_strings(block.positions),
+        )
+    )
+
+
+def iter_scene_graph_to_prompt_full(
+    scene_graph,
+    place_layer_name,
+    node_ids=None,
+    encoding="default",
+    chunk_lines=STREAM_CHUNK_LINES,
+):
+    """Streaming version of `scene_graph_to_prompt_full`, yielding the encoding in chunks"""
+    if encoding == "compact":
+        return iter_scene_graph_to_prompt_compact(
+            scene_graph, place_layer_name, node_ids, chunk_lines
+        )
+    if encoding != "default":
+        raise ValueError(f"Unknown scene graph encoding: {encoding}")
+    return _iter_scene_graph_to_prompt_full(
+        scene_graph, place_layer_name, node_ids, chunk_lines
+    )
+
+
+def _iter_scene_graph_to_prompt_full(
+    scene_graph, place_layer_name, node_ids, chunk_lines
+):
+    strings = SceneGraphStrings(scene_graph)
+    index = DsgHierarchyRegistry.get(scene_graph, place_layer_name)
+    yield "<Scene Graph>\nObjects: "
     # Add the objects: unique id, semantic label, position, bounding box, parent 2D place uid
-    objects_string = ""
-    for object_node in scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes:
-        objects_string += object_to_string_full(object_node, scene_graph)
+    for block in layer_blocks(
+        scene_graph, spark_dsg.DsgLayers.OBJECTS, node_ids, chunk_lines
+    ):
+        yield "".join(object_lines_full(block, strings, index))
     # Add the places: unique id, sibling ids, parent room unique id
-    places_string = ""
-    for place_node in scene_graph.get_layer(place_layer_name).nodes:
-        places_string += place_to_string_full(place_node, scene_graph)
+    yield "\nPlaces: "
+    for block in layer_blocks(scene_graph, place_layer_name, node_ids, chunk_lines):
+        yield "".join(place_lines_full(block, strings, index))
     # Add the rooms: unique id, semantic label, position
-    rooms_string = ""
-    for room_node in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes:
-        rooms_string += room_to_string_full(room_node, scene_graph)
-    scene_graph_string = f"<Scene Graph>\nObjects: {objects_string}\nPlaces: {places_string}\n Rooms: {rooms_string}\n</Scene Graph>"
-    return scene_graph_string
+    yield "\n Rooms: "
+    for block in layer_blocks(
+        scene_graph, spark_dsg.DsgLayers.ROOMS, node_ids, chunk_lines
+    ):
+        yield "".join(room_lines_full(block, strings, index))
+    yield "\n</Scene Graph>"
+
+
+def scene_graph_to_prompt_full(
+    scene_graph, place_layer_name, node_ids=None, encoding="default"
+):
+    """Method to produce a text encoding of a spark_dsg DynamicSceneGraph. This includes 2D places.
+
+    If `node_ids` is given, only those nodes are encoded. With
+    `encoding="compact"` the graph is written as tables instead (see
+    `scene_graph_to_prompt_compact`).
+    """
+    return "".join(
+        iter_scene_graph_to_prompt_full(
+            scene_graph, place_layer_name, node_ids, encoding
+        )
+    )
+
+
+""" Compact encoding of a scene graph with Objects, Places, and Regions/Rooms
+
+Each layer is a table whose columns are declared in its header. Semantic types
+are written as their label ids, with a legend of the label names, coordinates
+are rounded, and rows are grouped under a single line naming their parents
+instead of repeating the parents on every row.
+"""
+
+COMPACT_COORDINATE_DECIMALS = 1
+
+
+def get_position_string_compact(attrs, decimals=COMPACT_COORDINATE_DECIMALS):
+    # Rounding python floats is much faster than rounding numpy scalars. Adding
+    # 0.0 turns -0.0 into 0.0.
+    x, y, z = (round(v, decimals) + 0.0 for v in attrs.position.tolist())
+    return f"{x:.{decimals}f} {y:.{decimals}f} {z:.{decimals}f}"
+
+
+def position_strings_compact(positions, decimals=COMPACT_COORDINATE_DECIMALS):
+    """`get_position_string_compact` of every row of an (n, 3) array of positions"""
+    coordinate = f"%.{decimals}f"
+    text = (f"{coordinate} {coordinate} {coordinate}\n" * len(positions)) % tuple(
+        positions.ravel().tolist()
+    )
+    # Formatting rounds the same way as `round`, but keeps the sign of
+    # coordinates that round to zero
+    zero = f"{0.0:.{decimals}f}"
+    text = re.sub(rf"(?<!\S)-{re.escape(zero)}(?!\S)", zero, text)
+    return text.split("\n")[:-1]
+
+
+def symbol_list_compact(node_ids, strings, empty="-"):
+    """Sorted, comma separated symbols of `node_ids`"""
+    symbols = sorted({strings.symbol(node_id) for node_id in node_ids})
+    if not symbols:
+        return empty
+    return ",".join(symbols)
+
+
+def label_legend_compact(scene_graph, layer, layer_id, strings):
+    """`label=name` for every semantic label used in a layer"""
+    labels = np.unique(DsgArraysRegistry.get(scene_graph, layer).labels).tolist()
+    return ", ".join(f"{label}={strings.category(layer_id, label)}" for label in labels)
+
+
+def format_group_compact(parent_ids, strings):
+    return f"\n@{symbol_list_compact(parent_ids, strings, 'none')}"
+
+
+def object_group_compact(object_node, strings, index):
+    return format_group_compact(index.places_of_object(object_node.id.value), strings)
+
+
+def format_object_row_compact(symbol, semantic_label, position):
+    return f"\n{symbol} {semantic_label} {position}"
+
+
+def object_row_compact(object_node, strings):
+    attrs = object_node.attributes
+    symbol = strings.symbol(object_node.id.value)
+    return format_object_row_compact(
+        symbol, attrs.semantic_label, get_position_string_compact(attrs)
+    )
+
+
+def object_rows_compact(block, strings, index):
+    return map(
+        format_object_row_compact,
+        strings.symbols(block.ids),
+        block.labels.tolist(),
+        position_strings_compact(block.positions),
+    )
+
+
+def place_group_compact(place_node, strings, index):
+    return format_group_compact(index.rooms_of_place(place_node.id.value), strings)
+
+
+def format_place_row_compact(symbol, siblings):
+    return f"\n{symbol} {siblings}"
+
+
+def place_row_compact(place_node, strings, index):
+    place_id = place_node.id.value
+    siblings = symbol_list_compact(index.siblings_of(place_id), strings)
+    return format_place_row_compact(strings.symbol(place_id), siblings)
+
+
+def place_rows_compact(block, strings, index):
+    return (
+        format_place_row_compact(
+            symbol, symbol_list_compact(index.siblings_of(place_id), strings)
+        )
+        for place_id, symbol in zip(block.ids.tolist(), strings.symbols(block.ids))
+    )
+
+
+def format_room_row_compact(symbol, semantic_label, position, siblings):
+    return f"\n{symbol} {semantic_label} {position} {siblings}"
+
+
+def room_row_compact(room_node, strings, index):
+    attrs = room_node.attributes
+    room_id = room_node.id.value
+    siblings = symbol_list_compact(index.siblings_of(room_id), strings)
+    return format_room_row_compact(
+        strings.symbol(room_id),
+        attrs.semantic_label,
+        get_position_string_compact(attrs),
+        siblings,
+    )
+
+
+def room_rows_compact(block, strings, index):
+    return (
+        format_room_row_compact(
+            symbol,
+            semantic_label,
+            position,
+            symbol_list_compact(index.siblings_of(room_id), strings),
+        )
+        for room_id, symbol, semantic_label, position in zip(
+            block.ids.tolist(),
+            strings.symbols(block.ids),
+            block.labels.tolist(),
+            position_strings_compact(block.positions),
+        )
+    )
+
+
+def grouped_chunks_compact(
+    scene_graph,
+    layer,
+    node_ids,
+    parents_of,
+    rows_of,
+    strings,
+    index,
+    chunk_lines=STREAM_CHUNK_LINES,
+):
+    """Rows of a layer, each group's rows under the line of the group, in chunks.
+
+    Groups are the parents of a node (`parents_of(node_id)`) and are written
+    in the order they first appear, the rows of a group in layer order.
+    """
+    if node_ids is not None and not node_ids:
+        return
+    arrays = DsgArraysRegistry.get(scene_graph, layer).select(node_ids)
+    groups = {}
+    for row, node_id in enumerate(arrays.ids.tolist()):
+        group = format_group_compact(parents_of(node_id), strings)
+        groups.setdefault(group, []).append(row)
+    # Rows in the order they are written, with the group lines that go before them
+    order = np.empty(len(arrays), dtype=np.intp)
+    group_starts = {}
+    start = 0
+    for group, rows in groups.items():
+        group_starts[start] = group
+        order[start : start + len(rows)] = rows
+        start += len(rows)
+    arrays = arrays[order]
+    for start in range(0, len(arrays), chunk_lines):
+        rows = rows_of(arrays[start : start + chunk_lines], strings, index)
+        yield "".join(
+            group_starts.get(start + i, "") + row for i, row in enumerate(rows)
+        )
+
+
+def iter_scene_graph_to_prompt_compact(
+    scene_graph, place_layer_name, node_ids=None, chunk_lines=STREAM_CHUNK_LINES
+):
+    """Streaming version of `scene_graph_to_prompt_compact`, yielding the encoding in chunks"""
+    strings = SceneGraphStrings(scene_graph)
+    index = DsgHierarchyRegistry.get(scene_graph, place_layer_name)
+    objects_layer = spark_dsg.DsgLayers.OBJECTS
+    rooms_layer = spark_dsg.DsgLayers.ROOMS
+    object_legend = label_legend_compact(
+        scene_graph, objects_layer, OBJECT_LAYER_ID, strings
+    )
+    room_legend = label_legend_compact(scene_graph, rooms_layer, ROOM_LAYER_ID, strings)
+    yield (
+        "<Scene Graph format=compact>"
+        f"\nObject types: {object_legend}"
+        f"\nRoom types: {room_legend}"
+        "\nObjects [id type x y z], grouped under @parent places:"
+    )
+    yield from grouped_chunks_compact(
+        scene_graph,
+        objects_layer,
+        node_ids,
+        index.places_of_object,
+        object_rows_compact,
+        strings,
+        index,
+        chunk_lines,
+    )
+    yield "\nPlaces [id siblings], grouped under @parent rooms:"
+    yield from grouped_chunks_compact(
+        scene_graph,
+        place_layer_name,
+        node_ids,
+        index.rooms_of_place,
+        place_rows_compact,
+        strings,
+        index,
+        chunk_lines,
+    )
+    yield "\nRooms [id type x y z siblings]:"
+    for block in layer_blocks(scene_graph, rooms_layer, node_ids, chunk_lines):
+        yield "".join(room_rows_compact(block, strings, index))
+    yield "\n</Scene Graph>"
+
+
+def scene_graph_to_prompt_compact(scene_graph, place_layer_name, node_ids=None):
+    """Method to produce a compact, table based text encoding of a spark_dsg DynamicSceneGraph. This includes 2D places.
+
+    If `node_ids` is given, only those nodes are encoded (the label legends
+    always cover the whole graph).
+    """
+    return "".join(
+        iter_scene_graph_to_prompt_compact(scene_graph, place_layer_name, node_ids)
+    )
@@ -0,0 +1,137 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from heracles_agents.batch_inference import (
+    BatchRequest,
+    BatchResponseRegistry,
+    run_batch,
+)
+from heracles_agents.llm_cache import LlmCacheMiss, LlmCacheRegistry
+from heracles_agents.llm_interface import (
+    AgentContext,
+    AnalyzedQuestion,
+    AnalyzedQuestions,
+    EvalQuestion,
+)
+from heracles_agents.provider_retries import LlmRetriesExhausted
+
+logger = logging.getLogger(__name__)
+
+# Failures of the LLM provider or cache, not of the question. Pipelines don't
+# record a question that hit one as answered incorrectly; `run_questions`
+# leaves it out of the checkpoint, so that a resumed run asks it again.
+INFRASTRUCTURE_ERRORS = (LlmRetriesExhausted, LlmCacheMiss)
+
+
+def prefetch_first_turns(exp, questions: list[EvalQuestion]) -> list[str]:
+    """Answer the first LLM request of each question with one batch job.
+
+    The responses are registered with the BatchResponseRegistry, where the
+    AgentContexts of the pipeline pick them up instead of sending the request.
+    Later turns and phases are sent as usual. Returns the keys of the
+    registered responses.
+    """
+    pipeline = exp.pipeline
+    if pipeline.batch_prompt is None:
+        logger.warning(
+            f"Pipeline {pipeline.name} does not support batch inference, questions will be requested individually"
+        )
+        return []
+
+    agent = exp.phases[pipeline.batch_phase]
+    cache = LlmCacheRegistry.get_cache()
+    requests = {}
+    for question in questions:
+        try:
+            prompt = pipeline.batch_prompt(exp, question)
+        except Exception as ex:
+            # The pipeline will hit (and record) the same error for this question
+            logger.error(f"Could not generate batch prompt for {question.uid}: {ex}")
+            continue
+        cxt = AgentContext(agent)
+        cxt.initialize_agent(prompt)
+        _, tools, response_format = cxt.prepare_request(cxt.history)
+        key = cxt.request_key(tools, response_format, cxt.history)
+        if cache is not None and cache.contains(key):
+            continue
+        requests[key] = BatchRequest(
+            key, agent.model_info, tools, response_format, cxt.history
+        )
+
+    responses = run_batch(agent.client, list(requests.values()), exp.batch)
+    BatchResponseRegistry.add(responses)
+    return list(responses.keys())
+
+
+def run_questions(
+    exp,
+    analyze_question: Callable[[EvalQuestion], AnalyzedQuestion],
+    questions: list[EvalQuestion] = None,
+) -> AnalyzedQuestions:
+    """Run `analyze_question` on each question of an experiment configuration.
+
+    Questions are dispatched to a pool of `exp.n_workers` threads (LLM calls
+    are I/O bound, so threads are enough). Each call to `analyze_question` is
+    responsible for building its own AgentContext(s), since an AgentContext
+    holds the conversation history and must not be shared between questions.
+    The analyzed questions are returned in the same order as `questions`.
+
+    If a checkpoint has been attached to the configuration, questions that it
+    already contains are not re-run, and every newly analyzed question is
+    appended to the checkpoint as soon as it completes.
+
+    Questions that fail with one of the `INFRASTRUCTURE_ERRORS` are not
+    recorded. The other questions still run, and then the first of those
+    errors is raised.
+    """
+    if questions is None:
+        questions = exp.questions
+
+    checkpoint = exp.get_checkpoint()
+    completed = checkpoint.load() if checkpoint is not None else {}
+    remaining = [q for q in questions if q.uid not in completed]
+    if len(completed) > 0:
+        logger.info(
+            f"Resuming from checkpoint: {len(questions) - len(remaining)} questions already complete, {len(remaining)} remaining"
+        )
+
+    batch_keys = []
+    if exp.batch is not None and len(remaining) > 0:
+        batch_keys = prefetch_first_turns(exp, remaining)
+
+    failures = []
+
+    def analyze_and_record(question):
+        try:
+            aq = analyze_question(question)
+        except INFRASTRUCTURE_ERRORS as ex:
+            logger.error(f"Question {question.uid} failed, it was not recorded: {ex}")
+            failures.append(ex)
+            return None
+        if checkpoint is not None:
+            checkpoint.append(aq)
+        return aq
+
+    n_workers = max(1, min(exp.n_workers, len(remaining)))
+    try:
+        if n_workers == 1:
+            new_questions = [analyze_and_record(q) for q in remaining]
+        else:
+            logger.info(f"Running {len(remaining)} questions with {n_workers} workers")
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                # executor.map yields results in submission order
+                new_questions = list(executor.map(analyze_and_record, remaining))
+    finally:
+        BatchResponseRegistry.discard(batch_keys)
+
+    if failures:
+        # The other questions are checkpointed, resuming only runs the failed ones
+        logger.error(
+            f"{len(failures)} of {len(remaining)} questions failed and were not recorded"
+        )
+        raise failures[0]
+
+    analyzed_by_uid = completed | {aq.question.uid: aq for aq in new_questions}
+    analyzed_questions = [analyzed_by_uid[q.uid] for q in questions]
+    return AnalyzedQuestions(analyzed_questions=analyzed_questions)
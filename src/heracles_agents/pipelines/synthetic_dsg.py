@@ -0,0 +1,81 @@
+"""Randomly generated scene graphs with the layers used by the prompt encoders, for tests and benchmarks"""
+
+import numpy as np
+import spark_dsg
+
+OBJECT_LABELS = ["chair", "table", "sofa", "bed", "lamp", "sink", "tv", "plant"]
+ROOM_LABELS = ["kitchen", "hallway", "bedroom", "living room", "bathroom"]
+
+
+def _attributes(attribute_type, position, semantic_label=None):
+    attrs = attribute_type()
+    attrs.position = np.asarray(position, dtype=float)
+    if semantic_label is not None:
+        attrs.semantic_label = semantic_label
+    return attrs
+
+
+def make_synthetic_scene_graph(
+    n_objects,
+    n_places=None,
+    n_rooms=None,
+    place_layer_name="MESH_PLACES",
+    seed=0,
+):
+    """Scene graph of rooms, 2D places (in layer `place_layer_name`) and objects.
+
+    Rooms form a chain of siblings, and every place is connected to its
+    neighbouring place. Each place has a parent room and each object a parent
+    place, except for a few orphans so that the "none" cases are covered.
+    """
+    rng = np.random.default_rng(seed)
+    if n_places is None:
+        n_places = max(1, n_objects // 4)
+    if n_rooms is None:
+        n_rooms = max(1, n_places // 10)
+
+    G = spark_dsg.DynamicSceneGraph()
+    # 2D places are a partition of the 3D places layer
+    G.add_layer(3, 1, place_layer_name)
+    G.set_labelspace(spark_dsg.Labelspace(dict(enumerate(OBJECT_LABELS))), 2, 0)
+    G.set_labelspace(spark_dsg.Labelspace(dict(enumerate(ROOM_LABELS))), 4, 0)
+
+    room_positions = rng.uniform(-50, 50, size=(n_rooms, 3))
+    for i in range(n_rooms):
+        attrs = _attributes(
+            spark_dsg.RoomNodeAttributes, room_positions[i], i % len(ROOM_LABELS)
+        )
+        G.add_node(spark_dsg.DsgLayers.ROOMS, spark_dsg.NodeSymbol("R", i), attrs)
+        if i > 0:
+            G.insert_edge(
+                spark_dsg.NodeSymbol("R", i - 1), spark_dsg.NodeSymbol("R", i)
+            )
+
+    place_positions = rng.uniform(-50, 50, size=(n_places, 3))
+    for i in range(n_places):
+        attrs = _attributes(spark_dsg.Place2dNodeAttributes, place_positions[i])
+        G.add_node(place_layer_name, spark_dsg.NodeSymbol("P", i), attrs)
+        if i > 0:
+            G.insert_edge(
+                spark_dsg.NodeSymbol("P", i - 1), spark_dsg.NodeSymbol("P", i)
+            )
+        # Leave the last place without a room
+        if i < n_places - 1 or n_places == 1:
+            room = int(rng.integers(n_rooms))
+            G.insert_edge(spark_dsg.NodeSymbol("P", i), spark_dsg.NodeSymbol("R", room))
+
+    object_positions = rng.uniform(-50, 50, size=(n_objects, 3))
+    object_labels = rng.integers(len(OBJECT_LABELS), size=n_objects)
+    for i in range(n_objects):
+        attrs = _attributes(
+            spark_dsg.ObjectNodeAttributes, object_positions[i], int(object_labels[i])
+        )
+        G.add_node(spark_dsg.DsgLayers.OBJECTS, spark_dsg.NodeSymbol("O", i), attrs)
+        # Leave every 50th object without a place
+        if i % 50 != 49:
+            place = int(rng.integers(n_places))
+            G.insert_edge(
+                spark_dsg.NodeSymbol("O", i), spark_dsg.NodeSymbol("P", place)
+            )
+
+    return G
@@ -1,4 +1,6 @@
+import copy
 import logging
+from functools import partial
 
 import yaml
 
@@ -12,9 +14,10 @@ from heracles_agents.llm_interface import (
     AgentContext,
     AgentSequence,
     AnalyzedQuestion,
-    AnalyzedQuestions,
+    EvalQuestion,
     QuestionAnalysis,
 )
+from heracles_agents.pipelines.question_executor import run_questions
 from heracles_agents.prompt import (
     get_sldp_answer_tag_text,
     get_sldp_format_description,
@@ -25,57 +28,60 @@ from sldp.sldp_lang import parse_sldp, sldp_equals
 logger = logging.getLogger(__name__)
 
 
-def canary_pipeline(exp):
+def analyze_question(exp, question: EvalQuestion):
     cxt = AgentContext(exp.phases["main"])
 
-    analyzed_questions = []
-    for question in exp.questions:
-        prompt_obj = exp.phases["main"].agent_info.prompt_settings.base_prompt
-        prompt_obj.novel_instruction = question.question
-        formatting = get_sldp_format_description()
-        if exp.phases["main"].agent_info.prompt_settings.output_type != "SLDP_TOOL":
-            formatting += get_sldp_answer_tag_text()
-        prompt_obj.answer_formatting_guidance = formatting
-        cxt.initialize_agent(prompt_obj)
-        success, answer = cxt.run()
-        logger.info(f"\nLLM Answer: {answer}\n")
-
-        try:
-            parse_sldp(answer)
-            valid_sldp = True
-        except Exception:
-            logger.warning("Invalid SLDP")
-            valid_sldp = False
-
-        if valid_sldp:
-            correct = sldp_equals(question.solution, answer)
-        else:
-            correct = False
-        logger.info(f"\n\nCorrect? {correct}\n\n")
-
-        # In this case, there is only one agent sequence. But in the cypher-then-refine
-        # case, there are two sequences
-        agent_sequence = AgentSequence(
-            description="tool-calling-agent", responses=cxt.get_agent_responses()
-        )
-        analysis = QuestionAnalysis(
-            correct=correct,
-            valid_answer_format=valid_sldp,
-            input_tokens=cxt.total_input_tokens,
-            output_tokens=cxt.total_output_tokens,
-            n_tool_calls=cxt.n_tool_calls,
-        )
-
-        aq = AnalyzedQuestion(
-            question=question,
-            sequences=[agent_sequence],
-            analysis=analysis,
-            answer=answer,
-        )
-        analyzed_questions.append(aq)
-
-    aqs = AnalyzedQuestions(analyzed_questions=analyzed_questions)
-    return aqs
+    prompt_obj = copy.deepcopy(
+        exp.phases["main"].agent_info.prompt_settings.base_prompt
+    )
+    prompt_obj.novel_instruction = question.question
+    formatting = get_sldp_format_description()
+    if exp.phases["main"].agent_info.prompt_settings.output_type != "SLDP_TOOL":
+        formatting += get_sldp_answer_tag_text()
+    prompt_obj.answer_formatting_guidance = formatting
+    cxt.initialize_agent(prompt_obj)
+    success, answer = cxt.run()
+    logger.info(f"\nLLM Answer: {answer}\n")
+
+    try:
+        parse_sldp(answer)
+        valid_sldp = True
+    except Exception:
+        logger.warning("Invalid SLDP")
+        valid_sldp = False
+
+    if valid_sldp:
+        correct = sldp_equals(question.solution, answer)
+    else:
+        correct = False
+    logger.info(f"\n\nCorrect? {correct}\n\n")
+
+    # In this case, there is only one agent sequence. But in the cypher-then-refine
+    # case, there are two sequences
+    agent_sequence = AgentSequence(
+        description="tool-calling-agent", responses=cxt.get_agent_responses()
+    )
+    analysis = QuestionAnalysis(
+        correct=correct,
+        valid_answer_format=valid_sldp,
+        input_tokens=cxt.initial_input_tokens,
+        output_tokens=cxt.total_output_tokens,
+        n_tool_calls=cxt.n_tool_calls,
+        cached_input_tokens=cxt.cached_input_tokens,
+        cache_write_input_tokens=cxt.cache_write_input_tokens,
+        shaped_tool_results=cxt.shaped_tool_results,
+    )
+
+    return AnalyzedQuestion(
+        question=question,
+        sequences=[agent_sequence],
+        analysis=analysis,
+        answer=answer,
+    )
+
+
+def canary_pipeline(exp):
+    return run_questions(exp, partial(analyze_question, exp))
 
 
 main_phase = PipelinePhase(name="main", description="main canary phase")
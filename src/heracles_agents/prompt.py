@@ -1,5 +1,7 @@
 import logging
 import os
+import re
+import string
 from typing import List, Optional
 
 import yaml
@@ -8,6 +10,34 @@ from pydantic import BaseModel, PrivateAttr, field_validator
 logger = logging.getLogger(__name__)
 
 
+def _unparse(parts):
+    """Template text of `string.Formatter().parse` output"""
+    text = []
+    for literal, field_name, format_spec, conversion in parts:
+        text.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field_name is not None:
+            conversion = f"!{conversion}" if conversion else ""
+            format_spec = f":{format_spec}" if format_spec else ""
+            text.append(f"{{{field_name}{conversion}{format_spec}}}")
+    return "".join(text)
+
+
+def split_template(template, field):
+    """`template` split in front of its first `{field}` placeholder, or None if it has none.
+
+    Escaped braces (e.g. "{{question}}") aren't placeholders, and other
+    placeholders stay on whichever side of the split they are.
+    """
+    parts = list(string.Formatter().parse(template))
+    for i, (literal, field_name, format_spec, conversion) in enumerate(parts):
+        # The field name may be followed by attribute or index lookups
+        if field_name is not None and re.split(r"[.\[]", field_name)[0] == field:
+            head = parts[:i] + [(literal, None, None, None)]
+            tail = [("", field_name, format_spec, conversion)] + parts[i + 1 :]
+            return _unparse(head), _unparse(tail)
+    return None
+
+
 class InContextExample(BaseModel):
     user: str
     assistant: str
@@ -43,6 +73,36 @@ class InContextExample(BaseModel):
         return parts
 
 
+def add_anthropic_cache_control(message):
+    content = message["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = content[:-1] + [{**content[-1], "cache_control": {"type": "ephemeral"}}]
+    return {**message, "content": content}
+
+
+def add_bedrock_cache_point(message):
+    return {
+        **message,
+        "content": message["content"] + [{"cachePoint": {"type": "default"}}],
+    }
+
+
+def _content_blocks(content):
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return content
+
+
+def join_messages(first, second):
+    """One message with the content blocks of both messages"""
+    return {
+        **first,
+        "content": _content_blocks(first["content"])
+        + _content_blocks(second["content"]),
+    }
+
+
 class Prompt(BaseModel):
     system: str
     interface_description: Optional[str] = None
@@ -53,6 +113,8 @@ class Prompt(BaseModel):
     in_context_examples_preamble: Optional[str] = None
     in_context_examples: Optional[List[InContextExample]] = None
     novel_instruction_preamble: Optional[str] = None
+    # Question-independent start of the novel instruction (see format_novel_instruction)
+    novel_instruction_context: Optional[str] = None
     novel_instruction: Optional[str] = None
     novel_instruction_template: Optional[str] = None
     answer_semantic_guidance: Optional[str] = None
@@ -93,216 +155,166 @@ class Prompt(BaseModel):
                 return loaded_data
         return value
 
-    def to_openai_json(self, novel_instruction=None):
-        # NOTE: Currently for openai we set a bunch of things as `developer`.
-        # Anthropic doesn't quite have the same notion of developer.
-        # They have a system prompt, but it's set in a different places from
-        # the normal messages, and seems meant for pretty short descriptions
-        # of what the model should be doing.
-        # For consistency, we may want to turn these `developer` roles into
-        # `user` ? This would at least make it more consistent with the Anthropic interface.
-        # I think we shouldn't worry too much about this until after we implement a third provider.
-        if self.novel_instruction is None and novel_instruction is None:
-            raise ValueError(
-                "novel_instruction must be set either at Prompt initialization or as an argument to `to_openai_json`"
-            )
-        prompt = [{"role": "developer", "content": self.system}]
+    def format_novel_instruction(self, question, **context):
+        """Fill in the novel_instruction_template for a question.
 
-        if self.scene_graph_description:
-            prompt.append(
-                {"role": "developer", "content": self.scene_graph_description}
+        Text of the template before the `{question}` placeholder (e.g. the
+        scene graph) does not depend on the question, so it is kept as the
+        novel_instruction_context. It is rendered in the same message as the
+        question, and only becomes a content block of its own (followed by a
+        cache breakpoint) when the prompt is rendered with cache breakpoints.
+        """
+        split = split_template(self.novel_instruction_template, "question")
+        if split is not None and split[0].strip():
+            head, tail = split
+            self.novel_instruction_context = head.format(**context)
+            self.novel_instruction = tail.format(question=question, **context)
+        else:
+            self.novel_instruction = self.novel_instruction_template.format(
+                question=question, **context
             )
 
-        if self.labelspace_description:
-            prompt.append({"role": "developer", "content": self.labelspace_description})
-
-        if self.interface_description:
-            prompt.append({"role": "developer", "content": self.interface_description})
+    def _prompt_parts(self, novel_instruction, method_name):
+        """Split the prompt into its static, context and question parts.
 
-        if self.domain_description:
-            prompt.append({"role": "developer", "content": self.domain_description})
+        Each part is a list of (role, value) pairs. The role is "instruction"
+        for guidance to the model and "user" for the question, and the value is
+        a string or an InContextExample. The static part only depends on the
+        prompt file, and the context part only on the scene, so both render to
+        the same bytes for every question and form a prefix that providers can
+        cache. The context part is at most the novel_instruction_context, which
+        starts the message of the question.
+        """
+        if self.novel_instruction is None and novel_instruction is None:
+            raise ValueError(
+                f"novel_instruction must be set either at Prompt initialization or as an argument to `{method_name}`"
+            )
+        static = [("instruction", self.system)]
+        for description in (
+            self.scene_graph_description,
+            self.labelspace_description,
+            self.interface_description,
+            self.domain_description,
+        ):
+            if description:
+                static.append(("instruction", description))
 
         if self._api_prompt:
             logger.debug(f"Using API prompt: {self._api_prompt}")
-            prompt.append({"role": "developer", "content": self._api_prompt})
+            static.append(("instruction", self._api_prompt))
 
         if self.tool_description:
-            prompt.append({"role": "developer", "content": self.tool_description})
+            static.append(("instruction", self.tool_description))
 
         if self.in_context_examples_preamble:
-            prompt.append(
-                {
-                    "role": "developer",
-                    "content": self.in_context_examples_preamble,
-                }
-            )
+            static.append(("instruction", self.in_context_examples_preamble))
 
         if self.in_context_examples:
             logger.info(
                 f"Adding {len(self.in_context_examples)} in-context examples to prompt"
             )
-            for e in self.in_context_examples:
-                prompt += e.to_openai_json()
+            static += [("instruction", e) for e in self.in_context_examples]
 
         if self.novel_instruction_preamble:
-            prompt.append(
-                {"role": "developer", "content": self.novel_instruction_preamble}
-            )
-
-        if novel_instruction:
-            if self.novel_instruction:
-                logger.warning(
-                    f"Overriding default novel instruction `{self.novel_instruction}` with new instruction `{novel_instruction}`"
-                )
-            prompt.append({"role": "user", "content": novel_instruction})
-        elif self.novel_instruction:
-            prompt.append({"role": "user", "content": self.novel_instruction})
-
-        if self.answer_semantic_guidance:
-            prompt.append(
-                {"role": "developer", "content": self.answer_semantic_guidance}
-            )
-
-        if self.answer_formatting_guidance:
-            prompt.append(
-                {"role": "developer", "content": self.answer_formatting_guidance}
-            )
-
-        return prompt
-
-    def to_anthropic_json(self, novel_instruction=None):
-        if self.novel_instruction is None and novel_instruction is None:
-            raise ValueError(
-                "novel_instruction must be set either at Prompt initialization or as an argument to `to_anthropic_json`"
-            )
-        prompt = [{"role": "user", "content": self.system}]
-
-        if self.scene_graph_description:
-            prompt.append({"role": "user", "content": self.scene_graph_description})
-
-        if self.labelspace_description:
-            prompt.append({"role": "user", "content": self.labelspace_description})
-
-        if self.interface_description:
-            prompt.append({"role": "user", "content": self.interface_description})
-
-        if self.domain_description:
-            prompt.append({"role": "user", "content": self.domain_description})
-
-        if self._api_prompt:
-            logger.debug(f"Using API prompt: {self._api_prompt}")
-            prompt.append({"role": "user", "content": self._api_prompt})
+            static.append(("instruction", self.novel_instruction_preamble))
 
-        if self.tool_description:
-            prompt.append({"role": "user", "content": self.tool_description})
-
-        if self.in_context_examples_preamble:
-            prompt.append(
-                {
-                    "role": "user",
-                    "content": self.in_context_examples_preamble,
-                }
-            )
-
-        if self.in_context_examples:
-            for e in self.in_context_examples:
-                prompt += e.to_openai_json()
-
-        if self.novel_instruction_preamble:
-            prompt.append({"role": "user", "content": self.novel_instruction_preamble})
+        context = []
+        if self.novel_instruction_context:
+            context.append(("user", self.novel_instruction_context))
 
+        question = []
         if novel_instruction:
             if self.novel_instruction:
                 logger.warning(
                     f"Overriding default novel instruction `{self.novel_instruction}` with new instruction `{novel_instruction}`"
                 )
-            prompt.append({"role": "user", "content": novel_instruction})
+            question.append(("user", novel_instruction))
         elif self.novel_instruction:
-            prompt.append({"role": "user", "content": self.novel_instruction})
+            question.append(("user", self.novel_instruction))
 
         if self.answer_semantic_guidance:
-            prompt.append({"role": "user", "content": self.answer_semantic_guidance})
+            question.append(("instruction", self.answer_semantic_guidance))
 
         if self.answer_formatting_guidance:
-            prompt.append({"role": "user", "content": self.answer_formatting_guidance})
-
+            question.append(("instruction", self.answer_formatting_guidance))
+
+        return static, context, question
+
+    def _render(
+        self,
+        novel_instruction,
+        method_name,
+        render_text,
+        render_example,
+        add_cache_breakpoint=None,
+    ):
+        static, context, question = self._prompt_parts(novel_instruction, method_name)
+        prompt = []
+        for role, value in static:
+            if isinstance(value, InContextExample):
+                prompt += render_example(value)
+            else:
+                prompt.append(render_text(role, value))
+        # Mark the end of the static and context parts, so that they are cached
+        # separately (questions about another scene share the former)
+        if add_cache_breakpoint is not None and static:
+            prompt[-1] = add_cache_breakpoint(prompt[-1])
+
+        if context:
+            # The context is the start of the novel instruction's message
+            _, context_text = context[0]
+            instruction = ""
+            if question and question[0][0] == "user":
+                _, instruction = question.pop(0)
+            if add_cache_breakpoint is None:
+                # The same message as the whole template renders to
+                prompt.append(render_text("user", context_text + instruction))
+            else:
+                message = add_cache_breakpoint(render_text("user", context_text))
+                if instruction:
+                    message = join_messages(message, render_text("user", instruction))
+                prompt.append(message)
+        for role, value in question:
+            prompt.append(render_text(role, value))
         return prompt
 
-    def to_bedrock_json(self, novel_instruction=None):
-        if self.novel_instruction is None and novel_instruction is None:
-            raise ValueError(
-                "novel_instruction must be set either at Prompt initialization or as an argument to `to_anthropic_json`"
-            )
-        prompt = [{"role": "user", "content": [{"text": self.system}]}]
-
-        if self.scene_graph_description:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.scene_graph_description}]}
-            )
-
-        if self.labelspace_description:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.labelspace_description}]}
-            )
-
-        if self.interface_description:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.interface_description}]}
-            )
-
-        if self.domain_description:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.domain_description}]}
-            )
-
-        if self._api_prompt:
-            logger.debug(f"Using API prompt: {self._api_prompt}")
-            prompt.append({"role": "user", "content": [{"text": self._api_prompt}]})
-
-        if self.tool_description:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.tool_description}]}
-            )
-
-        if self.in_context_examples_preamble:
-            prompt.append(
-                {
-                    "role": "user",
-                    "content": [{"text": self.in_context_examples_preamble}],
-                }
-            )
-
-        if self.in_context_examples:
-            for e in self.in_context_examples:
-                prompt += e.to_bedrock_json()
-
-        if self.novel_instruction_preamble:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.novel_instruction_preamble}]}
-            )
-
-        if novel_instruction:
-            if self.novel_instruction:
-                logger.warning(
-                    f"Overriding default novel instruction `{self.novel_instruction}` with new instruction `{novel_instruction}`"
-                )
-            prompt.append({"role": "user", "content": [{"text": novel_instruction}]})
-        elif self.novel_instruction:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.novel_instruction}]}
-            )
-
-        if self.answer_semantic_guidance:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.answer_semantic_guidance}]}
-            )
-
-        if self.answer_formatting_guidance:
-            prompt.append(
-                {"role": "user", "content": [{"text": self.answer_formatting_guidance}]}
-            )
-
-        return prompt
+    def to_openai_json(self, novel_instruction=None):
+        # NOTE: Currently for openai we set a bunch of things as `developer`.
+        # Anthropic doesn't quite have the same notion of developer.
+        # They have a system prompt, but it's set in a different places from
+        # the normal messages, and seems meant for pretty short descriptions
+        # of what the model should be doing.
+        # For consistency, we may want to turn these `developer` roles into
+        # `user` ? This would at least make it more consistent with the Anthropic interface.
+        # I think we shouldn't worry too much about this until after we implement a third provider.
+        # OpenAI caches repeated prompt prefixes automatically, no breakpoints needed
+        return self._render(
+            novel_instruction,
+            "to_openai_json",
+            lambda role, text: {
+                "role": "developer" if role == "instruction" else "user",
+                "content": text,
+            },
+            InContextExample.to_openai_json,
+        )
+
+    def to_anthropic_json(self, novel_instruction=None, cache_breakpoints=False):
+        return self._render(
+            novel_instruction,
+            "to_anthropic_json",
+            lambda role, text: {"role": "user", "content": text},
+            InContextExample.to_openai_json,
+            add_anthropic_cache_control if cache_breakpoints else None,
+        )
+
+    def to_bedrock_json(self, novel_instruction=None, cache_breakpoints=False):
+        return self._render(
+            novel_instruction,
+            "to_bedrock_json",
+            lambda role, text: {"role": "user", "content": [{"text": text}]},
+            InContextExample.to_bedrock_json,
+            add_bedrock_cache_point if cache_breakpoints else None,
+        )
 
     def __repr__(self):
         return repr(self.to_openai_json("<Question>"))
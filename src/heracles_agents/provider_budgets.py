@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from heracles_agents.provider_retries import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderBudgetConfig(BaseModel):
+    """Limits on the requests sent to a provider (and optionally a single model).
+
+    A budget with no `model` applies to every model of that provider, in
+    addition to any model-specific budget.
+    """
+
+    provider: str  # matches the client_type of the client config, e.g. "openai"
+    model: Optional[str] = None
+    max_concurrent_requests: Optional[int] = Field(default=None, ge=1)
+    requests_per_minute: Optional[float] = Field(default=None, gt=0)
+    # Input tokens are charged before a request is sent, output tokens once the
+    # response arrives
+    tokens_per_minute: Optional[float] = Field(default=None, gt=0)
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills at `rate_per_minute`.
+
+    `take` may overdraw the bucket. The caller is told how long to wait until
+    the debt is repaid, and later callers queue up behind it, so waiting
+    callers are served in order without polling.
+    """
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate_per_s = rate_per_minute / 60.0
+        self.capacity = capacity
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._level = min(self.capacity, self._level + elapsed * self.rate_per_s)
+        self._updated = now
+
+    def take(self, amount):
+        """Take `amount` from the bucket, and return the seconds to wait before using it"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+            if self._level >= 0:
+                return 0.0
+            return -self._level / self.rate_per_s
+
+
+class ProviderBudget:
+    """Limit on in-flight requests, request rate and token rate.
+
+    Shared by threads (`reserve`) and coroutines (`areserve`), which count
+    against the same limits.
+    """
+
+    # How often a coroutine re-checks a full semaphore
+    async_poll_interval_s = 0.01
+
+    def __init__(
+        self,
+        max_concurrent_requests=None,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+    ):
+        self.max_concurrent_requests = max_concurrent_requests
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._semaphore = (
+            threading.BoundedSemaphore(max_concurrent_requests)
+            if max_concurrent_requests is not None
+            else None
+        )
+        # Requests are spaced evenly rather than sent in bursts, because
+        # providers enforce their per-minute limits over shorter windows too.
+        self._request_bucket = (
+            TokenBucket(requests_per_minute, capacity=1)
+            if requests_per_minute is not None
+            else None
+        )
+        # Allow up to a second's worth of tokens to be sent at once
+        self._token_bucket = (
+            TokenBucket(tokens_per_minute, capacity=tokens_per_minute / 60.0)
+            if tokens_per_minute is not None
+            else None
+        )
+        self._pause_lock = threading.Lock()
+        self._paused_until = 0.0
+
+    @property
+    def tracks_tokens(self):
+        return self._token_bucket is not None
+
+    def _take(self, n_tokens):
+        """Take one request and `n_tokens` tokens, and return the seconds to wait"""
+        with self._pause_lock:
+            wait_s = max(0.0, self._paused_until - time.monotonic())
+        if self._request_bucket is not None:
+            wait_s = max(wait_s, self._request_bucket.take(1))
+        if self._token_bucket is not None and n_tokens > 0:
+            wait_s = max(wait_s, self._token_bucket.take(n_tokens))
+        return wait_s
+
+    def charge_tokens(self, n_tokens):
+        """Charge tokens that were used by a request that has already been sent"""
+        if self._token_bucket is not None and n_tokens > 0:
+            self._token_bucket.take(n_tokens)
+
+    def pause(self, delay_s):
+        """Hold back every request using this budget for `delay_s` seconds"""
+        with self._pause_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay_s)
+
+    @contextmanager
+    def reserve(self, n_tokens=0):
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+        try:
+            wait_s = self._take(n_tokens)
+            if wait_s > 0:
+                time.sleep(wait_s)
+            yield self
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    @asynccontextmanager
+    async def areserve(self, n_tokens=0):
+        # Never block the event loop on the (threading) semaphore
+        if self._semaphore is not None:
+            while not self._semaphore.acquire(blocking=False):
+                await asyncio.sleep(self.async_poll_interval_s)
+        try:
+            wait_s = self._take(n_tokens)
+            if wait_s > 0:
+                await asyncio.sleep(wait_s)
+            yield self
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+
+class BudgetReservation:
+    """Handle on the budgets reserved for one request"""
+
+    def __init__(self, budgets):
+        self.budgets = budgets
+
+    def charge_tokens(self, n_tokens):
+        for budget in self.budgets:
+            budget.charge_tokens(n_tokens)
+
+
+class ProviderBudgetRegistry:
+    """Budgets shared by every agent in the process, keyed by (provider, model).
+
+    Budgets are keyed on the provider and model rather than the experiment
+    configuration, so configurations that share a provider share its limits,
+    and configurations on different providers never wait on each other.
+    """
+
+    budgets = {}
+    retry_policy = RetryPolicy()
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(
+        cls,
+        budget_configs: list[ProviderBudgetConfig],
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
+        """Replace the budgets and retry policy, e.g. those of an earlier experiment"""
+        budgets = {}
+        for c in budget_configs:
+            key = (c.provider, c.model)
+            if key in budgets:
+                logger.warning(f"Provider budget for {key} is configured twice")
+            budgets[key] = ProviderBudget(
+                c.max_concurrent_requests,
+                c.requests_per_minute,
+                c.tokens_per_minute,
+            )
+        with cls._lock:
+            # Requests that already reserved a replaced budget release it as usual
+            cls.budgets = budgets
+            cls.retry_policy = (
+                retry_policy if retry_policy is not None else RetryPolicy()
+            )
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.budgets.clear()
+            cls.retry_policy = RetryPolicy()
+
+    @classmethod
+    def get_budgets(cls, provider, model):
+        # Provider-wide budget is always acquired before the model budget, so
+        # that concurrent reservations cannot deadlock.
+        keys = [(provider, None), (provider, model)]
+        budgets = cls.budgets
+        return [budgets[k] for k in keys if k in budgets]
+
+    @classmethod
+    def tracks_tokens(cls, provider, model):
+        """True if requests to this model need to report their token counts"""
+        return any(b.tracks_tokens for b in cls.get_budgets(provider, model))
+
+    @classmethod
+    def pause(cls, provider, model, delay_s):
+        """Hold back every request to this model, e.g. after being rate limited"""
+        for budget in cls.get_budgets(provider, model):
+            budget.pause(delay_s)
+
+    @classmethod
+    @contextmanager
+    def reserve(cls, provider, model, n_tokens=0):
+        budgets = cls.get_budgets(provider, model)
+        with ExitStack() as stack:
+            for budget in budgets:
+                stack.enter_context(budget.reserve(n_tokens))
+            yield BudgetReservation(budgets)
+
+    @classmethod
+    @asynccontextmanager
+    async def areserve(cls, provider, model, n_tokens=0):
+        budgets = cls.get_budgets(provider, model)
+        async with AsyncExitStack() as stack:
+            for budget in budgets:
+                await stack.enter_async_context(budget.areserve(n_tokens))
+            yield BudgetReservation(budgets)
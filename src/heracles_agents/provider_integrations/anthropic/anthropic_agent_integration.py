@@ -23,7 +23,7 @@ logger = logging.getLogger(__name__)
 
 @dispatch
 def generate_prompt_for_agent(prompt: Prompt, agent: LlmAgent[AnthropicClientConfig]):
-    return prompt.to_anthropic_json()
+    return prompt.to_anthropic_json(cache_breakpoints=agent.client.prompt_caching)
 
 
 @dispatch
@@ -126,6 +126,9 @@ def count_message_tokens(agent: LlmAgent[AnthropicClientConfig], message: dict):
             return sum(count_message_tokens(agent, m) for m in message["content"])
         else:
             return len(enc.encode(message["content"]))
+    elif "text" in message:
+        # Text block of a prompt message (which may carry cache_control)
+        return len(enc.encode(message["text"]))
     else:
         # Tool result?
         total = 0
@@ -160,3 +163,12 @@ def count_message_tokens(agent: LlmAgent[AnthropicClientConfig], message: str):
 def get_summary_text(agent: LlmAgent[AnthropicClientConfig], message: TextBlock):
     enc = tiktoken.get_encoding("cl100k_base")
     return len(enc.encode(message.text))
+
+
+@dispatch
+def get_cache_usage(agent: LlmAgent[AnthropicClientConfig], response: Message):
+    usage = response.usage
+    return (
+        usage.cache_read_input_tokens or 0,
+        usage.cache_creation_input_tokens or 0,
+    )
@@ -1,26 +1,36 @@
+import logging
 from typing import Literal
 
 import anthropic
 from pydantic import Field, PrivateAttr, SecretStr
 from pydantic_settings import BaseSettings
 
+logger = logging.getLogger(__name__)
+
 
 class AnthropicClientConfig(BaseSettings):
     client_type: Literal["anthropic"]
     auth_key: SecretStr = Field(alias="HERACLES_ANTHROPIC_API_KEY", exclude=True)
+    # Mark the static prompt prefix with cache_control breakpoints. Cache writes
+    # cost more than uncached input tokens, so this is opt-in.
+    prompt_caching: bool = False
     _client: object = PrivateAttr()
+    _async_client: object = PrivateAttr()
 
     def __init__(self, **data):
         super().__init__(**data)
         self._client = anthropic.Anthropic(api_key=self.auth_key.get_secret_value())
+        self._async_client = anthropic.AsyncAnthropic(
+            api_key=self.auth_key.get_secret_value()
+        )
 
-    def call(self, model_info, tools, response_format, messages):
+    def make_request(self, model_info, tools, response_format, messages):
         if response_format != "text":
             raise NotImplementedError(
                 "Only `text` format is currently implemented for interfacing with Anthropic"
             )
 
-        messages = self._client.messages.create(
+        return dict(
             model=model_info.model,
             temperature=model_info.temperature,
             tools=tools,
@@ -28,4 +38,39 @@ class AnthropicClientConfig(BaseSettings):
             max_tokens=4096,
             # system=""
         )
-        return messages
+
+    def call(self, model_info, tools, response_format, messages):
+        request = self.make_request(model_info, tools, response_format, messages)
+        return self._client.messages.create(**request)
+
+    async def acall(self, model_info, tools, response_format, messages):
+        request = self.make_request(model_info, tools, response_format, messages)
+        return await self._async_client.messages.create(**request)
+
+    def submit_batch(self, requests):
+        batch = self._client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": r.custom_id,
+                    "params": self.make_request(
+                        r.model_info, r.tools, r.response_format, r.messages
+                    ),
+                }
+                for r in requests
+            ]
+        )
+        return batch.id
+
+    def poll_batch(self, batch_id):
+        batch = self._client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return None
+        results = {}
+        for entry in self._client.messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                logger.warning(
+                    f"Batch request {entry.custom_id} failed: {entry.result.type}"
+                )
+                continue
+            results[entry.custom_id] = entry.result.message
+        return results
@@ -31,7 +31,7 @@ def generate_prompt_for_agent(prompt: Prompt, agent: LlmAgent[BedrockClientConfi
             d = tool.to_custom()
             tool_command += d
         p.tool_description = tool_command
-    return p.to_bedrock_json()
+    return p.to_bedrock_json(cache_breakpoints=agent.client.prompt_caching)
 
 
 @dispatch
@@ -157,6 +157,8 @@ def count_message_tokens(agent: LlmAgent[BedrockClientConfig], message: dict):
         # when we sent a message
         num_tokens = 3
         for block in message["content"]:
+            if "cachePoint" in block:
+                continue
             for key, value in block.items():
                 num_tokens += count_message_tokens(agent, value)
                 # num_tokens += len(enc.encode(value))
@@ -177,3 +179,12 @@ def count_message_tokens(agent: LlmAgent[BedrockClientConfig], message: dict):
         return total
     else:
         raise NotImplementedError("Not sure how to process message: ", message)
+
+
+@dispatch
+def get_cache_usage(agent: LlmAgent[BedrockClientConfig], response: dict):
+    usage = response.get("usage", {})
+    return (
+        usage.get("cacheReadInputTokens", 0),
+        usage.get("cacheWriteInputTokens", 0),
+    )
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Literal
 
 import boto3
@@ -14,6 +15,9 @@ model_name_to_bedrock_model_id = {
 class BedrockClientConfig(BaseSettings):
     client_type: Literal["bedrock"]
     timeout: int
+    # Mark the static prompt prefix with cache points. Not every Bedrock model
+    # supports prompt caching (e.g. Claude 3 Haiku doesn't), so this is opt-in.
+    prompt_caching: bool = False
     _client: object = PrivateAttr()
 
     def __init__(self, **data):
@@ -32,3 +36,10 @@ class BedrockClientConfig(BaseSettings):
 
         response = self._client.converse(**req)
         return response
+
+    async def acall(self, model_info, tools, response_format, messages):
+        # boto3 has no asyncio interface. Its clients are thread-safe, so the
+        # blocking call is run in the event loop's default executor.
+        return await asyncio.to_thread(
+            self.call, model_info, tools, response_format, messages
+        )
@@ -1,6 +1,6 @@
 from typing import Literal
 
-from ollama import ChatResponse, chat
+from ollama import AsyncClient, ChatResponse, chat
 from pydantic import PrivateAttr
 from pydantic_settings import BaseSettings
 
@@ -8,11 +8,14 @@ from pydantic_settings import BaseSettings
 class OllamaClientConfig(BaseSettings):
     client_type: Literal["ollama"]
     _chat_func: object = PrivateAttr(default=None)
+    _async_chat_func: object = PrivateAttr(default=None)
 
     def __init__(self, **data):
         super().__init__(**data)
         if self._chat_func is None:
             self._chat_func = chat
+        if self._async_chat_func is None:
+            self._async_chat_func = AsyncClient().chat
 
     def call(self, model_info, tools, response_format, messages):
         if response_format != "text":
@@ -25,3 +28,15 @@ class OllamaClientConfig(BaseSettings):
         )
 
         return response
+
+    async def acall(self, model_info, tools, response_format, messages):
+        if response_format != "text":
+            raise ValueError(
+                f"response_format {response_format} not implemented for Ollama!"
+            )
+
+        response: ChatResponse = await self._async_chat_func(
+            model=model_info.model, messages=messages, tools=tools
+        )
+
+        return response
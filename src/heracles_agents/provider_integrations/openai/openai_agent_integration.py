@@ -156,3 +156,11 @@ def count_message_tokens(agent: LlmAgent[OpenaiClientConfig], message: dict):
     if key == "name":
         num_tokens += 1
     return num_tokens
+
+
+@dispatch
+def get_cache_usage(agent: LlmAgent[OpenaiClientConfig], response: Response):
+    # OpenAI caches prompt prefixes automatically, and doesn't report cache writes
+    if response.usage is None:
+        return 0, 0
+    return response.usage.input_tokens_details.cached_tokens, 0
@@ -1,23 +1,38 @@
+import json
+import logging
 from typing import Literal
 
 import openai
+from openai.types.responses.response import Response
 from pydantic import BaseModel, Field, PrivateAttr, SecretStr
 from pydantic_settings import BaseSettings
 
+from heracles_agents.llm_cache import to_canonical_json
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/responses"
+# Batch states that will still produce (more) output
+BATCH_PENDING_STATES = ("validating", "in_progress", "finalizing", "cancelling")
+
 
 class OpenaiClientConfig(BaseSettings):
     client_type: Literal["openai"]
     timeout: int
     auth_key: SecretStr = Field(alias="HERACLES_OPENAI_API_KEY", exclude=True)
     _client: object = PrivateAttr()
+    _async_client: object = PrivateAttr()
 
     def __init__(self, **data):
         super().__init__(**data)
         self._client = openai.OpenAI(
             api_key=self.auth_key.get_secret_value(), timeout=self.timeout
         )
+        self._async_client = openai.AsyncOpenAI(
+            api_key=self.auth_key.get_secret_value(), timeout=self.timeout
+        )
 
-    def call(self, model_info, tools, response_format, messages):
+    def make_request(self, model_info, tools, response_format, messages):
         match response_format:
             case "text":
                 # fmt = {"text": {"format": {"type": "text"}}}
@@ -33,7 +48,7 @@ class OpenaiClientConfig(BaseSettings):
                 )
 
         if "gpt-5" in model_info.model:
-            response = self._client.responses.create(
+            return dict(
                 model=model_info.model,
                 # seed=model_info.seed,
                 text=fmt,
@@ -43,7 +58,7 @@ class OpenaiClientConfig(BaseSettings):
                 reasoning={"effort": "minimal"},
             )
         else:
-            response = self._client.responses.create(
+            return dict(
                 model=model_info.model,
                 temperature=model_info.temperature,
                 # seed=model_info.seed,
@@ -52,4 +67,55 @@ class OpenaiClientConfig(BaseSettings):
                 input=messages,
                 parallel_tool_calls=False,
             )
-        return response
+
+    def call(self, model_info, tools, response_format, messages):
+        request = self.make_request(model_info, tools, response_format, messages)
+        return self._client.responses.create(**request)
+
+    async def acall(self, model_info, tools, response_format, messages):
+        request = self.make_request(model_info, tools, response_format, messages)
+        return await self._async_client.responses.create(**request)
+
+    def submit_batch(self, requests):
+        lines = []
+        for r in requests:
+            body = self.make_request(
+                r.model_info, r.tools, r.response_format, r.messages
+            )
+            line = {
+                "custom_id": r.custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": to_canonical_json(body),
+            }
+            lines.append(json.dumps(line))
+        batch_file = self._client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = self._client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def poll_batch(self, batch_id):
+        batch = self._client.batches.retrieve(batch_id)
+        if batch.status in BATCH_PENDING_STATES:
+            return None
+        if batch.status != "completed":
+            logger.error(f"OpenAI batch {batch_id} ended with status {batch.status}")
+        results = {}
+        if batch.output_file_id is None:
+            return results
+        output = self._client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response")
+            if response is None or response["status_code"] != 200:
+                logger.warning(f"Batch request {result['custom_id']} failed: {result}")
+                continue
+            results[result["custom_id"]] = Response.model_validate(response["body"])
+        return results
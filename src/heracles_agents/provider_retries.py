@@ -0,0 +1,123 @@
+import email.utils
+import logging
+import random
+import time
+from typing import NamedTuple, Optional
+
+import anthropic
+import botocore.exceptions
+import openai
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class LlmRetriesExhausted(RuntimeError):
+    """Raised when an LLM request still fails after every allowed retry"""
+
+    def __init__(self, provider, model, n_attempts, last_error):
+        super().__init__(
+            f"{provider} request to {model} failed after {n_attempts} attempts: {last_error}"
+        )
+        self.provider = provider
+        self.model = model
+        self.n_attempts = n_attempts
+        self.last_error = last_error
+
+
+class RetryPolicy(BaseModel):
+    """Exponential backoff (with jitter) for retrying transient provider errors"""
+
+    max_retries: int = Field(default=5, ge=0)
+    initial_backoff_s: float = Field(default=2.0, gt=0)
+    max_backoff_s: float = Field(default=120.0, gt=0)
+    backoff_multiplier: float = Field(default=2.0, ge=1)
+
+    def backoff_s(self, retry_index, retry_after_s=None):
+        """Seconds to wait before retry number `retry_index` (counting from 0)"""
+        backoff = min(
+            self.max_backoff_s,
+            self.initial_backoff_s * self.backoff_multiplier**retry_index,
+        )
+        # Jitter keeps clients that were throttled together from retrying together
+        backoff = backoff / 2 + random.uniform(0, backoff / 2)
+        if retry_after_s is not None:
+            # The server's hint is a lower bound, it may be longer than our cap
+            backoff = max(backoff, retry_after_s)
+        return backoff
+
+
+class RetryableError(NamedTuple):
+    description: str
+    # Rate limit errors hold back every request to the provider, not just the failed one
+    is_rate_limit: bool
+    retry_after_s: Optional[float]
+
+
+RETRYABLE_BEDROCK_ERRORS = {
+    "ThrottlingException": ("Hit Bedrock rate limit error", True),
+    "ModelTimeoutException": ("Bedrock model timeout", False),
+    "ServiceUnavailableException": ("Bedrock service unavailable", False),
+}
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds to wait according to the Retry-After (or retry-after-ms) response header"""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # Retry-After may also be an HTTP date
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        logger.warning(f"Could not parse Retry-After header: {value}")
+        return None
+    return max(0.0, retry_time - time.time())
+
+
+def is_retryable_status(status_code):
+    return status_code in (408, 409, 429) or status_code >= 500
+
+
+def classify_provider_error(ex) -> Optional[RetryableError]:
+    """Describe a provider error that is worth retrying, or None for any other error"""
+    match ex:
+        case openai.RateLimitError() | anthropic.RateLimitError():
+            return RetryableError(
+                "Hit rate limit error", True, parse_retry_after(ex.response.headers)
+            )
+        case openai.APITimeoutError() | anthropic.APITimeoutError():
+            return RetryableError("Request timed out", False, None)
+        case openai.APIConnectionError() | anthropic.APIConnectionError():
+            return RetryableError("Could not connect to provider", False, None)
+        case openai.APIStatusError() | anthropic.APIStatusError() if (
+            is_retryable_status(ex.status_code)
+        ):
+            return RetryableError(
+                f"Provider API error ({ex.status_code})",
+                False,
+                parse_retry_after(ex.response.headers),
+            )
+        case botocore.exceptions.ClientError():
+            code = ex.response.get("Error", {}).get("Code")
+            if code not in RETRYABLE_BEDROCK_ERRORS:
+                return None
+            description, is_rate_limit = RETRYABLE_BEDROCK_ERRORS[code]
+            headers = ex.response.get("ResponseMetadata", {}).get("HTTPHeaders")
+            return RetryableError(
+                description, is_rate_limit, parse_retry_after(headers)
+            )
+        case _:
+            return None
@@ -19,6 +19,8 @@ def to_string(value):
         return str(value)
     elif type(value) is float:
         return str(value)
+    elif isinstance(value, (dict, list)):
+        return str(value)
     else:
         return value
 
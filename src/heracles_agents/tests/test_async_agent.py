@@ -0,0 +1,113 @@
+"""
+Unit tests for running agent sessions on an asyncio event loop.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from heracles_agents.llm_agent import ModelInfo
+from heracles_agents.llm_cache import LlmCacheConfig, LlmCacheRegistry
+from heracles_agents.llm_interface import AgentContext
+from heracles_agents.provider_budgets import (
+    ProviderBudgetConfig,
+    ProviderBudgetRegistry,
+)
+from heracles_agents.provider_integrations.ollama.ollama_client import (
+    OllamaClientConfig,
+)
+from heracles_agents.provider_retries import classify_provider_error
+
+
+class FakeAsyncClient:
+    client_type = "openai"
+
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+        self.n_in_flight = 0
+        self.peak_in_flight = 0
+        self.n_calls = 0
+        self.call = Mock(side_effect=AssertionError("blocking call used"))
+
+    async def acall(self, model_info, tools, response_format, messages):
+        self.n_calls += 1
+        self.n_in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.n_in_flight)
+        await asyncio.sleep(self.delay_s)
+        self.n_in_flight -= 1
+        return {"output": messages[-1]["content"]}
+
+
+def make_agent(client):
+    return SimpleNamespace(
+        model_info=ModelInfo(model="gpt-4.1-nano", temperature=0.2, seed=1),
+        agent_info=SimpleNamespace(tool_interface="none", tools={}),
+        client=client,
+    )
+
+
+def make_history(i):
+    return [{"role": "user", "content": f"question {i}"}]
+
+
+class TestAsyncCallLlm:
+    def setup_method(self):
+        ProviderBudgetRegistry.clear()
+
+    def teardown_method(self):
+        ProviderBudgetRegistry.clear()
+        LlmCacheRegistry.configure(None)
+
+    def run_sessions(self, client, n_sessions):
+        async def main():
+            return await asyncio.gather(
+                *(
+                    AgentContext(make_agent(client)).acall_llm(make_history(i))
+                    for i in range(n_sessions)
+                )
+            )
+
+        return asyncio.run(main())
+
+    def test_sessions_share_one_loop(self):
+        client = FakeAsyncClient(delay_s=0.05)
+        responses = self.run_sessions(client, 100)
+        assert responses == [{"output": f"question {i}"} for i in range(100)]
+        assert client.peak_in_flight == 100
+        client.call.assert_not_called()
+
+    def test_provider_budget(self):
+        ProviderBudgetRegistry.configure(
+            [ProviderBudgetConfig(provider="openai", max_concurrent_requests=3)]
+        )
+        client = FakeAsyncClient(delay_s=0.01)
+        self.run_sessions(client, 12)
+        assert client.peak_in_flight == 3
+
+    def test_cache(self, tmp_path):
+        LlmCacheRegistry.configure(LlmCacheConfig(cache_dir=str(tmp_path)))
+        client = FakeAsyncClient()
+        self.run_sessions(client, 5)
+        self.run_sessions(client, 5)
+        assert client.n_calls == 5
+
+    def test_non_retryable_error(self):
+        client = FakeAsyncClient()
+        client.acall = Mock(side_effect=ValueError("bad request"))
+        assert classify_provider_error(ValueError()) is None
+        with pytest.raises(ValueError):
+            asyncio.run(AgentContext(make_agent(client)).acall_llm(make_history(0)))
+
+
+class TestOllamaAcall:
+    def test_acall_uses_async_chat(self):
+        async def fake_chat(model, messages, tools):
+            return {"model": model, "messages": messages}
+
+        config = OllamaClientConfig(client_type="ollama")
+        config._async_chat_func = fake_chat
+        model_info = ModelInfo(model="llama3", temperature=0.2)
+        response = asyncio.run(config.acall(model_info, [], "text", make_history(0)))
+        assert response == {"model": "llama3", "messages": make_history(0)}
@@ -0,0 +1,150 @@
+"""
+Unit tests for sending first-turn requests through a (local) batch job.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from heracles_agents.batch_inference import (
+    BatchConfig,
+    BatchRequest,
+    BatchResponseRegistry,
+    LocalBatchServer,
+    run_batch,
+)
+from heracles_agents.llm_agent import ModelInfo
+from heracles_agents.llm_cache import LlmCacheConfig, LlmCacheRegistry
+from heracles_agents.llm_interface import AgentContext, AnalyzedQuestion
+from heracles_agents.pipelines import question_executor
+from heracles_agents.pipelines.question_executor import run_questions
+
+MODEL_INFO = ModelInfo(model="gpt-4.1-nano", temperature=0.2, seed=1)
+
+
+def answer_with_echo(model_info, tools, response_format, messages):
+    content = messages[-1]["content"]
+    if "fail" in content:
+        raise ValueError("bad request")
+    return {"output": f"answer to {content}"}
+
+
+def make_client(call=answer_with_echo):
+    client = Mock()
+    client.client_type = "openai"
+    client.call = Mock(side_effect=call)
+    return client
+
+
+def make_agent(client):
+    return SimpleNamespace(
+        model_info=MODEL_INFO,
+        agent_info=SimpleNamespace(tool_interface="none", tools={}),
+        client=client,
+    )
+
+
+def make_request(custom_id, content):
+    messages = [{"role": "user", "content": content}]
+    return BatchRequest(custom_id, MODEL_INFO, [], "text", messages)
+
+
+def local_config(tmp_path):
+    return BatchConfig(backend="local", batch_dir=str(tmp_path), poll_interval_s=0.01)
+
+
+class TestBatchConfig:
+    def test_local_requires_batch_dir(self):
+        with pytest.raises(ValueError):
+            BatchConfig(backend="local")
+
+
+class TestLocalBatchServer:
+    def test_run_batch(self, tmp_path):
+        requests = [make_request(f"r{i}", f"question {i}") for i in range(5)]
+        results = run_batch(make_client(), requests, local_config(tmp_path))
+        assert results == {
+            f"r{i}": {"output": f"answer to question {i}"} for i in range(5)
+        }
+
+    def test_failed_requests_are_missing(self, tmp_path):
+        requests = [make_request("ok", "question"), make_request("bad", "fail")]
+        results = run_batch(make_client(), requests, local_config(tmp_path))
+        assert list(results.keys()) == ["ok"]
+
+    def test_poll_before_done(self, tmp_path):
+        server = LocalBatchServer(str(tmp_path), make_client())
+        assert server.poll_batch("not-submitted") is None
+
+    def test_unsupported_client(self, tmp_path):
+        client = SimpleNamespace(client_type="ollama")
+        with pytest.raises(ValueError, match="local batch backend"):
+            run_batch(client, [make_request("r", "q")], BatchConfig())
+
+
+class TestAgentContextBatchResponses:
+    def teardown_method(self):
+        BatchResponseRegistry.responses.clear()
+        LlmCacheRegistry.configure(None)
+
+    def test_batch_response_used_once_registered(self, tmp_path):
+        LlmCacheRegistry.configure(LlmCacheConfig(cache_dir=str(tmp_path)))
+        agent = make_agent(make_client())
+        cxt = AgentContext(agent)
+        history = [{"role": "user", "content": "question"}]
+        _, tools, response_format = cxt.prepare_request(history)
+        key = cxt.request_key(tools, response_format, history)
+
+        BatchResponseRegistry.add({key: "batch response"})
+        assert cxt.call_llm(history) == "batch response"
+        agent.client.call.assert_not_called()
+
+        # The batch response is also recorded in the LLM cache
+        BatchResponseRegistry.discard([key])
+        assert LlmCacheRegistry.get_cache().lookup(key) == "batch response"
+
+
+class FakeAgentContext(AgentContext):
+    def initialize_agent(self, prompt):
+        self.history = [{"role": "user", "content": prompt}]
+
+
+class TestRunQuestionsWithBatch:
+    def teardown_method(self):
+        BatchResponseRegistry.responses.clear()
+
+    def test_first_turns_are_batched(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(question_executor, "AgentContext", FakeAgentContext)
+        batch_client = make_client()
+        live_client = make_client()
+        questions = [SimpleNamespace(uid=i, question=f"q{i}") for i in range(4)]
+
+        def analyze_question(question):
+            cxt = FakeAgentContext(make_agent(live_client))
+            cxt.initialize_agent(question.question)
+            response = cxt.call_llm(cxt.history)
+            return AnalyzedQuestion.model_construct(question=question, answer=response)
+
+        exp = SimpleNamespace(
+            n_workers=2,
+            questions=questions,
+            get_checkpoint=lambda: None,
+            batch=local_config(tmp_path),
+            pipeline=SimpleNamespace(
+                name="fake",
+                batch_phase="main",
+                batch_prompt=lambda exp, q: q.question,
+            ),
+            phases={"main": make_agent(batch_client)},
+        )
+
+        aqs = run_questions(exp, analyze_question)
+
+        assert [aq.answer for aq in aqs.analyzed_questions] == [
+            {"output": f"answer to q{i}"} for i in range(4)
+        ]
+        # Every call went through the batch, none were sent individually
+        assert batch_client.call.call_count == 4
+        live_client.call.assert_not_called()
+        assert BatchResponseRegistry.is_empty()
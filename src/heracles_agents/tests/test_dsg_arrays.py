@@ -0,0 +1,121 @@
+"""
+Unit tests for the NumPy arrays of scene graph layers.
+"""
+
+import numpy as np
+import spark_dsg
+
+from heracles_agents.pipelines.dsg_arrays import (
+    DsgArraysRegistry,
+    LayerArrays,
+    node_symbols,
+)
+from heracles_agents.pipelines.dsg_hierarchy import mark_dsg_changed
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+
+class TestLayerArrays:
+    def test_same_as_scene_graph(self):
+        G = make_synthetic_scene_graph(200)
+        for layer in (spark_dsg.DsgLayers.OBJECTS, spark_dsg.DsgLayers.ROOMS):
+            arrays = LayerArrays.from_layer(G, layer)
+            nodes = list(G.get_layer(layer).nodes)
+            assert len(arrays) == len(nodes)
+            assert arrays.ids.tolist() == [n.id.value for n in nodes]
+            assert arrays.labels.tolist() == [
+                n.attributes.semantic_label for n in nodes
+            ]
+            np.testing.assert_array_equal(
+                arrays.positions, [n.attributes.position for n in nodes]
+            )
+
+    def test_empty_layer(self):
+        G = make_synthetic_scene_graph(0, n_places=0, n_rooms=0)
+        arrays = LayerArrays.from_layer(G, spark_dsg.DsgLayers.OBJECTS)
+        assert len(arrays) == 0
+        assert arrays.positions.shape == (0, 3)
+        assert arrays.labels.tolist() == []
+
+    def test_select(self):
+        G = make_synthetic_scene_graph(50)
+        arrays = LayerArrays.from_layer(G, spark_dsg.DsgLayers.OBJECTS)
+        node_ids = {spark_dsg.NodeSymbol("O", i).value for i in (30, 3, 7)}
+        selected = arrays.select(node_ids)
+        # Still in layer order
+        assert node_symbols(selected.ids.tolist()) == ["O3", "O7", "O30"]
+        row = arrays.row_of(spark_dsg.NodeSymbol("O", 7).value)
+        np.testing.assert_array_equal(selected.positions[1], arrays.positions[row])
+        assert selected.labels[1] == arrays.labels[row]
+        assert arrays.select(None) is arrays
+        assert len(arrays.select(set())) == 0
+        assert arrays.row_of(spark_dsg.NodeSymbol("R", 0).value) is None
+
+    def test_node_symbols(self):
+        node_ids = [
+            spark_dsg.NodeSymbol("O", 1).value,
+            spark_dsg.NodeSymbol("p", 123456).value,
+            spark_dsg.NodeSymbol("R", 0).value,
+            5,
+            2**63 + 7,
+        ]
+        assert node_symbols(node_ids) == [
+            spark_dsg.NodeSymbol(node_id).str(True) for node_id in node_ids
+        ]
+
+
+class TestDsgArraysRegistry:
+    def setup_method(self):
+        DsgArraysRegistry.clear()
+
+    def teardown_method(self):
+        DsgArraysRegistry.clear()
+
+    def test_shared(self):
+        G = make_synthetic_scene_graph(20)
+        arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        assert DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS) is arrays
+        assert DsgArraysRegistry.get(G, spark_dsg.DsgLayers.ROOMS) is not arrays
+        other = make_synthetic_scene_graph(20)
+        assert DsgArraysRegistry.get(other, spark_dsg.DsgLayers.OBJECTS) is not arrays
+
+    def test_rebuilt_when_graph_changes(self):
+        G = make_synthetic_scene_graph(20)
+        arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        attrs = spark_dsg.ObjectNodeAttributes()
+        attrs.position = [1.0, 2.0, 3.0]
+        G.add_node(spark_dsg.DsgLayers.OBJECTS, spark_dsg.NodeSymbol("O", 20), attrs)
+        new_arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        assert len(new_arrays) == len(arrays) + 1
+        row = new_arrays.row_of(spark_dsg.NodeSymbol("O", 20).value)
+        assert new_arrays.positions[row].tolist() == [1.0, 2.0, 3.0]
+
+    def test_bounded(self):
+        graphs = [
+            make_synthetic_scene_graph(5)
+            for _ in range(DsgArraysRegistry.max_entries + 2)
+        ]
+        for G in graphs:
+            DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        assert len(DsgArraysRegistry.arrays) == DsgArraysRegistry.max_entries
+
+    def test_rebuilt_when_marked_changed(self):
+        G = make_synthetic_scene_graph(20)
+        arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        G.get_node(spark_dsg.NodeSymbol("O", 0)).attributes.position = [1.0, 2.0, 3.0]
+        mark_dsg_changed(G)
+        new_arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        assert new_arrays is not arrays
+        assert new_arrays.positions[0].tolist() == [1.0, 2.0, 3.0]
+
+    def test_invalidate(self):
+        G = make_synthetic_scene_graph(20)
+        other = make_synthetic_scene_graph(20)
+        arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        other_arrays = DsgArraysRegistry.get(other, spark_dsg.DsgLayers.OBJECTS)
+        G.get_node(spark_dsg.NodeSymbol("O", 0)).attributes.position = [1.0, 2.0, 3.0]
+        # Attribute changes don't change the version
+        assert DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS) is arrays
+        DsgArraysRegistry.invalidate(G)
+        new_arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        assert new_arrays.positions[0].tolist() == [1.0, 2.0, 3.0]
+        assert DsgArraysRegistry.get(other, spark_dsg.DsgLayers.OBJECTS) is other_arrays
@@ -0,0 +1,125 @@
+"""
+Unit tests for the object/place/room hierarchy index.
+"""
+
+import spark_dsg
+
+from heracles_agents.dsg_interfaces import InContextDsgInterfaceConfig
+from heracles_agents.pipelines.dsg_hierarchy import (
+    DsgHierarchyIndex,
+    DsgHierarchyRegistry,
+    dsg_version,
+    mark_dsg_changed,
+)
+from heracles_agents.pipelines.in_context_utils import scene_graph_to_prompt_full
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+
+def node_id(prefix, i):
+    return spark_dsg.NodeSymbol(prefix, i).value
+
+
+class TestDsgHierarchyIndex:
+    def test_same_as_scene_graph(self):
+        G = make_synthetic_scene_graph(200)
+        index = DsgHierarchyIndex(G, "MESH_PLACES")
+        for node in G.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes:
+            places = tuple(node.parents())
+            assert index.places_of_object(node.id.value) == places
+            rooms = {r for p in places for r in G.get_node(p).parents()}
+            assert set(index.rooms_of_object(node.id.value)) == rooms
+        for node in G.get_layer("MESH_PLACES").nodes:
+            assert index.rooms_of_place(node.id.value) == tuple(node.parents())
+            assert index.siblings_of(node.id.value) == tuple(node.siblings())
+            assert set(index.objects_in_place(node.id.value)) == node.children()
+        for node in G.get_layer(spark_dsg.DsgLayers.ROOMS).nodes:
+            assert index.siblings_of(node.id.value) == tuple(node.siblings())
+            assert set(index.places_in_room(node.id.value)) == node.children()
+
+    def test_containment(self):
+        G = make_synthetic_scene_graph(50, n_places=2, n_rooms=1)
+        index = DsgHierarchyIndex(G)
+        # The last place has no room, and the last object has no place
+        in_room = set(index.objects_in_room(node_id("R", 0)))
+        in_places = set(index.objects_in_place(node_id("P", 0))) | set(
+            index.objects_in_place(node_id("P", 1))
+        )
+        assert in_room == set(index.objects_in_place(node_id("P", 0)))
+        assert len(in_places) == 49
+        assert index.rooms_of_object(node_id("O", 49)) == ()
+        assert index.objects_in_room(node_id("R", 7)) == ()
+
+
+class TestDsgHierarchyRegistry:
+    def setup_method(self):
+        DsgHierarchyRegistry.clear()
+
+    def teardown_method(self):
+        DsgHierarchyRegistry.clear()
+
+    def test_shared(self):
+        G = make_synthetic_scene_graph(20)
+        index = DsgHierarchyRegistry.get(G, "MESH_PLACES")
+        assert DsgHierarchyRegistry.get(G, "MESH_PLACES") is index
+        # An index with the place layer also answers requests without it
+        assert DsgHierarchyRegistry.get(G) is index
+        assert DsgHierarchyRegistry.get(make_synthetic_scene_graph(20)) is not index
+
+    def test_rebuilt_when_graph_changes(self):
+        G = make_synthetic_scene_graph(20)
+        index = DsgHierarchyRegistry.get(G)
+        attrs = spark_dsg.ObjectNodeAttributes()
+        attrs.position = [0.0, 0.0, 0.0]
+        G.add_node(spark_dsg.DsgLayers.OBJECTS, spark_dsg.NodeSymbol("O", 20), attrs)
+        G.insert_edge(spark_dsg.NodeSymbol("O", 20), spark_dsg.NodeSymbol("P", 0))
+        new_index = DsgHierarchyRegistry.get(G)
+        assert new_index is not index
+        assert node_id("O", 20) in new_index.objects_in_place(node_id("P", 0))
+
+    def test_rebuilt_when_marked_changed(self):
+        G = make_synthetic_scene_graph(20)
+        index = DsgHierarchyRegistry.get(G)
+        obj = spark_dsg.NodeSymbol("O", 0)
+        old_place = G.get_node(obj).get_parent()
+        new_place = next(
+            node.id.value
+            for node in G.get_layer("MESH_PLACES").nodes
+            if node.id.value != old_place
+        )
+        # The same number of nodes and edges
+        G.remove_edge(obj, old_place)
+        G.insert_edge(obj, new_place)
+        mark_dsg_changed(G)
+        new_index = DsgHierarchyRegistry.get(G)
+        assert new_index is not index
+        assert new_index.object_places[obj.value] == (new_place,)
+
+    def test_version_unique_to_graph(self):
+        G = make_synthetic_scene_graph(20)
+        assert dsg_version(G) == dsg_version(G)
+        assert dsg_version(G) != dsg_version(make_synthetic_scene_graph(20))
+        assert dsg_version(G) != dsg_version(G.clone())
+
+    def test_bounded(self):
+        graphs = [
+            make_synthetic_scene_graph(5)
+            for _ in range(DsgHierarchyRegistry.max_entries + 2)
+        ]
+        for G in graphs:
+            DsgHierarchyRegistry.get(G)
+        assert len(DsgHierarchyRegistry.indices) == DsgHierarchyRegistry.max_entries
+
+    def test_shared_by_interface_and_encoder(self, tmp_path):
+        path = str(tmp_path / "dsg.json")
+        make_synthetic_scene_graph(30).save(path)
+        dsg_interface = InContextDsgInterfaceConfig(
+            dsg_interface_type="in_context",
+            dsg_filepath=path,
+            dsg_place_layer_name="MESH_PLACES",
+        )
+        index = dsg_interface.get_hierarchy_index()
+        dsg_interface.get_serialized_dsg(
+            scene_graph_to_prompt_full, place_layer_name="MESH_PLACES"
+        )
+        assert dsg_interface.get_hierarchy_index() is index
+        assert len(DsgHierarchyRegistry.indices) == 1
@@ -0,0 +1,134 @@
+"""
+Unit tests for sharing loaded scene graphs between configurations.
+"""
+
+import os
+
+import pytest
+import spark_dsg
+
+from heracles_agents.dsg_interfaces import (
+    InContextDsgInterfaceConfig,
+    PythonDsgInterface,
+)
+from heracles_agents.pipelines.codegen_utils import DsgLoadCache, load_dsg
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+LABELS_FILEPATH = (
+    "$HERACLES_AGENTS_PATH/src/heracles_agents/resources/ade20k_mit_label_space.yaml"
+)
+API_FILEPATH = "$HERACLES_AGENTS_PATH/examples/prompts/spark_dsg_api_prompt.yaml"
+
+
+@pytest.fixture
+def dsg_filepath(tmp_path):
+    # The label metadata of `load_dsg` depends on the scene graph's name
+    path = str(tmp_path / "b45_dsg.json")
+    make_synthetic_scene_graph(30).save(path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    DsgLoadCache.clear()
+    yield
+    DsgLoadCache.clear()
+
+
+def python_interface(dsg_filepath, **kwargs):
+    return PythonDsgInterface(
+        dsg_interface_type="python",
+        dsg_filepath=dsg_filepath,
+        dsg_labels_filepath=LABELS_FILEPATH,
+        dsg_api_filepath=API_FILEPATH,
+        **kwargs,
+    )
+
+
+class TestLoadDsg:
+    def test_loaded_once(self, dsg_filepath):
+        G = load_dsg(dsg_filepath)
+        assert load_dsg(dsg_filepath) is G
+        assert G.num_nodes() == make_synthetic_scene_graph(30).num_nodes()
+
+    def test_keyed_by_labels(self, dsg_filepath):
+        labels_filepath = os.path.expandvars(LABELS_FILEPATH)
+        G = load_dsg(dsg_filepath)
+        labeled = load_dsg(dsg_filepath, labels_filepath)
+        assert labeled is not G
+        assert load_dsg(dsg_filepath, labels_filepath) is labeled
+        assert "labelspace" in labeled.metadata.get()
+        assert "labelspace" not in G.metadata.get()
+
+    def test_reloaded_when_file_changes(self, dsg_filepath):
+        G = load_dsg(dsg_filepath)
+        make_synthetic_scene_graph(50).save(dsg_filepath)
+        new_G = load_dsg(dsg_filepath)
+        assert new_G is not G
+        assert new_G.num_nodes() > G.num_nodes()
+
+    def test_mutable_copy(self, dsg_filepath):
+        G = load_dsg(dsg_filepath)
+        copy = load_dsg(dsg_filepath, mutable=True)
+        assert copy is not G
+        assert copy.num_nodes() == G.num_nodes()
+        copy.remove_node(spark_dsg.NodeSymbol("O", 0))
+        assert load_dsg(dsg_filepath).has_node(spark_dsg.NodeSymbol("O", 0))
+
+    def test_bounded(self, tmp_path):
+        for i in range(DsgLoadCache.max_entries + 2):
+            path = str(tmp_path / f"dsg_{i}.json")
+            make_synthetic_scene_graph(5).save(path)
+            load_dsg(path)
+        assert len(DsgLoadCache.graphs) == DsgLoadCache.max_entries
+
+
+class TestSharedBetweenInterfaces:
+    def test_python_interfaces(self, dsg_filepath):
+        first = python_interface(dsg_filepath)
+        second = python_interface(dsg_filepath, dsg_api_examples=True)
+        assert second.get_dsg() is first.get_dsg()
+        shared = python_interface(dsg_filepath, share_dsg=True)
+        assert shared.get_dsg() is first.get_dsg()
+
+    def test_in_context_interfaces(self, dsg_filepath):
+        interfaces = [
+            InContextDsgInterfaceConfig(
+                dsg_interface_type="in_context",
+                dsg_filepath=dsg_filepath,
+                dsg_place_layer_name="MESH_PLACES",
+                dsg_encoding=encoding,
+            )
+            for encoding in ("default", "compact")
+        ]
+        assert interfaces[0].get_dsg() is interfaces[1].get_dsg()
+
+
+class TestLazyLoading:
+    def test_not_loaded_when_parsed(self, dsg_filepath):
+        interface = python_interface(dsg_filepath)
+        assert len(DsgLoadCache.graphs) == 0
+        G = interface.get_dsg()
+        assert len(DsgLoadCache.graphs) == 1
+        assert interface.get_dsg() is G
+        assert "get_layer" in interface.get_dsg_api_prompt()
+
+    def test_in_context_not_loaded_when_parsed(self, dsg_filepath):
+        interface = InContextDsgInterfaceConfig(
+            dsg_interface_type="in_context",
+            dsg_filepath=dsg_filepath,
+            dsg_place_layer_name="MESH_PLACES",
+        )
+        assert len(DsgLoadCache.graphs) == 0
+        assert interface.get_hierarchy_index() is not None
+        assert len(DsgLoadCache.graphs) == 1
+
+    def test_missing_file(self, tmp_path):
+        with pytest.raises(ValueError, match="does not exist"):
+            python_interface(str(tmp_path / "missing.json"))
+        with pytest.raises(ValueError, match="does not exist"):
+            InContextDsgInterfaceConfig(
+                dsg_interface_type="in_context",
+                dsg_filepath=str(tmp_path / "missing.json"),
+                dsg_place_layer_name="MESH_PLACES",
+            )
@@ -0,0 +1,171 @@
+"""
+Unit tests for the spatial and semantic queries available to generated code.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import spark_dsg
+
+from heracles_agents.pipelines.codegen_utils import (
+    execute_generated_code,
+    load_dsg_api_prompt,
+)
+from heracles_agents.pipelines.dsg_queries import (
+    DsgQueryRegistry,
+    KDTree,
+    dsg_query,
+    node_id_of,
+)
+from heracles_agents.pipelines.synthetic_dsg import (
+    OBJECT_LABELS,
+    ROOM_LABELS,
+    make_synthetic_scene_graph,
+)
+
+API_FILEPATH = "$HERACLES_AGENTS_PATH/examples/prompts/spark_dsg_api_prompt.yaml"
+
+
+def brute_force(points, point):
+    distances = np.linalg.norm(points - point, axis=1)
+    return distances, np.lexsort((np.arange(len(points)), distances))
+
+
+def objects(G):
+    return list(G.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes)
+
+
+@pytest.fixture(autouse=True)
+def clear_queries():
+    DsgQueryRegistry.clear()
+    yield
+    DsgQueryRegistry.clear()
+
+
+@pytest.fixture(scope="module")
+def scene_graph():
+    return make_synthetic_scene_graph(300)
+
+
+class TestKDTree:
+    def test_same_as_brute_force(self):
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-10, 10, size=(2000, 3))
+        # Duplicates make ties, which are broken by row
+        points[:50] = 0
+        tree = KDTree(points, leaf_size=8)
+        for point in [np.zeros(3), *rng.uniform(-12, 12, size=(20, 3))]:
+            distances, order = brute_force(points, point)
+            d, rows = tree.query(point, k=60)
+            np.testing.assert_array_equal(rows, order[:60])
+            np.testing.assert_allclose(d, distances[order[:60]])
+            d, rows = tree.query_radius(point, 3.0)
+            within = order[distances[order] <= 3.0]
+            np.testing.assert_array_equal(rows, within)
+
+    def test_small_and_empty(self):
+        tree = KDTree(np.array([[1.0, 2.0, 3.0]]))
+        d, rows = tree.query([1.0, 2.0, 4.0], k=5)
+        assert rows.tolist() == [0] and d.tolist() == [1.0]
+        empty = KDTree(np.empty((0, 3)))
+        assert len(empty.query([0, 0, 0], k=3)[1]) == 0
+        assert len(empty.query_radius([0, 0, 0], 1.0)[1]) == 0
+
+
+class TestDsgQuery:
+    def test_nearest(self, scene_graph):
+        query = dsg_query(scene_graph)
+        nodes = [n for n in objects(scene_graph) if n.attributes.semantic_label == 0]
+        positions = np.array([n.attributes.position for n in nodes])
+        target = spark_dsg.NodeSymbol("O", 7)
+        position = scene_graph.get_node(target).attributes.position
+        distances, order = brute_force(positions, position)
+        expected = [(nodes[i].id, distances[i]) for i in order if nodes[i].id != target]
+        result = query.nearest(target, k=4, label="chair")
+        assert [n for n, _ in result] == [n for n, _ in expected[:4]]
+        np.testing.assert_allclose([d for _, d in result], [d for _, d in expected[:4]])
+        # A node is never its own neighbour, however it is named
+        assert query.nearest("O7", k=1)[0][0] != target
+        assert query.nearest(target.value)[0][0] != target
+
+    def test_within_radius(self, scene_graph):
+        query = dsg_query(scene_graph)
+        nodes = objects(scene_graph)
+        positions = np.array([n.attributes.position for n in nodes])
+        distances, _ = brute_force(positions, np.zeros(3))
+        result = query.within_radius([0.0, 0.0, 0.0], 20.0)
+        assert {n.value for n, _ in result} == {
+            nodes[i].id.value for i in np.nonzero(distances <= 20.0)[0]
+        }
+        assert [d for _, d in result] == sorted(d for _, d in result)
+
+    def test_labels(self, scene_graph):
+        query = dsg_query(scene_graph)
+        labels = [n.attributes.semantic_label for n in objects(scene_graph)]
+        counts = query.count_labels()
+        assert counts == {
+            OBJECT_LABELS[label]: labels.count(label) for label in set(labels)
+        }
+        assert len(query.nodes_with_label("Table")) == counts["table"]
+        assert query.nodes_with_label(1) == query.nodes_with_label("table")
+        with pytest.raises(ValueError, match="Unknown label"):
+            query.nodes_with_label("spaceship")
+        rooms = query.count_labels(spark_dsg.DsgLayers.ROOMS)
+        assert set(rooms) <= set(ROOM_LABELS)
+        assert sum(rooms.values()) == scene_graph.get_layer("ROOMS").num_nodes()
+
+    def test_rooms(self, scene_graph):
+        query = dsg_query(scene_graph)
+        room = spark_dsg.NodeSymbol("R", 0)
+        in_room = [
+            n.id
+            for n in objects(scene_graph)
+            if any(room.value in scene_graph.get_node(p).parents() for p in n.parents())
+        ]
+        assert set(query.objects_in_room(room)) == set(in_room)
+        for object_id in in_room:
+            assert room in query.rooms_of(object_id)
+        chairs = query.objects_in_room("R0", label="chair")
+        assert query.count_labels(room=room).get("chair", 0) == len(chairs)
+        # The last place has no room, and every 50th object no place
+        assert query.rooms_of("O49") == []
+        assert query.rooms_of(spark_dsg.NodeSymbol("P", 74)) == []
+
+    def test_node_ids(self, scene_graph):
+        symbol = spark_dsg.NodeSymbol("O", 12)
+        assert node_id_of(symbol) == node_id_of("O12") == node_id_of("O(12)")
+        assert node_id_of(scene_graph.get_node(symbol)) == symbol.value
+        with pytest.raises(ValueError):
+            node_id_of("chair")
+
+    def test_shared_until_graph_changes(self):
+        G = make_synthetic_scene_graph(20)
+        query = dsg_query(G)
+        assert dsg_query(G) is query
+        G.add_node(
+            spark_dsg.DsgLayers.OBJECTS,
+            spark_dsg.NodeSymbol("O", 100),
+            spark_dsg.ObjectNodeAttributes(),
+        )
+        assert dsg_query(G) is not query
+        assert sum(dsg_query(G).count_labels().values()) == 21
+
+
+class TestGeneratedCode:
+    def test_available_to_generated_code(self, scene_graph):
+        code = """
+def solve_task(G):
+    query = dsg_query(G)
+    return query.nearest("O3", label="chair")[0][0]
+"""
+        success, result = execute_generated_code(code, scene_graph)
+        assert success
+        assert result == dsg_query(scene_graph).nearest("O3", label="chair")[0][0]
+
+    def test_described_in_api_prompt(self):
+        prompt = load_dsg_api_prompt(
+            os.path.expandvars(API_FILEPATH), include_descriptions=True
+        )
+        assert "class DsgQuery" in prompt
+        assert "dsg_query(G)" in prompt
@@ -0,0 +1,81 @@
+"""
+Unit tests for caching the prompt encoding of an in-context scene graph.
+"""
+
+import threading
+
+import pytest
+
+from heracles_agents.dsg_interfaces import InContextDsgInterfaceConfig
+from heracles_agents.pipelines.in_context_utils import (
+    scene_graph_to_prompt,
+    scene_graph_to_prompt_full,
+)
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+
+@pytest.fixture
+def dsg_interface(tmp_path):
+    path = str(tmp_path / "dsg.json")
+    make_synthetic_scene_graph(40).save(path)
+    return InContextDsgInterfaceConfig(
+        dsg_interface_type="in_context",
+        dsg_filepath=path,
+        dsg_place_layer_name="MESH_PLACES",
+    )
+
+
+class CountingEncoder:
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.n_calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.n_calls += 1
+        return self.encoder(*args, **kwargs)
+
+
+class TestSerializationCache:
+    def test_encoded_once(self, dsg_interface):
+        encoder = CountingEncoder(scene_graph_to_prompt)
+        first = dsg_interface.get_serialized_dsg(encoder)
+        assert dsg_interface.get_serialized_dsg(encoder) is first
+        assert encoder.n_calls == 1
+        assert first == scene_graph_to_prompt(dsg_interface.get_dsg())
+
+    def test_keyed_by_encoder_and_parameters(self, dsg_interface):
+        full = dsg_interface.get_serialized_dsg(
+            scene_graph_to_prompt_full, place_layer_name="MESH_PLACES"
+        )
+        assert full == scene_graph_to_prompt_full(
+            dsg_interface.get_dsg(), "MESH_PLACES"
+        )
+        assert dsg_interface.get_serialized_dsg(scene_graph_to_prompt) != full
+
+        encoder = CountingEncoder(scene_graph_to_prompt_full)
+        dsg_interface.get_serialized_dsg(encoder, place_layer_name="MESH_PLACES")
+        dsg_interface.get_serialized_dsg(encoder, place_layer_name="PLACES")
+        assert encoder.n_calls == 2
+
+    def test_replaced_graph(self, dsg_interface):
+        encoder = CountingEncoder(scene_graph_to_prompt)
+        first = dsg_interface.get_serialized_dsg(encoder)
+        dsg_interface._dsg = make_synthetic_scene_graph(10, seed=1)
+        second = dsg_interface.get_serialized_dsg(encoder)
+        assert encoder.n_calls == 2
+        assert first != second
+
+    def test_concurrent_questions(self, dsg_interface):
+        encoder = CountingEncoder(scene_graph_to_prompt)
+        results = []
+
+        def question():
+            results.append(dsg_interface.get_serialized_dsg(encoder))
+
+        threads = [threading.Thread(target=question) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert encoder.n_calls == 1
+        assert len(set(results)) == 1
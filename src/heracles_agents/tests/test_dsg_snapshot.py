@@ -0,0 +1,203 @@
+"""
+Unit tests for binary snapshots of scene graph files.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import spark_dsg
+
+from heracles_agents.pipelines import dsg_snapshot
+from heracles_agents.pipelines.codegen_utils import DsgLoadCache, load_dsg
+from heracles_agents.pipelines.dsg_arrays import DsgArraysRegistry, LayerArrays
+from heracles_agents.pipelines.dsg_hierarchy import mark_dsg_changed
+from heracles_agents.pipelines.dsg_snapshot import (
+    DsgSnapshot,
+    DsgSnapshotCache,
+    snapshot_dir,
+    snapshot_path,
+)
+from heracles_agents.pipelines.in_context_utils import scene_graph_to_prompt_full
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+LAYERS = [spark_dsg.DsgLayers.OBJECTS, "MESH_PLACES", spark_dsg.DsgLayers.ROOMS]
+
+
+@pytest.fixture(autouse=True)
+def snapshots_dir(tmp_path, monkeypatch):
+    path = tmp_path / "snapshots"
+    monkeypatch.setenv("HERACLES_DSG_SNAPSHOT_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def dsg_filepath(tmp_path):
+    G = make_synthetic_scene_graph(60)
+    attrs = G.get_node(spark_dsg.NodeSymbol("O", 3)).attributes
+    attrs.bounding_box = spark_dsg.BoundingBox([1.0, 2.0, 3.0], [4.0, 5.0, 6.0])
+    (tmp_path / "data").mkdir()
+    path = str(tmp_path / "data" / "dsg.json")
+    G.save(path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    DsgSnapshotCache.clear()
+    DsgLoadCache.clear()
+    DsgArraysRegistry.clear()
+    yield
+    DsgSnapshotCache.clear()
+    DsgLoadCache.clear()
+    DsgArraysRegistry.clear()
+
+
+class TestDsgSnapshot:
+    def test_same_as_scene_graph(self, dsg_filepath):
+        G = spark_dsg.DynamicSceneGraph.load(dsg_filepath)
+        snapshot = DsgSnapshotCache.get(dsg_filepath)
+        assert isinstance(snapshot.ids, np.memmap)
+        assert len(snapshot) == G.num_nodes()
+        for layer in LAYERS:
+            expected = LayerArrays.from_layer(G, layer)
+            arrays = snapshot.layer_arrays(layer)
+            np.testing.assert_array_equal(arrays.ids, expected.ids)
+            np.testing.assert_array_equal(arrays.positions, expected.positions)
+            np.testing.assert_array_equal(arrays.labels, expected.labels)
+        assert snapshot.labelspace(2) == G.get_labelspace(2, 0).labels_to_names
+        assert snapshot.labelspace(5) is None
+
+    def test_bounding_boxes(self, dsg_filepath):
+        snapshot = DsgSnapshotCache.get(dsg_filepath)
+        row = snapshot.row_of(spark_dsg.NodeSymbol("O", 3).value)
+        np.testing.assert_array_equal(snapshot.bbox_min[row], [3.5, 4.0, 4.5])
+        np.testing.assert_array_equal(snapshot.bbox_max[row], [4.5, 6.0, 7.5])
+        other = snapshot.row_of(spark_dsg.NodeSymbol("O", 4).value)
+        assert np.isnan(snapshot.bbox_min[other]).all()
+
+    def test_edges(self, dsg_filepath):
+        G = spark_dsg.DynamicSceneGraph.load(dsg_filepath)
+        snapshot = DsgSnapshotCache.get(dsg_filepath)
+        for node_id in (
+            spark_dsg.NodeSymbol("O", 0).value,
+            spark_dsg.NodeSymbol("O", 49).value,
+            spark_dsg.NodeSymbol("P", 2).value,
+            spark_dsg.NodeSymbol("R", 0).value,
+        ):
+            node = G.get_node(node_id)
+            assert set(snapshot.parents_of(node_id)) == set(node.parents())
+            assert set(snapshot.children_of(node_id)) == set(node.children())
+        rows = snapshot.rows_of([spark_dsg.NodeSymbol("R", 0).value, 12345])
+        assert rows[0] >= 0 and rows[1] == -1
+        with pytest.raises(KeyError):
+            snapshot.parents_of(12345)
+
+    def test_reused(self, dsg_filepath):
+        DsgSnapshotCache.get(dsg_filepath)
+        manifest = os.path.join(snapshot_path(dsg_filepath), "manifest.json")
+        mtime = os.stat(manifest).st_mtime_ns
+        DsgSnapshotCache.clear()
+        snapshot = DsgSnapshotCache.get(dsg_filepath)
+        assert os.stat(manifest).st_mtime_ns == mtime
+        assert snapshot is DsgSnapshotCache.get(dsg_filepath)
+
+    def test_not_hashed_when_unchanged(self, dsg_filepath, monkeypatch):
+        DsgSnapshotCache.get(dsg_filepath)
+        DsgSnapshotCache.clear()
+
+        def fail(path):
+            raise AssertionError(f"{path} hashed")
+
+        monkeypatch.setattr(dsg_snapshot, "file_sha256", fail)
+        assert len(DsgSnapshotCache.get(dsg_filepath)) > 0
+
+    def test_touched_file_not_rebuilt(self, dsg_filepath):
+        first = DsgSnapshotCache.get(dsg_filepath)
+        arrays = os.path.join(snapshot_path(dsg_filepath), "ids.npy")
+        mtime = os.stat(arrays).st_mtime_ns
+        stat = os.stat(dsg_filepath)
+        os.utime(dsg_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        second = DsgSnapshotCache.get(dsg_filepath)
+        assert os.stat(arrays).st_mtime_ns == mtime
+        assert second.manifest["source_sha256"] == first.manifest["source_sha256"]
+        assert second.built_from(os.stat(dsg_filepath))
+        DsgSnapshotCache.clear()
+        assert DsgSnapshot.read(snapshot_path(dsg_filepath)).built_from(
+            os.stat(dsg_filepath)
+        )
+
+    def test_stored_outside_data_directory(self, dsg_filepath, snapshots_dir):
+        DsgSnapshotCache.get(dsg_filepath)
+        assert os.listdir(os.path.dirname(dsg_filepath)) == ["dsg.json"]
+        assert os.path.dirname(snapshot_path(dsg_filepath)) == str(snapshots_dir)
+
+    def test_default_directory(self, monkeypatch):
+        monkeypatch.delenv("HERACLES_DSG_SNAPSHOT_DIR")
+        monkeypatch.setenv("XDG_CACHE_HOME", "/tmp/cache")
+        assert snapshot_dir() == "/tmp/cache/heracles_agents/dsg_snapshots"
+        monkeypatch.delenv("XDG_CACHE_HOME")
+        assert snapshot_dir() == os.path.expanduser(
+            "~/.cache/heracles_agents/dsg_snapshots"
+        )
+
+    def test_same_name_in_different_directories(self, tmp_path):
+        assert snapshot_path(tmp_path / "a" / "dsg.json") != snapshot_path(
+            tmp_path / "b" / "dsg.json"
+        )
+
+    def test_rebuilt_when_file_changes(self, dsg_filepath):
+        first = DsgSnapshotCache.get(dsg_filepath)
+        make_synthetic_scene_graph(80).save(dsg_filepath)
+        second = DsgSnapshotCache.get(dsg_filepath)
+        assert second.manifest["source_sha256"] != first.manifest["source_sha256"]
+        assert len(second.layer_arrays(spark_dsg.DsgLayers.OBJECTS)) == 80
+
+    def test_unwritable_directory(self, dsg_filepath, monkeypatch):
+        def fail(self, path):
+            raise PermissionError(path)
+
+        monkeypatch.setattr(DsgSnapshot, "write", fail)
+        snapshot = DsgSnapshotCache.get(dsg_filepath)
+        assert not os.path.exists(snapshot_path(dsg_filepath))
+        assert len(snapshot.layer_arrays(spark_dsg.DsgLayers.OBJECTS)) == 60
+
+
+class TestLoadedSceneGraphs:
+    def test_arrays_from_snapshot(self, dsg_filepath):
+        G = load_dsg(dsg_filepath)
+        arrays = DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS)
+        assert isinstance(arrays.ids, np.memmap)
+        expected = spark_dsg.DynamicSceneGraph.load(dsg_filepath)
+        assert scene_graph_to_prompt_full(
+            G, "MESH_PLACES"
+        ) == scene_graph_to_prompt_full(expected, "MESH_PLACES")
+
+    def test_off_by_default(self, dsg_filepath, snapshots_dir, monkeypatch):
+        monkeypatch.delenv("HERACLES_DSG_SNAPSHOT_DIR")
+        G = load_dsg(dsg_filepath)
+        assert not isinstance(
+            DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS).ids, np.memmap
+        )
+        assert not os.path.exists(snapshots_dir)
+
+    def test_changed_graph_not_read_from_snapshot(self, dsg_filepath):
+        G = load_dsg(dsg_filepath, mutable=True)
+        assert not isinstance(
+            DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS).ids, np.memmap
+        )
+        G = load_dsg(dsg_filepath)
+        DsgArraysRegistry.invalidate(G)
+        assert not isinstance(
+            DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS).ids, np.memmap
+        )
+
+    def test_marked_graph_not_read_from_snapshot(self, dsg_filepath):
+        G = load_dsg(dsg_filepath)
+        assert isinstance(
+            DsgArraysRegistry.get(G, spark_dsg.DsgLayers.ROOMS).ids, np.memmap
+        )
+        mark_dsg_changed(G)
+        assert not isinstance(
+            DsgArraysRegistry.get(G, spark_dsg.DsgLayers.OBJECTS).ids, np.memmap
+        )
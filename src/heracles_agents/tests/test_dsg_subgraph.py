@@ -0,0 +1,183 @@
+"""
+Unit tests for selecting a question-relevant scene graph subgraph for in-context prompts.
+"""
+
+import numpy as np
+import pytest
+import spark_dsg
+
+from heracles_agents.dsg_interfaces import InContextDsgInterfaceConfig
+from heracles_agents.pipelines.dsg_subgraph import (
+    SubgraphSelector,
+    describe_dsg_for_question,
+    distances_to_seeds,
+    label_in_question,
+    normalize_text,
+)
+from heracles_agents.pipelines.in_context_utils import (
+    scene_graph_to_prompt,
+    scene_graph_to_prompt_full,
+)
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+
+class WordEncoder:
+    """Counts whitespace separated words as tokens"""
+
+    def encode(self, text):
+        return text.split()
+
+
+def object_labels(scene_graph, subgraph):
+    labelspace = scene_graph.get_labelspace(2, 0)
+    return [
+        labelspace.get_category(
+            scene_graph.get_node(
+                spark_dsg.NodeSymbol(s[0], int(s[1:]))
+            ).attributes.semantic_label
+        )
+        for s in subgraph.objects
+    ]
+
+
+@pytest.fixture(scope="module")
+def scene_graph():
+    return make_synthetic_scene_graph(300)
+
+
+@pytest.fixture(params=[None, "MESH_PLACES"])
+def selector(request, scene_graph):
+    return SubgraphSelector(scene_graph, WordEncoder(), request.param)
+
+
+class TestSubgraphSelector:
+    def test_whole_graph_fits(self, selector, scene_graph):
+        description, subgraph = selector.select("Where is the sofa?", 10**9)
+        if selector.full:
+            expected = scene_graph_to_prompt_full(scene_graph, "MESH_PLACES")
+        else:
+            expected = scene_graph_to_prompt(scene_graph)
+        assert description == expected
+        assert subgraph.complete
+        assert len(subgraph.objects) == 300
+
+    @pytest.mark.parametrize("budget", [100, 400, 1000])
+    def test_stops_at_budget(self, selector, budget):
+        description, subgraph = selector.select("Where is the sofa?", budget)
+        assert not subgraph.complete
+        assert subgraph.n_tokens <= budget
+        assert subgraph.n_tokens == len(description.split())
+        # The next ranked node would not have fit
+        assert subgraph.n_tokens > budget - 60
+
+    def test_matching_labels_first(self, selector, scene_graph):
+        _, subgraph = selector.select("How many sofas are there?", 150)
+        assert subgraph.matched_labels == ["sofa"]
+        assert set(object_labels(scene_graph, subgraph)) == {"sofa"}
+
+    def test_ancestors_included(self, selector, scene_graph):
+        _, subgraph = selector.select("Which room is the lamp in?", 400)
+        rooms = set(subgraph.rooms)
+        places = set(subgraph.places)
+        for symbol in subgraph.objects:
+            node = scene_graph.get_node(spark_dsg.NodeSymbol("O", int(symbol[1:])))
+            for place_id in node.parents():
+                if selector.full:
+                    assert spark_dsg.NodeSymbol(place_id).str(True) in places
+                for room_id in scene_graph.get_node(place_id).parents():
+                    assert spark_dsg.NodeSymbol(room_id).str(True) in rooms
+
+    def test_room_contents(self, selector, scene_graph):
+        _, subgraph = selector.select("What is in the kitchen?", 10**9)
+        assert subgraph.matched_labels == ["kitchen"]
+        _, subgraph = selector.select("What is in the kitchen?", 200)
+        kitchens = {
+            node.id.value
+            for node in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes
+            if node.attributes.semantic_label == 0
+        }
+        for symbol in subgraph.objects:
+            object_id = spark_dsg.NodeSymbol("O", int(symbol[1:])).value
+            assert set(selector.index.rooms_of_object(object_id)) & kitchens
+
+    def test_node_ids_and_neighbors(self, selector, scene_graph):
+        _, subgraph = selector.select("What is close to O17?", 200)
+        assert subgraph.matched_labels == ["O17"]
+        assert "O17" in subgraph.objects
+        # The other objects are the ones closest to O17
+        positions = {
+            node.id.str(True): node.attributes.position
+            for node in scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes
+        }
+        origin = positions["O17"]
+        chosen = max(np.linalg.norm(positions[s] - origin) for s in subgraph.objects)
+        n_closer = sum(np.linalg.norm(p - origin) < chosen for p in positions.values())
+        assert n_closer < len(subgraph.objects)
+
+
+class TestMatching:
+    def test_label_in_question(self):
+        question = normalize_text("Are there any Living-Rooms with chairs?")
+        assert label_in_question("living room", question)
+        assert label_in_question("chair", question)
+        assert not label_in_question("hair", question)
+        assert not label_in_question("", question)
+
+    def test_distances_to_seeds(self):
+        rng = np.random.default_rng(0)
+        positions = rng.uniform(-10, 10, size=(5000, 3))
+        seeds = rng.uniform(-10, 10, size=(7, 3))
+        expected = np.linalg.norm(
+            positions[:, None, :] - seeds[None, :, :], axis=-1
+        ).min(axis=1)
+        assert np.allclose(distances_to_seeds(positions, seeds), expected)
+
+
+class TestDescribeDsgForQuestion:
+    def make_interface(self, tmp_path, **kwargs):
+        path = str(tmp_path / "dsg.json")
+        make_synthetic_scene_graph(40).save(path)
+        return InContextDsgInterfaceConfig(
+            dsg_interface_type="in_context",
+            dsg_filepath=path,
+            dsg_place_layer_name="MESH_PLACES",
+            **kwargs,
+        )
+
+    def test_no_budget(self, tmp_path):
+        dsg_interface = self.make_interface(tmp_path)
+        description, subgraph = describe_dsg_for_question(
+            dsg_interface, "Where is the sofa?", "gpt-4.1"
+        )
+        assert subgraph is None
+        assert description is dsg_interface.get_serialized_dsg(scene_graph_to_prompt)
+
+    def test_budget(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(
+            "heracles_agents.pipelines.dsg_subgraph.get_token_encoder",
+            lambda model_name: WordEncoder(),
+        )
+        dsg_interface = self.make_interface(tmp_path, subgraph_token_budget=150)
+        description, subgraph = describe_dsg_for_question(
+            dsg_interface, "Where is the sofa?", "gpt-4.1", "MESH_PLACES"
+        )
+        assert subgraph.token_budget == 150
+        assert subgraph.n_tokens <= 150
+        assert len(subgraph.places) > 0
+        assert description.startswith("<Scene Graph>")
+
+
+class TestCompactSubgraph:
+    def test_stops_at_budget(self, scene_graph):
+        selector = SubgraphSelector(
+            scene_graph, WordEncoder(), "MESH_PLACES", "compact"
+        )
+        description, subgraph = selector.select("Where is the sofa?", 10**9)
+        assert description == scene_graph_to_prompt_full(
+            scene_graph, "MESH_PLACES", encoding="compact"
+        )
+        for budget in [100, 400]:
+            description, subgraph = selector.select("Where is the sofa?", budget)
+            # Group lines are part of the cost, so the encoding stays in budget
+            assert subgraph.n_tokens == len(description.split()) <= budget
+            assert set(object_labels(scene_graph, subgraph)) == {"sofa"}
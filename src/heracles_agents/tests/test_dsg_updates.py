@@ -0,0 +1,119 @@
+"""
+Unit tests for incremental scene graph update messages.
+"""
+
+import pytest
+import spark_dsg
+
+from heracles_agents.pipelines.dsg_updates import DsgUpdateTracker
+from heracles_agents.pipelines.in_context_utils import (
+    object_to_string_full,
+    object_to_string_room_parent,
+    scene_graph_to_prompt,
+    scene_graph_to_prompt_full,
+)
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+
+def add_object(scene_graph, index, place_index, position):
+    attrs = spark_dsg.ObjectNodeAttributes()
+    attrs.position = position
+    attrs.semantic_label = 1
+    scene_graph.add_node(
+        spark_dsg.DsgLayers.OBJECTS, spark_dsg.NodeSymbol("O", index), attrs
+    )
+    scene_graph.insert_edge(
+        spark_dsg.NodeSymbol("O", index), spark_dsg.NodeSymbol("P", place_index)
+    )
+    return scene_graph.get_node(spark_dsg.NodeSymbol("O", index))
+
+
+@pytest.fixture(params=[None, "MESH_PLACES"])
+def place_layer_name(request):
+    return request.param
+
+
+class TestDsgUpdateTracker:
+    def test_first_message_is_full_encoding(self, place_layer_name):
+        G = make_synthetic_scene_graph(100)
+        tracker = DsgUpdateTracker(place_layer_name)
+        if place_layer_name is None:
+            assert tracker.update_message(G) == scene_graph_to_prompt(G)
+        else:
+            assert tracker.update_message(G) == scene_graph_to_prompt_full(
+                G, place_layer_name
+            )
+        assert tracker.update_message(G) is None
+
+    def test_changes(self, place_layer_name):
+        G = make_synthetic_scene_graph(100)
+        tracker = DsgUpdateTracker(place_layer_name)
+        tracker.update_message(G)
+
+        moved = G.get_node(spark_dsg.NodeSymbol("O", 5))
+        moved.attributes.position = [1.0, 2.0, 3.0]
+        added = add_object(G, 100, 3, [4.0, 5.0, 6.0])
+        G.remove_node(spark_dsg.NodeSymbol("O", 7))
+        G.remove_node(spark_dsg.NodeSymbol("O", 8))
+
+        encode = (
+            object_to_string_room_parent
+            if place_layer_name is None
+            else object_to_string_full
+        )
+        message = tracker.update_message(G)
+        assert message == (
+            "<Scene Graph Update>"
+            f"\nAdded: {encode(added, G)}"
+            f"\nUpdated: {encode(moved, G)}"
+            "\nRemoved: O7, O8"
+            "\n</Scene Graph Update>"
+        )
+        assert "pos=(1.00,2.00,3.00)" in message
+        assert tracker.update_message(G) is None
+
+    def test_rewired_edge(self):
+        G = make_synthetic_scene_graph(100)
+        tracker = DsgUpdateTracker("MESH_PLACES")
+        tracker.update_message(G)
+        # Moving an object to another place changes neither the number of nodes
+        # nor the number of edges
+        object_id = spark_dsg.NodeSymbol("O", 0)
+        (place_id,) = G.get_node(object_id).parents()
+        G.remove_edge(object_id, place_id)
+        G.insert_edge(object_id, spark_dsg.NodeSymbol("P", 20))
+        message = tracker.update_message(G)
+        assert message.startswith("<Scene Graph Update>\nUpdated: \n-\t(id=O0,")
+        assert "parent_places={'P20'}" in message
+
+    def test_large_change_resends_everything(self):
+        G = make_synthetic_scene_graph(20, n_places=2, n_rooms=1)
+        tracker = DsgUpdateTracker()
+        tracker.update_message(G)
+        for node in G.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes:
+            node.attributes.position = [0.0, 0.0, 0.0]
+        G.remove_node(spark_dsg.NodeSymbol("R", 0))
+        message = tracker.update_message(G)
+        assert message == scene_graph_to_prompt(G)
+        assert "pos=(0.00,0.00,0.00)" in message
+
+    def test_full_message_after_moves(self):
+        G = make_synthetic_scene_graph(100)
+        tracker = DsgUpdateTracker("MESH_PLACES")
+        tracker.update_message(G)
+        G.get_node(spark_dsg.NodeSymbol("O", 5)).attributes.position = [1.0, 2.0, 3.0]
+        # Neither the node nor the edge count changed, but the full message
+        # has the new position
+        (line,) = [
+            line
+            for line in tracker.full_message(G).split("\n")
+            if line.startswith("-\t(id=O5,")
+        ]
+        assert "pos=(1.00,2.00,3.00)" in line
+
+    def test_update_is_small(self):
+        G = make_synthetic_scene_graph(1000)
+        tracker = DsgUpdateTracker("MESH_PLACES")
+        full = tracker.update_message(G)
+        add_object(G, 1000, 0, [0.0, 0.0, 0.0])
+        assert len(tracker.update_message(G)) < len(full) / 100
@@ -0,0 +1,94 @@
+"""
+Unit tests for the per-question experiment checkpoint store.
+"""
+
+import threading
+
+from heracles_agents.experiment_checkpoint import CheckpointStore
+from heracles_agents.llm_interface import (
+    AgentResponse,
+    AgentSequence,
+    AnalyzedQuestion,
+    EvalQuestion,
+    QuestionAnalysis,
+)
+
+
+def make_analyzed_question(uid, correct=True):
+    question = EvalQuestion(
+        name=f"q{uid}",
+        question=f"Question {uid}?",
+        solution="<1, 2>",
+        uid=uid,
+        tags=["test"],
+        correctness_comparator={"comparison_type": "PDDL", "relation": "equal"},
+    )
+    analysis = QuestionAnalysis(
+        valid_answer_format=True,
+        correct=correct,
+        input_tokens=10,
+        output_tokens=5,
+        n_tool_calls=1,
+    )
+    sequence = AgentSequence(
+        description="test-agent",
+        responses=[AgentResponse(raw_response="raw", parsed_response="parsed")],
+    )
+    return AnalyzedQuestion(
+        question=question, sequences=[sequence], answer="<1, 2>", analysis=analysis
+    )
+
+
+class TestCheckpointStore:
+    def test_empty_checkpoint(self, tmp_path):
+        store = CheckpointStore(str(tmp_path))
+        assert store.for_configuration("config").load() == {}
+
+    def test_round_trip(self, tmp_path):
+        store = CheckpointStore(str(tmp_path))
+        checkpoint = store.for_configuration("config")
+        aq = make_analyzed_question("a1")
+        checkpoint.append(aq)
+
+        loaded = CheckpointStore(str(tmp_path)).for_configuration("config").load()
+        assert list(loaded.keys()) == ["a1"]
+        assert loaded["a1"] == aq
+
+    def test_configurations_are_separate(self, tmp_path):
+        store = CheckpointStore(str(tmp_path))
+        store.for_configuration("first").append(make_analyzed_question(1))
+        store.for_configuration("second").append(make_analyzed_question(2))
+
+        assert list(store.for_configuration("first").load().keys()) == [1]
+        assert list(store.for_configuration("second").load().keys()) == [2]
+        assert store.for_configuration("first") is store.for_configuration("first")
+
+    def test_truncated_line_is_skipped(self, tmp_path):
+        checkpoint = CheckpointStore(str(tmp_path)).for_configuration("config")
+        checkpoint.append(make_analyzed_question(1))
+        with open(checkpoint.path, "a") as fo:
+            fo.write('{"question": {"name": "q2"')
+
+        assert list(checkpoint.load().keys()) == [1]
+
+    def test_later_entries_take_precedence(self, tmp_path):
+        checkpoint = CheckpointStore(str(tmp_path)).for_configuration("config")
+        checkpoint.append(make_analyzed_question(1, correct=False))
+        checkpoint.append(make_analyzed_question(1, correct=True))
+
+        assert checkpoint.load()[1].analysis.correct
+
+    def test_concurrent_appends(self, tmp_path):
+        checkpoint = CheckpointStore(str(tmp_path)).for_configuration("config")
+        threads = [
+            threading.Thread(
+                target=checkpoint.append, args=(make_analyzed_question(i),)
+            )
+            for i in range(32)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert set(checkpoint.load().keys()) == set(range(32))
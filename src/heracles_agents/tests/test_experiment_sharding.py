@@ -0,0 +1,143 @@
+"""
+Unit tests for splitting an experiment into shards and merging the shard results.
+"""
+
+import pytest
+
+from heracles_agents.experiment_cli import write_analyzed_experiment
+from heracles_agents.experiment_definition import (
+    ExperimentConfiguration,
+    ExperimentDescription,
+)
+from heracles_agents.experiment_sharding import (
+    load_analyzed_experiment,
+    merge_shard_results,
+    question_shard,
+    shard_experiment,
+)
+from heracles_agents.llm_interface import (
+    AnalyzedExperiment,
+    AnalyzedQuestion,
+    AnalyzedQuestions,
+    EvalQuestion,
+    QuestionAnalysis,
+)
+
+
+def make_question(uid):
+    return EvalQuestion(
+        name=f"q{uid}",
+        question=f"Question {uid}?",
+        solution="1",
+        uid=uid,
+        correctness_comparator={"comparison_type": "SLDP", "relation": "equal"},
+    )
+
+
+def make_analyzed_question(question):
+    analysis = QuestionAnalysis(
+        valid_answer_format=True,
+        correct=True,
+        input_tokens=1,
+        output_tokens=1,
+        n_tool_calls=0,
+    )
+    return AnalyzedQuestion(
+        question=question, sequences=[], answer="1", analysis=analysis
+    )
+
+
+def make_experiment():
+    # Skip validation so that the test doesn't need real agents and prompts
+    configurations = {
+        "first": ExperimentConfiguration.model_construct(
+            questions=[make_question(i) for i in range(50)], n_workers=1
+        ),
+        "second": ExperimentConfiguration.model_construct(
+            questions=[make_question(f"s{i}") for i in range(30)], n_workers=1
+        ),
+    }
+    return ExperimentDescription.model_construct(
+        metadata={"experiment": "sharding"},
+        configurations=configurations,
+        max_parallel_configurations=1,
+        provider_budgets=[],
+    )
+
+
+def run_shard(shard):
+    return AnalyzedExperiment(
+        experiment_configurations={
+            name: AnalyzedQuestions(
+                analyzed_questions=[make_analyzed_question(q) for q in c.questions]
+            )
+            for name, c in shard.configurations.items()
+        }
+    )
+
+
+class TestQuestionShard:
+    def test_stable(self):
+        # Must not depend on the per-process salt of hash()
+        assert question_shard("abc", 7) == question_shard("abc", 7)
+        assert question_shard(12, 5) == question_shard("12", 5)
+
+    def test_range_and_spread(self):
+        shards = [question_shard(i, 4) for i in range(400)]
+        assert set(shards) == {0, 1, 2, 3}
+
+
+class TestShardExperiment:
+    def test_shards_partition_questions(self):
+        experiment = make_experiment()
+        n_shards = 3
+        shards = [shard_experiment(experiment, i, n_shards) for i in range(n_shards)]
+
+        for name, config in experiment.configurations.items():
+            sharded_uids = [
+                q.uid for s in shards for q in s.configurations[name].questions
+            ]
+            assert sorted(map(str, sharded_uids)) == sorted(
+                str(q.uid) for q in config.questions
+            )
+        # The original experiment is not modified
+        assert len(experiment.configurations["first"].questions) == 50
+
+    def test_invalid_shard(self):
+        with pytest.raises(ValueError):
+            shard_experiment(make_experiment(), 3, 3)
+        with pytest.raises(ValueError):
+            shard_experiment(make_experiment(), 0, 0)
+
+
+class TestMergeShardResults:
+    def test_merge_restores_order(self, tmp_path):
+        experiment = make_experiment()
+        n_shards = 4
+        shard_fns = []
+        for i in range(n_shards):
+            fn = str(tmp_path / f"shard{i}.yaml")
+            write_analyzed_experiment(
+                run_shard(shard_experiment(experiment, i, n_shards)), fn
+            )
+            shard_fns.append(fn)
+
+        merged = merge_shard_results(
+            experiment, [load_analyzed_experiment(fn) for fn in reversed(shard_fns)]
+        )
+
+        assert merged.metadata == {"experiment": "sharding"}
+        for name, config in experiment.configurations.items():
+            merged_uids = [
+                aq.question.uid
+                for aq in merged.experiment_configurations[name].analyzed_questions
+            ]
+            assert merged_uids == [q.uid for q in config.questions]
+
+    def test_missing_shard_raises(self):
+        experiment = make_experiment()
+        shard_results = [
+            run_shard(shard_experiment(experiment, i, 3)) for i in range(2)
+        ]
+        with pytest.raises(ValueError, match="missing results"):
+            merge_shard_results(experiment, shard_results)
@@ -0,0 +1,183 @@
+"""
+Unit tests for caching compiled generated code and its results.
+"""
+
+import pytest
+
+from heracles_agents.dsg_interfaces import PythonDsgInterface
+from heracles_agents.pipelines.codegen_utils import (
+    execute_generated_code,
+    execute_generated_code_timed,
+)
+from heracles_agents.pipelines.generated_code_cache import (
+    CodeResultCache,
+    CompiledCodeCache,
+    code_hash,
+    is_deterministic,
+)
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+
+API_FILEPATH = "$HERACLES_AGENTS_PATH/examples/prompts/spark_dsg_api_prompt.yaml"
+
+COUNT_OBJECTS = """
+def solve_task(G):
+    return G.get_layer(spark_dsg.DsgLayers.OBJECTS).num_nodes()
+"""
+
+COUNT_OBJECTS_REFORMATTED = """
+# Count the objects
+def solve_task(G):
+
+    return G.get_layer(spark_dsg.DsgLayers.OBJECTS).num_nodes()  # all of them
+"""
+
+SUM_X = """
+def solve_task(G):
+    objects = G.get_layer(spark_dsg.DsgLayers.OBJECTS)
+    return round(sum(node.attributes.position[0] for node in objects.nodes), 6)
+"""
+
+RANDOM_OBJECT = """
+def solve_task(G):
+    import random
+
+    objects = list(G.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes)
+    return random.choice(objects).id.value
+"""
+
+FAILING = """
+def solve_task(G):
+    return G.no_such_method()
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    CompiledCodeCache.clear()
+    CodeResultCache.clear()
+    yield
+    CompiledCodeCache.clear()
+    CodeResultCache.clear()
+
+
+@pytest.fixture
+def dsg_filepath(tmp_path):
+    path = str(tmp_path / "dsg.json")
+    make_synthetic_scene_graph(25).save(path)
+    return path
+
+
+def python_interface(dsg_filepath, **kwargs):
+    return PythonDsgInterface(
+        dsg_interface_type="python",
+        dsg_filepath=dsg_filepath,
+        dsg_api_filepath=API_FILEPATH,
+        **kwargs,
+    )
+
+
+class TestCodeHash:
+    def test_ignores_comments_and_formatting(self):
+        assert code_hash(COUNT_OBJECTS) == code_hash(COUNT_OBJECTS_REFORMATTED)
+        assert code_hash(COUNT_OBJECTS) != code_hash(FAILING)
+
+    def test_invalid_code(self):
+        assert code_hash("def solve_task(G)\n  ") == code_hash("def solve_task(G)")
+        assert code_hash("def solve_task(G)") != code_hash("def solve_task(H)")
+
+
+class TestCompiledCodeCache:
+    def test_compiled_once(self):
+        code = CompiledCodeCache.get(COUNT_OBJECTS)
+        assert CompiledCodeCache.get(COUNT_OBJECTS) is code
+        G = make_synthetic_scene_graph(10)
+        assert execute_generated_code(COUNT_OBJECTS, G) == (True, 10)
+
+    def test_syntax_error(self):
+        success, _ = execute_generated_code("def solve_task(G)", None)
+        assert not success
+        assert len(CompiledCodeCache.code) == 0
+
+    def test_bounded(self, monkeypatch):
+        monkeypatch.setattr(CompiledCodeCache, "max_entries", 3)
+        for i in range(5):
+            CompiledCodeCache.get(f"x = {i}")
+        assert list(CompiledCodeCache.code) == ["x = 2", "x = 3", "x = 4"]
+
+
+class TestCodeResultCache:
+    def test_cache_hit(self, dsg_filepath):
+        dsg_interface = python_interface(dsg_filepath)
+        success, result, usage = execute_generated_code_timed(
+            COUNT_OBJECTS, dsg_interface
+        )
+        assert (success, result, usage.cache_hit) == (True, 25, False)
+        success, result, usage = execute_generated_code_timed(
+            COUNT_OBJECTS_REFORMATTED, python_interface(dsg_filepath)
+        )
+        assert (success, result, usage.cache_hit) == (True, 25, True)
+        assert usage.cpu_time_s is None
+
+    def test_failures_not_cached(self, dsg_filepath):
+        dsg_interface = python_interface(dsg_filepath)
+        for _ in range(2):
+            success, _, usage = execute_generated_code_timed(FAILING, dsg_interface)
+            assert not success and not usage.cache_hit
+
+    def test_shared_not_cached(self, dsg_filepath):
+        dsg_interface = python_interface(dsg_filepath, share_dsg=True)
+        for _ in range(2):
+            _, _, usage = execute_generated_code_timed(COUNT_OBJECTS, dsg_interface)
+            assert not usage.cache_hit
+        disabled = python_interface(dsg_filepath, cache_code_results=False)
+        for _ in range(2):
+            _, _, usage = execute_generated_code_timed(COUNT_OBJECTS, disabled)
+            assert not usage.cache_hit
+
+    def test_scene_graph_changed(self, dsg_filepath):
+        dsg_interface = python_interface(dsg_filepath)
+        execute_generated_code_timed(COUNT_OBJECTS, dsg_interface)
+        make_synthetic_scene_graph(40).save(dsg_filepath)
+        success, result, usage = execute_generated_code_timed(
+            COUNT_OBJECTS, python_interface(dsg_filepath)
+        )
+        assert (success, result, usage.cache_hit) == (True, 40, False)
+
+    def test_same_size_different_contents(self, dsg_filepath):
+        _, first, _ = execute_generated_code_timed(
+            SUM_X, python_interface(dsg_filepath)
+        )
+        make_synthetic_scene_graph(25, seed=1).save(dsg_filepath)
+        success, result, usage = execute_generated_code_timed(
+            SUM_X, python_interface(dsg_filepath)
+        )
+        assert success and not usage.cache_hit
+        assert result != first
+
+    def test_nondeterministic_not_cached(self, dsg_filepath):
+        dsg_interface = python_interface(dsg_filepath)
+        for _ in range(2):
+            success, _, usage = execute_generated_code_timed(
+                RANDOM_OBJECT, dsg_interface
+            )
+            assert success and not usage.cache_hit
+
+
+class TestIsDeterministic:
+    @pytest.mark.parametrize(
+        "python_code",
+        [
+            RANDOM_OBJECT,
+            "from random import choice",
+            "import numpy as np\nx = np.random.rand()",
+            "import time\nx = time.time()",
+            "def solve_task(G):\n    return os.getpid()",
+            "def solve_task(G)",
+        ],
+    )
+    def test_nondeterministic(self, python_code):
+        assert not is_deterministic(python_code)
+
+    def test_deterministic(self):
+        assert is_deterministic(COUNT_OBJECTS)
+        assert is_deterministic(SUM_X)
@@ -0,0 +1,349 @@
+"""
+Unit tests for the in-context scene graph encoders.
+"""
+
+import numpy as np
+import pytest
+import spark_dsg
+
+from heracles_agents.pipelines.in_context_utils import (
+    PromptingFailure,
+    SceneGraphStrings,
+    get_position_string,
+    get_position_string_compact,
+    iter_scene_graph_to_prompt,
+    iter_scene_graph_to_prompt_full,
+    object_to_string_full,
+    position_strings,
+    position_strings_compact,
+    scene_graph_to_prompt,
+    scene_graph_to_prompt_full,
+)
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+from heracles_agents.token_utils import count_tokens, join_within_tokens
+
+# Reference encoders, written the way the encoders were originally implemented:
+# one node at a time, looking every referenced node up in the scene graph.
+
+
+def format_symbols(symbols):
+    if not symbols:
+        return "none"
+    return "{" + ", ".join(repr(symbol) for symbol in sorted(symbols)) + "}"
+
+
+def symbols_of(node_ids, scene_graph):
+    return {scene_graph.get_node(node_id).id.str(True) for node_id in node_ids}
+
+
+def reference_symbols(node_ids, scene_graph):
+    return format_symbols(symbols_of(node_ids, scene_graph))
+
+
+def reference_position(attrs):
+    return f"({attrs.position[0]:.2f},{attrs.position[1]:.2f},{attrs.position[2]:.2f})"
+
+
+def reference_prompt(scene_graph):
+    objects_string = ""
+    for node in scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes:
+        category = scene_graph.get_labelspace(2, 0).get_category(
+            node.attributes.semantic_label
+        )
+        rooms = set()
+        for place_id in node.parents():
+            for room_id in scene_graph.get_node(place_id).parents():
+                rooms.add(scene_graph.get_node(room_id).id.str(True))
+        rooms = format_symbols(rooms)
+        objects_string += f"\n-\t(id={node.id.str(True)}, type={category}, pos={reference_position(node.attributes)}, parent_rooms={rooms})"
+    rooms_string = ""
+    for node in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes:
+        category = scene_graph.get_labelspace(4, 0).get_category(
+            node.attributes.semantic_label
+        )
+        rooms_string += f"\n-\t(id={node.id.str(True)}, type={category})"
+    return (
+        f"<Scene Graph>\nObjects: {objects_string}\nRooms: {rooms_string}</Scene Graph>"
+    )
+
+
+def reference_prompt_full(scene_graph, place_layer_name):
+    objects_string = ""
+    for node in scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes:
+        category = scene_graph.get_labelspace(2, 0).get_category(
+            node.attributes.semantic_label
+        )
+        places = reference_symbols(node.parents(), scene_graph)
+        objects_string += f"\n-\t(id={node.id.str(True)}, type={category}, pos={reference_position(node.attributes)}, parent_places={places})"
+    places_string = ""
+    for node in scene_graph.get_layer(place_layer_name).nodes:
+        siblings = reference_symbols(node.siblings(), scene_graph)
+        rooms = reference_symbols(node.parents(), scene_graph)
+        places_string += (
+            f"\n-\t(id={node.id.str(True)}, siblings={siblings}, parent_rooms={rooms})"
+        )
+    rooms_string = ""
+    for node in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes:
+        category = scene_graph.get_labelspace(4, 0).get_category(
+            node.attributes.semantic_label
+        )
+        siblings = reference_symbols(node.siblings(), scene_graph)
+        rooms_string += f"\n-\t(id={node.id.str(True)}, type={category}, pos={reference_position(node.attributes)}, siblings={siblings})"
+    return f"<Scene Graph>\nObjects: {objects_string}\nPlaces: {places_string}\n Rooms: {rooms_string}\n</Scene Graph>"
+
+
+@pytest.fixture(params=[1, 10, 300])
+def scene_graph(request):
+    return make_synthetic_scene_graph(request.param, seed=request.param)
+
+
+class TestSceneGraphEncoders:
+    def test_same_as_reference(self, scene_graph):
+        assert scene_graph_to_prompt(scene_graph) == reference_prompt(scene_graph)
+
+    def test_full_same_as_reference(self, scene_graph):
+        assert scene_graph_to_prompt_full(
+            scene_graph, "MESH_PLACES"
+        ) == reference_prompt_full(scene_graph, "MESH_PLACES")
+
+    def test_orphans(self):
+        scene_graph = make_synthetic_scene_graph(50, n_places=2, n_rooms=1)
+        encoding = scene_graph_to_prompt_full(scene_graph, "MESH_PLACES")
+        # The last object has no place and the last place has no room
+        assert "(id=O49, type=" in encoding
+        assert "parent_places=none)" in encoding
+        assert "(id=P1, siblings={'P0'}, parent_rooms=none)" in encoding
+        assert "parent_rooms=none)" in scene_graph_to_prompt(scene_graph)
+
+    def test_missing_labelspace(self):
+        scene_graph = make_synthetic_scene_graph(5)
+        scene_graph.set_labelspace(spark_dsg.Labelspace(), 2, 0)
+        with pytest.raises(PromptingFailure, match="object labelspace"):
+            scene_graph_to_prompt_full(scene_graph, "MESH_PLACES")
+
+
+class TestSceneGraphStrings:
+    def test_symbols_and_categories(self):
+        scene_graph = make_synthetic_scene_graph(20)
+        strings = SceneGraphStrings(scene_graph)
+        node = scene_graph.get_node(spark_dsg.NodeSymbol("O", 3))
+        assert strings.symbol(node.id.value) == "O3"
+        assert strings.symbol_set([]) == "none"
+        rooms = [spark_dsg.NodeSymbol("R", i).value for i in (2, 0, 1, 0)]
+        assert strings.symbol_set(rooms) == "{'R0', 'R1', 'R2'}"
+        assert strings.category(
+            2, node.attributes.semantic_label
+        ) == scene_graph.get_labelspace(2, 0).get_category(
+            node.attributes.semantic_label
+        )
+        # Encoding single nodes with or without a shared table gives the same string
+        assert object_to_string_full(
+            node, scene_graph, strings
+        ) == object_to_string_full(node, scene_graph)
+
+
+def compact_symbols(node_ids, scene_graph, empty):
+    symbols = symbols_of(node_ids, scene_graph)
+    return ",".join(sorted(symbols)) if symbols else empty
+
+
+def parse_compact(encoding):
+    """Rows of each table of a compact encoding, with the group they are listed under"""
+    tables = {}
+    table, group = None, None
+    for line in encoding.split("\n")[1:-1]:
+        if line.startswith(("Objects [", "Places [", "Rooms [")):
+            table, group = line.split(" ")[0], None
+            tables[table] = []
+        elif line.startswith("@"):
+            group = line[1:]
+        elif table is not None:
+            tables[table].append((group, line.split(" ")))
+    return tables
+
+
+class TestCompactEncoding:
+    def test_same_graph_as_default(self):
+        scene_graph = make_synthetic_scene_graph(120, seed=3)
+        encoding = scene_graph_to_prompt_full(
+            scene_graph, "MESH_PLACES", encoding="compact"
+        )
+        assert encoding.startswith("<Scene Graph format=compact>\nObject types: 0=")
+        tables = parse_compact(encoding)
+        object_labelspace = scene_graph.get_labelspace(2, 0)
+
+        objects = list(scene_graph.get_layer(spark_dsg.DsgLayers.OBJECTS).nodes)
+        assert len(tables["Objects"]) == len(objects)
+        rows = {row[0]: (group, row[1:]) for group, row in tables["Objects"]}
+        for node in objects:
+            group, (label, x, y, z) = rows[node.id.str(True)]
+            assert group == compact_symbols(node.parents(), scene_graph, "none")
+            assert f"{label}={object_labelspace.get_category(int(label))}" in encoding
+            assert [float(x), float(y), float(z)] == pytest.approx(
+                node.attributes.position, abs=0.051
+            )
+
+        rows = {row[0]: (group, row[1]) for group, row in tables["Places"]}
+        for node in scene_graph.get_layer("MESH_PLACES").nodes:
+            group, siblings = rows[node.id.str(True)]
+            assert group == compact_symbols(node.parents(), scene_graph, "none")
+            assert siblings == compact_symbols(node.siblings(), scene_graph, "-")
+        rows = {row[0]: row[1:] for _, row in tables["Rooms"]}
+        for node in scene_graph.get_layer(spark_dsg.DsgLayers.ROOMS).nodes:
+            label, x, y, z, siblings = rows[node.id.str(True)]
+            assert int(label) == node.attributes.semantic_label
+            assert siblings == compact_symbols(node.siblings(), scene_graph, "-")
+
+    def test_shorter(self):
+        scene_graph = make_synthetic_scene_graph(300)
+        compact = scene_graph_to_prompt_full(
+            scene_graph, "MESH_PLACES", encoding="compact"
+        )
+        assert (
+            len(compact)
+            < len(scene_graph_to_prompt_full(scene_graph, "MESH_PLACES")) / 2
+        )
+
+    def test_node_ids(self):
+        scene_graph = make_synthetic_scene_graph(50, n_places=5, n_rooms=2)
+        node_ids = {
+            spark_dsg.NodeSymbol("O", 3).value,
+            spark_dsg.NodeSymbol("P", 1).value,
+            spark_dsg.NodeSymbol("R", 0).value,
+        }
+        tables = parse_compact(
+            scene_graph_to_prompt_full(
+                scene_graph, "MESH_PLACES", node_ids=node_ids, encoding="compact"
+            )
+        )
+        assert [row[0] for _, row in tables["Objects"]] == ["O3"]
+        assert [row[0] for _, row in tables["Places"]] == ["P1"]
+        assert [row[0] for _, row in tables["Rooms"]] == ["R0"]
+
+    def test_unknown_encoding(self):
+        with pytest.raises(ValueError, match="Unknown scene graph encoding"):
+            scene_graph_to_prompt_full(
+                make_synthetic_scene_graph(5), "MESH_PLACES", encoding="tabular"
+            )
+
+
+class WordEncoder:
+    """Counts whitespace separated words as tokens"""
+
+    def encode(self, text):
+        return text.split()
+
+
+class TestStreamingEncoding:
+    @pytest.mark.parametrize("encoding", ["default", "compact"])
+    def test_same_as_joined(self, scene_graph, encoding):
+        chunks = list(
+            iter_scene_graph_to_prompt_full(
+                scene_graph, "MESH_PLACES", encoding=encoding, chunk_lines=7
+            )
+        )
+        assert "".join(chunks) == scene_graph_to_prompt_full(
+            scene_graph, "MESH_PLACES", encoding=encoding
+        )
+        assert "".join(
+            iter_scene_graph_to_prompt(scene_graph, chunk_lines=7)
+        ) == scene_graph_to_prompt(scene_graph)
+
+    def test_chunks_of_lines(self):
+        scene_graph = make_synthetic_scene_graph(300)
+        chunks = list(
+            iter_scene_graph_to_prompt_full(scene_graph, "MESH_PLACES", chunk_lines=50)
+        )
+        assert len(chunks) > 6
+        # Node chunks start on a new node line
+        assert all(chunk.startswith("\n") for chunk in chunks[1:])
+        assert max(chunk.count("\n-\t") for chunk in chunks) == 50
+
+    def test_unknown_encoding_is_raised_eagerly(self):
+        with pytest.raises(ValueError, match="Unknown scene graph encoding"):
+            iter_scene_graph_to_prompt_full(
+                make_synthetic_scene_graph(5), "MESH_PLACES", encoding="tabular"
+            )
+
+    def test_count_tokens(self):
+        scene_graph = make_synthetic_scene_graph(300)
+        encoder = WordEncoder()
+        for encoding in ("default", "compact"):
+            chunks = iter_scene_graph_to_prompt_full(
+                scene_graph, "MESH_PLACES", encoding=encoding, chunk_lines=16
+            )
+            prompt = scene_graph_to_prompt_full(
+                scene_graph, "MESH_PLACES", encoding=encoding
+            )
+            assert count_tokens(chunks, encoder) == len(encoder.encode(prompt))
+
+    def test_join_within_tokens(self):
+        scene_graph = make_synthetic_scene_graph(300)
+        encoder = WordEncoder()
+        prompt = scene_graph_to_prompt_full(scene_graph, "MESH_PLACES")
+        n_prompt_tokens = len(encoder.encode(prompt))
+
+        text, n_tokens, complete = join_within_tokens(
+            iter_scene_graph_to_prompt_full(scene_graph, "MESH_PLACES"),
+            encoder,
+            n_prompt_tokens,
+        )
+        assert (text, n_tokens, complete) == (prompt, n_prompt_tokens, True)
+
+        text, n_tokens, complete = join_within_tokens(
+            iter_scene_graph_to_prompt_full(scene_graph, "MESH_PLACES", chunk_lines=64),
+            encoder,
+            500,
+        )
+        assert not complete
+        assert n_tokens == len(encoder.encode(text)) <= 500
+        # Truncated at a line boundary, and the next line would not have fit
+        assert prompt.startswith(text)
+        next_line = prompt[len(text) :].split("\n", 2)[1]
+        assert n_tokens + len(encoder.encode(next_line)) > 500
+
+    def test_join_within_tokens_stops_encoding(self):
+        requested = []
+
+        def chunks():
+            for i in range(10):
+                requested.append(i)
+                yield f"\nline {i}"
+
+        text, n_tokens, complete = join_within_tokens(chunks(), WordEncoder(), 5)
+        assert (text, n_tokens, complete) == ("\nline 0\nline 1", 4, False)
+        assert requested == [0, 1, 2]
+
+
+class Attributes:
+    def __init__(self, position):
+        self.position = np.asarray(position)
+
+
+class TestBulkFormatting:
+    positions = np.concatenate(
+        [
+            np.random.default_rng(0).uniform(-100, 100, size=(500, 3)),
+            # Ties, and coordinates that round to (negative) zero
+            [[0.15, -0.15, 0.25], [-0.04, -0.05, -0.0], [0.005, -0.005, 1e-9]],
+            [[-0.049, 0.049, 2.675], [1e6, -1e6, 0.0]],
+        ]
+    )
+
+    def test_position_strings(self):
+        assert position_strings(self.positions) == [
+            get_position_string(Attributes(p)) for p in self.positions
+        ]
+
+    def test_position_strings_compact(self):
+        assert position_strings_compact(self.positions) == [
+            get_position_string_compact(Attributes(p)) for p in self.positions
+        ]
+        assert position_strings_compact(self.positions, decimals=0) == [
+            get_position_string_compact(Attributes(p), decimals=0)
+            for p in self.positions
+        ]
+
+    def test_empty(self):
+        assert position_strings(np.empty((0, 3))) == []
+        assert position_strings_compact(np.empty((0, 3))) == []
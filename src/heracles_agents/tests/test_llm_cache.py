@@ -0,0 +1,111 @@
+"""
+Unit tests for the LLM record / replay cache.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from heracles_agents.llm_agent import ModelInfo
+from heracles_agents.llm_cache import (
+    LlmCacheConfig,
+    LlmCacheMiss,
+    LlmCacheRegistry,
+    make_request_key,
+)
+from heracles_agents.llm_interface import AgentContext
+from heracles_agents.prompt import InContextExample
+
+
+def make_agent(responses):
+    client = Mock()
+    client.client_type = "openai"
+    client.call = Mock(side_effect=responses)
+    return SimpleNamespace(
+        model_info=ModelInfo(model="gpt-4.1-nano", temperature=0.2, seed=1),
+        agent_info=SimpleNamespace(tool_interface="none", tools={}),
+        client=client,
+    )
+
+
+HISTORY = [
+    {"role": "developer", "content": "You are a helpful assistant"},
+    {"role": "user", "content": "How many chairs are there?"},
+]
+
+
+class TestCacheKey:
+    def setup_method(self):
+        self.model_info = ModelInfo(model="gpt-4.1-nano", temperature=0.2)
+
+    def test_key_is_stable(self):
+        key1 = make_request_key("openai", self.model_info, [], "text", HISTORY)
+        reordered = [{"content": m["content"], "role": m["role"]} for m in HISTORY]
+        key2 = make_request_key("openai", self.model_info, [], "text", reordered)
+        assert key1 == key2
+
+    def test_key_depends_on_request(self):
+        key = make_request_key("openai", self.model_info, [], "text", HISTORY)
+        other_model = ModelInfo(model="gpt-4.1-nano", temperature=1.0)
+        tools = [{"type": "function", "name": "run_cypher_query"}]
+        assert key != make_request_key("openai", other_model, [], "text", HISTORY)
+        assert key != make_request_key(
+            "openai", self.model_info, tools, "text", HISTORY
+        )
+        assert key != make_request_key(
+            "openai", self.model_info, [], "text", HISTORY[:1]
+        )
+        assert key != make_request_key("ollama", self.model_info, [], "text", HISTORY)
+
+    def test_key_with_pydantic_messages(self):
+        history = [InContextExample(user="u", assistant="a")]
+        key1 = make_request_key("openai", self.model_info, [], "text", history)
+        key2 = make_request_key("openai", self.model_info, [], "text", history)
+        assert key1 == key2
+
+
+class TestAgentContextCache:
+    def teardown_method(self):
+        LlmCacheRegistry.configure(None)
+
+    def configure(self, tmp_path, mode):
+        LlmCacheRegistry.configure(LlmCacheConfig(cache_dir=str(tmp_path), mode=mode))
+
+    def test_no_cache(self):
+        agent = make_agent(["first", "second"])
+        cxt = AgentContext(agent)
+        assert cxt.call_llm(HISTORY) == "first"
+        assert cxt.call_llm(HISTORY) == "second"
+
+    def test_read_through(self, tmp_path):
+        self.configure(tmp_path, "read_through")
+        agent = make_agent([{"output": "first"}, {"output": "second"}])
+        cxt = AgentContext(agent)
+        assert cxt.call_llm(HISTORY) == {"output": "first"}
+        assert cxt.call_llm(HISTORY) == {"output": "first"}
+        assert agent.client.call.call_count == 1
+
+        assert cxt.call_llm(HISTORY[:1]) == {"output": "second"}
+        assert agent.client.call.call_count == 2
+
+    def test_record_then_replay(self, tmp_path):
+        self.configure(tmp_path, "record")
+        agent = make_agent(["first", "second"])
+        cxt = AgentContext(agent)
+        assert cxt.call_llm(HISTORY) == "first"
+        # record mode always goes to the provider and overwrites the entry
+        assert cxt.call_llm(HISTORY) == "second"
+
+        self.configure(tmp_path, "replay")
+        replay_agent = make_agent([])
+        replay_cxt = AgentContext(replay_agent)
+        assert replay_cxt.call_llm(HISTORY) == "second"
+        replay_agent.client.call.assert_not_called()
+
+    def test_replay_miss(self, tmp_path):
+        self.configure(tmp_path, "replay")
+        agent = make_agent(["first"])
+        with pytest.raises(LlmCacheMiss):
+            AgentContext(agent).call_llm(HISTORY)
+        agent.client.call.assert_not_called()
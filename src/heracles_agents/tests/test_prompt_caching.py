@@ -0,0 +1,151 @@
+"""
+Unit tests for rendering prompts with a stable, cacheable prefix.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from heracles_agents.prompt import InContextExample, Prompt
+
+
+def make_prompt(question, dsg="O1 chair, O2 table"):
+    prompt = Prompt(
+        system="You are a helpful robot",
+        scene_graph_description="A scene graph has layers",
+        in_context_examples_preamble="Examples:",
+        in_context_examples=[InContextExample(user="How many?", assistant="2")],
+        novel_instruction_template="{dsg_description}\n Question to answer: {question}",
+        answer_formatting_guidance="Answer with a number",
+    )
+    prompt.format_novel_instruction(question, dsg_description=dsg)
+    return prompt
+
+
+def common_prefix_length(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class TestFormatNovelInstruction:
+    def test_context_is_split_from_question(self):
+        prompt = make_prompt("How many chairs?")
+        assert (
+            prompt.novel_instruction_context
+            == "O1 chair, O2 table\n Question to answer: "
+        )
+        assert prompt.novel_instruction == "How many chairs?"
+
+    def test_template_without_context(self):
+        prompt = Prompt(system="s", novel_instruction_template="{question} ({dsg})")
+        prompt.format_novel_instruction("How many chairs?", dsg="O1")
+        assert prompt.novel_instruction_context is None
+        assert prompt.novel_instruction == "How many chairs? (O1)"
+
+    def test_escaped_placeholder(self):
+        prompt = Prompt(
+            system="s",
+            novel_instruction_template="{dsg} Answer {{question}} tags: {question}",
+        )
+        prompt.format_novel_instruction("How many chairs?", dsg="O1")
+        assert prompt.novel_instruction_context == "O1 Answer {question} tags: "
+        assert prompt.novel_instruction == "How many chairs?"
+
+    def test_placeholders_after_question(self):
+        prompt = Prompt(
+            system="s",
+            novel_instruction_template="{dsg}\n{question!r:>20} in {room.name}",
+        )
+        room = SimpleNamespace(name="kitchen")
+        prompt.format_novel_instruction("chairs?", dsg="O1", room=room)
+        assert prompt.novel_instruction_context == "O1\n"
+        assert prompt.novel_instruction == f"{'chairs?'!r:>20} in {room.name}"
+
+
+class TestStablePrefix:
+    def test_prefix_shared_between_questions(self):
+        first = make_prompt("How many chairs?").to_openai_json()
+        second = make_prompt("Where is the table?").to_openai_json()
+        # Everything up to the instruction is identical, and the instruction
+        # starts with the scene graph
+        n_prefix = common_prefix_length(first, second)
+        assert first[n_prefix]["content"].startswith("O1 chair, O2 table\n")
+        assert len(first) - n_prefix == 2
+
+    @pytest.mark.parametrize("method", ["to_openai_json", "to_anthropic_json"])
+    def test_same_as_unsplit_template(self, method):
+        prompt = make_prompt("How many chairs?")
+        unsplit = make_prompt("How many chairs?")
+        unsplit.novel_instruction_context = None
+        unsplit.novel_instruction = unsplit.novel_instruction_template.format(
+            question="How many chairs?", dsg_description="O1 chair, O2 table"
+        )
+        assert getattr(prompt, method)() == getattr(unsplit, method)()
+
+    def test_openai_has_no_breakpoints(self):
+        for message in make_prompt("q").to_openai_json():
+            assert isinstance(message["content"], str)
+
+
+class TestCacheBreakpoints:
+    def test_anthropic(self):
+        prompt = make_prompt("How many chairs?")
+        assert prompt.to_anthropic_json() == [
+            {"role": m["role"], "content": m["content"]}
+            for m in make_prompt("How many chairs?").to_anthropic_json()
+        ]
+        messages = prompt.to_anthropic_json(cache_breakpoints=True)
+        marked = [
+            i
+            for i, m in enumerate(messages)
+            if isinstance(m["content"], list)
+            and any("cache_control" in block for block in m["content"])
+        ]
+        # One breakpoint after the static instructions, one after the scene graph
+        assert marked == [4, 5]
+        # The scene graph and the question are blocks of the same message
+        assert messages[5]["content"] == [
+            {
+                "type": "text",
+                "text": "O1 chair, O2 table\n Question to answer: ",
+                "cache_control": {"type": "ephemeral"},
+            },
+            {"type": "text", "text": "How many chairs?"},
+        ]
+
+    def test_bedrock(self):
+        messages = make_prompt("How many chairs?").to_bedrock_json(
+            cache_breakpoints=True
+        )
+        cache_points = [
+            i
+            for i, m in enumerate(messages)
+            if {"cachePoint": {"type": "default"}} in m["content"]
+        ]
+        assert cache_points == [4, 5]
+        assert messages[5]["content"] == [
+            {"text": "O1 chair, O2 table\n Question to answer: "},
+            {"cachePoint": {"type": "default"}},
+            {"text": "How many chairs?"},
+        ]
+        assert "cachePoint" not in str(
+            make_prompt("How many chairs?").to_bedrock_json()
+        )
+
+    def test_no_context(self):
+        prompt = Prompt(system="s", novel_instruction="How many chairs?")
+        messages = prompt.to_anthropic_json(cache_breakpoints=True)
+        assert messages[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+        assert messages[1] == {"role": "user", "content": "How many chairs?"}
+
+
+@pytest.mark.parametrize(
+    "method", ["to_openai_json", "to_anthropic_json", "to_bedrock_json"]
+)
+def test_missing_instruction_names_method(method):
+    with pytest.raises(ValueError, match=f"`{method}`"):
+        getattr(Prompt(system="s"), method)()
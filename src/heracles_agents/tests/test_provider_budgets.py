@@ -0,0 +1,264 @@
+"""
+Unit tests for provider budgets and the configuration scheduler.
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from heracles_agents.experiment_scheduler import run_experiment
+from heracles_agents.llm_interface import AnalyzedQuestions
+from heracles_agents.provider_budgets import (
+    ProviderBudget,
+    ProviderBudgetConfig,
+    ProviderBudgetRegistry,
+    TokenBucket,
+)
+from heracles_agents.provider_retries import RetryPolicy
+
+
+class ConcurrencyCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.current -= 1
+
+
+def run_in_threads(fn, n_threads):
+    threads = [threading.Thread(target=fn) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+class TestProviderBudget:
+    def test_max_concurrent_requests(self):
+        budget = ProviderBudget(max_concurrent_requests=2)
+        counter = ConcurrencyCounter()
+
+        def request():
+            with budget.reserve(), counter:
+                time.sleep(0.02)
+
+        run_in_threads(request, 8)
+        assert counter.peak == 2
+
+    def test_requests_per_minute(self):
+        # 1200 rpm -> one request every 50 ms
+        budget = ProviderBudget(requests_per_minute=1200)
+        start = time.monotonic()
+        for _ in range(4):
+            with budget.reserve():
+                pass
+        assert time.monotonic() - start >= 0.15
+
+    def test_tokens_per_minute(self):
+        # 60000 tpm -> 1000 tokens per second, with a one second burst
+        budget = ProviderBudget(tokens_per_minute=60000)
+        assert budget.tracks_tokens
+        start = time.monotonic()
+        with budget.reserve(n_tokens=1000):
+            pass
+        assert time.monotonic() - start < 0.05
+        # Output tokens of the previous request are charged after the fact
+        budget.charge_tokens(100)
+        with budget.reserve(n_tokens=100):
+            pass
+        assert time.monotonic() - start >= 0.15
+
+    def test_pause(self):
+        budget = ProviderBudget(max_concurrent_requests=4)
+        budget.pause(0.1)
+        start = time.monotonic()
+        with budget.reserve():
+            pass
+        assert time.monotonic() - start >= 0.09
+
+    def test_unlimited(self):
+        budget = ProviderBudget()
+        counter = ConcurrencyCounter()
+
+        def request():
+            with budget.reserve(), counter:
+                time.sleep(0.05)
+
+        run_in_threads(request, 4)
+        assert counter.peak == 4
+
+
+class TestTokenBucket:
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate_per_minute=600, capacity=3)
+        assert [bucket.take(1) for _ in range(3)] == [0.0, 0.0, 0.0]
+        # Each caller queues up behind the debt of the previous ones
+        assert bucket.take(1) == pytest.approx(0.1, abs=0.01)
+        assert bucket.take(1) == pytest.approx(0.2, abs=0.01)
+
+
+class TestAsyncProviderBudget:
+    def test_max_concurrent_requests(self):
+        budget = ProviderBudget(max_concurrent_requests=2)
+        counter = ConcurrencyCounter()
+
+        async def request():
+            async with budget.areserve():
+                with counter:
+                    await asyncio.sleep(0.02)
+
+        async def main():
+            await asyncio.gather(*(request() for _ in range(8)))
+
+        asyncio.run(main())
+        assert counter.peak == 2
+
+    def test_shared_with_threads(self):
+        budget = ProviderBudget(max_concurrent_requests=1)
+        thread_has_budget = threading.Event()
+        release_thread = threading.Event()
+
+        def thread_request():
+            with budget.reserve():
+                thread_has_budget.set()
+                release_thread.wait(timeout=5)
+
+        t = threading.Thread(target=thread_request)
+        t.start()
+        thread_has_budget.wait(timeout=5)
+
+        async def main():
+            waiting = asyncio.create_task(self.async_request(budget))
+            # The coroutine waits for the thread without blocking the loop
+            await asyncio.sleep(0.05)
+            assert not waiting.done()
+            release_thread.set()
+            await asyncio.wait_for(waiting, timeout=5)
+
+        asyncio.run(main())
+        t.join()
+
+    async def async_request(self, budget):
+        async with budget.areserve():
+            pass
+
+
+class TestProviderBudgetRegistry:
+    def setup_method(self):
+        ProviderBudgetRegistry.clear()
+
+    def teardown_method(self):
+        ProviderBudgetRegistry.clear()
+
+    def test_provider_and_model_budgets(self):
+        ProviderBudgetRegistry.configure(
+            [
+                ProviderBudgetConfig(provider="openai", max_concurrent_requests=3),
+                ProviderBudgetConfig(
+                    provider="openai", model="gpt-4.1", max_concurrent_requests=1
+                ),
+            ]
+        )
+        assert len(ProviderBudgetRegistry.get_budgets("openai", "gpt-4.1")) == 2
+        assert len(ProviderBudgetRegistry.get_budgets("openai", "gpt-5")) == 1
+        assert ProviderBudgetRegistry.get_budgets("ollama", "llama3") == []
+
+        counter = ConcurrencyCounter()
+
+        def request():
+            with ProviderBudgetRegistry.reserve("openai", "gpt-4.1"), counter:
+                time.sleep(0.02)
+
+        run_in_threads(request, 6)
+        assert counter.peak == 1
+
+    def test_configure_replaces_earlier_budgets(self):
+        ProviderBudgetRegistry.configure(
+            [ProviderBudgetConfig(provider="openai", max_concurrent_requests=1)],
+            RetryPolicy(max_retries=1),
+        )
+        ProviderBudgetRegistry.configure(
+            [ProviderBudgetConfig(provider="ollama", max_concurrent_requests=1)]
+        )
+        assert ProviderBudgetRegistry.get_budgets("openai", "gpt-4.1") == []
+        assert len(ProviderBudgetRegistry.get_budgets("ollama", "llama3")) == 1
+        assert ProviderBudgetRegistry.retry_policy == RetryPolicy()
+
+    def test_providers_do_not_block_each_other(self):
+        ProviderBudgetRegistry.configure(
+            [ProviderBudgetConfig(provider="ollama", max_concurrent_requests=1)]
+        )
+        ollama_started = threading.Event()
+        release_ollama = threading.Event()
+
+        def slow_ollama_request():
+            with ProviderBudgetRegistry.reserve("ollama", "llama3"):
+                ollama_started.set()
+                release_ollama.wait(timeout=5)
+
+        t = threading.Thread(target=slow_ollama_request)
+        t.start()
+        ollama_started.wait(timeout=5)
+
+        # The ollama budget is exhausted, but openai requests go straight through
+        with ProviderBudgetRegistry.reserve("openai", "gpt-4.1"):
+            pass
+
+        release_ollama.set()
+        t.join()
+
+
+class TestRunExperiment:
+    def setup_method(self):
+        ProviderBudgetRegistry.clear()
+
+    def teardown_method(self):
+        ProviderBudgetRegistry.clear()
+
+    def make_configuration(self, barrier):
+        def pipeline_function(exp):
+            # Only returns if all configurations are running at the same time
+            barrier.wait(timeout=5)
+            return AnalyzedQuestions(analyzed_questions=[])
+
+        return SimpleNamespace(
+            pipeline=SimpleNamespace(function=pipeline_function),
+            set_checkpoint=lambda checkpoint: None,
+        )
+
+    def test_configurations_run_in_parallel(self):
+        barrier = threading.Barrier(3)
+        experiment = SimpleNamespace(
+            metadata={"name": "test"},
+            configurations={
+                f"config_{i}": self.make_configuration(barrier) for i in range(3)
+            },
+            max_parallel_configurations=3,
+            provider_budgets=[
+                ProviderBudgetConfig(provider="openai", max_concurrent_requests=2)
+            ],
+            retry_policy=RetryPolicy(max_retries=2),
+            llm_cache=None,
+        )
+
+        ae = run_experiment(experiment)
+
+        assert list(ae.experiment_configurations.keys()) == [
+            "config_0",
+            "config_1",
+            "config_2",
+        ]
+        assert ae.metadata == {"name": "test"}
+        assert len(ProviderBudgetRegistry.get_budgets("openai", "gpt-4.1")) == 1
+        assert ProviderBudgetRegistry.retry_policy.max_retries == 2
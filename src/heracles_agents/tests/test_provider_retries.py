@@ -0,0 +1,162 @@
+"""
+Unit tests for retrying failed LLM requests.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import botocore.exceptions
+import httpx
+import openai
+import pytest
+
+from heracles_agents.llm_agent import ModelInfo
+from heracles_agents.llm_interface import AgentContext
+from heracles_agents.provider_budgets import (
+    ProviderBudgetConfig,
+    ProviderBudgetRegistry,
+)
+from heracles_agents.provider_retries import (
+    LlmRetriesExhausted,
+    RetryPolicy,
+    classify_provider_error,
+    parse_retry_after,
+)
+
+
+def make_status_error(error_type, status_code, headers=None):
+    request = httpx.Request("POST", "https://api.example.com/v1/responses")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_type("error", response=response, body=None)
+
+
+def make_bedrock_error(code, headers=None):
+    return botocore.exceptions.ClientError(
+        {
+            "Error": {"Code": code, "Message": "error"},
+            "ResponseMetadata": {"HTTPHeaders": headers or {}},
+        },
+        "Converse",
+    )
+
+
+def make_agent(side_effect):
+    client = Mock()
+    client.client_type = "openai"
+    client.call = Mock(side_effect=side_effect)
+
+    async def acall(*args):
+        return client.call(*args)
+
+    client.acall = acall
+    return SimpleNamespace(
+        model_info=ModelInfo(model="gpt-4.1-nano", temperature=0.2, seed=1),
+        agent_info=SimpleNamespace(tool_interface="none", tools={}),
+        client=client,
+    )
+
+
+HISTORY = [{"role": "user", "content": "How many chairs are there?"}]
+
+
+class TestClassifyProviderError:
+    def test_openai_rate_limit(self):
+        ex = make_status_error(openai.RateLimitError, 429, {"retry-after": "7"})
+        error = classify_provider_error(ex)
+        assert error.is_rate_limit
+        assert error.retry_after_s == 7.0
+
+    def test_status_codes(self):
+        assert classify_provider_error(
+            make_status_error(openai.InternalServerError, 503)
+        )
+        assert (
+            classify_provider_error(make_status_error(openai.BadRequestError, 400))
+            is None
+        )
+
+    def test_bedrock(self):
+        error = classify_provider_error(make_bedrock_error("ThrottlingException"))
+        assert error.is_rate_limit
+        assert classify_provider_error(make_bedrock_error("ModelTimeoutException"))
+        assert (
+            classify_provider_error(make_bedrock_error("AccessDeniedException")) is None
+        )
+
+    def test_other_errors(self):
+        assert classify_provider_error(ValueError("bad")) is None
+
+
+class TestRetryPolicy:
+    def test_parse_retry_after(self):
+        assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+        assert parse_retry_after({"retry-after": "3"}) == 3.0
+        assert parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+        assert parse_retry_after({"retry-after": "soon"}) is None
+        assert parse_retry_after({}) is None
+        assert parse_retry_after(None) is None
+
+    def test_backoff_grows_with_jitter(self):
+        policy = RetryPolicy(initial_backoff_s=1, max_backoff_s=8)
+        for retry_index, expected in enumerate([1, 2, 4, 8, 8]):
+            backoff = policy.backoff_s(retry_index)
+            assert expected / 2 <= backoff <= expected
+
+    def test_backoff_honors_server_hint(self):
+        policy = RetryPolicy(initial_backoff_s=1, max_backoff_s=8)
+        assert policy.backoff_s(0, retry_after_s=30) == 30
+
+
+class TestAgentContextRetries:
+    def setup_method(self):
+        ProviderBudgetRegistry.clear()
+        ProviderBudgetRegistry.configure(
+            [], RetryPolicy(max_retries=2, initial_backoff_s=0.01)
+        )
+
+    def teardown_method(self):
+        ProviderBudgetRegistry.clear()
+
+    def test_retry_then_succeed(self):
+        rate_limit = make_status_error(openai.RateLimitError, 429)
+        agent = make_agent([rate_limit, rate_limit, "response"])
+        assert AgentContext(agent).call_llm(HISTORY) == "response"
+        assert agent.client.call.call_count == 3
+
+    def test_retries_exhausted(self):
+        rate_limit = make_status_error(openai.RateLimitError, 429)
+        agent = make_agent([rate_limit] * 3)
+        with pytest.raises(LlmRetriesExhausted) as exc_info:
+            AgentContext(agent).call_llm(HISTORY)
+        assert exc_info.value.n_attempts == 3
+        assert exc_info.value.last_error is rate_limit
+
+    def test_not_retried(self):
+        agent = make_agent([make_status_error(openai.BadRequestError, 400)])
+        with pytest.raises(openai.BadRequestError):
+            AgentContext(agent).call_llm(HISTORY)
+        assert agent.client.call.call_count == 1
+
+    def test_async_retries_exhausted(self):
+        timeout = make_bedrock_error("ServiceUnavailableException")
+        agent = make_agent([timeout, "response"])
+        assert asyncio.run(AgentContext(agent).acall_llm(HISTORY)) == "response"
+
+        agent = make_agent([timeout] * 3)
+        with pytest.raises(LlmRetriesExhausted):
+            asyncio.run(AgentContext(agent).acall_llm(HISTORY))
+
+    def test_rate_limit_pauses_budget(self):
+        ProviderBudgetRegistry.configure(
+            [ProviderBudgetConfig(provider="openai", max_concurrent_requests=4)],
+            RetryPolicy(max_retries=2, initial_backoff_s=0.01),
+        )
+        retry_after = make_status_error(
+            openai.RateLimitError, 429, {"retry-after-ms": "100"}
+        )
+        agent = make_agent([retry_after, "response"])
+        assert AgentContext(agent).call_llm(HISTORY) == "response"
+        # Other requests to the provider are held back as well
+        (budget,) = ProviderBudgetRegistry.get_budgets("openai", "gpt-4.1")
+        assert budget._paused_until > 0
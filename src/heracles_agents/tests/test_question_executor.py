@@ -0,0 +1,238 @@
+"""
+Unit tests for the shared question executor used by the pipelines.
+"""
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from heracles_agents.experiment_checkpoint import CheckpointStore
+from heracles_agents.llm_cache import LlmCacheMiss
+from heracles_agents.llm_interface import (
+    AgentContext,
+    AnalyzedQuestion,
+    EvalQuestion,
+    QuestionAnalysis,
+    ShapedToolResult,
+)
+from heracles_agents.pipelines import (
+    agentic_pipeline,
+    feedforward_codegen_pipeline,
+    feedforward_cypher_pipeline,
+    feedforward_in_context,
+    feedforward_in_context_full,
+    test_task,
+)
+from heracles_agents.pipelines.question_executor import run_questions
+from heracles_agents.provider_retries import LlmRetriesExhausted
+from heracles_agents.tools.timeouts import ResourceUsage
+
+
+def make_question(uid):
+    return EvalQuestion(
+        name=f"q{uid}",
+        question=f"Question {uid}?",
+        solution="1",
+        uid=uid,
+        correctness_comparator={"comparison_type": "SLDP", "relation": "equal"},
+    )
+
+
+def make_experiment(n_workers, questions, checkpoint=None):
+    return SimpleNamespace(
+        n_workers=n_workers,
+        questions=questions,
+        get_checkpoint=lambda: checkpoint,
+        batch=None,
+    )
+
+
+def make_analyzed_question(question):
+    analysis = QuestionAnalysis(
+        valid_answer_format=True,
+        correct=True,
+        input_tokens=0,
+        output_tokens=0,
+        n_tool_calls=0,
+    )
+    return AnalyzedQuestion(
+        question=question, sequences=[], answer=str(question.uid), analysis=analysis
+    )
+
+
+class TestRunQuestions:
+    def setup_method(self):
+        self.questions = [make_question(i) for i in range(20)]
+
+    def test_sequential_preserves_order(self):
+        exp = make_experiment(1, self.questions)
+        aqs = run_questions(exp, make_analyzed_question)
+        assert [aq.question.uid for aq in aqs.analyzed_questions] == list(range(20))
+
+    def test_concurrent_preserves_order(self):
+        thread_ids = set()
+
+        def slow_analyze(question):
+            thread_ids.add(threading.get_ident())
+            time.sleep(random.uniform(0, 0.02))
+            return make_analyzed_question(question)
+
+        exp = make_experiment(4, self.questions)
+        aqs = run_questions(exp, slow_analyze)
+
+        assert [aq.question.uid for aq in aqs.analyzed_questions] == list(range(20))
+        assert [aq.answer for aq in aqs.analyzed_questions] == [
+            str(i) for i in range(20)
+        ]
+        assert len(thread_ids) > 1
+
+    def test_explicit_question_subset(self):
+        exp = make_experiment(3, self.questions)
+        aqs = run_questions(exp, make_analyzed_question, self.questions[5:8])
+        assert [aq.question.uid for aq in aqs.analyzed_questions] == [5, 6, 7]
+
+    def test_no_questions(self):
+        exp = make_experiment(8, [])
+        aqs = run_questions(exp, make_analyzed_question)
+        assert aqs.analyzed_questions == []
+
+
+class TestRunQuestionsWithCheckpoint:
+    def setup_method(self):
+        self.questions = [make_question(i) for i in range(10)]
+
+    def test_completed_questions_are_skipped_and_merged(self, tmp_path):
+        checkpoint = CheckpointStore(str(tmp_path)).for_configuration("config")
+        for q in self.questions[:4]:
+            checkpoint.append(make_analyzed_question(q))
+
+        analyzed_uids = []
+
+        def analyze(question):
+            analyzed_uids.append(question.uid)
+            return make_analyzed_question(question)
+
+        exp = make_experiment(2, self.questions, checkpoint)
+        aqs = run_questions(exp, analyze)
+
+        assert sorted(analyzed_uids) == list(range(4, 10))
+        assert [aq.question.uid for aq in aqs.analyzed_questions] == list(range(10))
+        assert set(checkpoint.load().keys()) == set(range(10))
+
+    def test_interrupted_run_keeps_completed_questions(self, tmp_path):
+        checkpoint = CheckpointStore(str(tmp_path)).for_configuration("config")
+
+        def analyze(question):
+            if question.uid == 6:
+                raise KeyboardInterrupt()
+            return make_analyzed_question(question)
+
+        exp = make_experiment(1, self.questions, checkpoint)
+        try:
+            run_questions(exp, analyze)
+        except KeyboardInterrupt:
+            pass
+
+        assert set(checkpoint.load().keys()) == set(range(6))
+
+    def test_infrastructure_errors_not_recorded(self, tmp_path):
+        checkpoint = CheckpointStore(str(tmp_path)).for_configuration("config")
+
+        def rate_limited(question):
+            if question.uid in (3, 7):
+                raise LlmRetriesExhausted("openai", "gpt-4.1", 6, "rate limited")
+            return make_analyzed_question(question)
+
+        exp = make_experiment(3, self.questions, checkpoint)
+        with pytest.raises(LlmRetriesExhausted):
+            run_questions(exp, rate_limited)
+        assert set(checkpoint.load().keys()) == set(range(10)) - {3, 7}
+
+        # Resuming only asks the failed questions again
+        analyzed_uids = []
+
+        def analyze(question):
+            analyzed_uids.append(question.uid)
+            return make_analyzed_question(question)
+
+        aqs = run_questions(exp, analyze)
+        assert sorted(analyzed_uids) == [3, 7]
+        assert [aq.question.uid for aq in aqs.analyzed_questions] == list(range(10))
+
+
+@pytest.mark.parametrize(
+    "pipeline",
+    [
+        agentic_pipeline,
+        feedforward_codegen_pipeline,
+        feedforward_cypher_pipeline,
+        feedforward_in_context,
+        feedforward_in_context_full,
+    ],
+)
+def test_pipelines_raise_infrastructure_errors(pipeline, monkeypatch):
+    def replay_miss(agent):
+        raise LlmCacheMiss("not recorded")
+
+    monkeypatch.setattr(pipeline, "AgentContext", replay_miss)
+    phases = {name: None for name in ("main", "generate-code", "generate-cypher")}
+    exp = SimpleNamespace(phases=phases, dsg_interface=None)
+    with pytest.raises(LlmCacheMiss):
+        pipeline.analyze_question(exp, make_question(0))
+
+
+def test_canary_pipeline_records_input_tokens(monkeypatch):
+    class ScriptedContext(AgentContext):
+        def initialize_agent(self, prompt):
+            self.initial_input_tokens = 42
+
+        def run(self):
+            return True, "1"
+
+    monkeypatch.setattr(test_task, "AgentContext", ScriptedContext)
+    prompt_settings = SimpleNamespace(base_prompt=SimpleNamespace(), output_type="")
+    main = SimpleNamespace(agent_info=SimpleNamespace(prompt_settings=prompt_settings))
+    exp = SimpleNamespace(phases={"main": main})
+    aq = test_task.analyze_question(exp, make_question(0))
+    assert aq.analysis.input_tokens == 42
+    assert aq.analysis.correct
+
+
+class ShapingContext(AgentContext):
+    """Answers "1" after a tool result that was too long for the history"""
+
+    def initialize_agent(self, prompt):
+        pass
+
+    def run(self):
+        self.shaped_tool_results.append(
+            ShapedToolResult(
+                tool_call=0, n_tokens=100, n_tokens_shown=10, full_result="x" * 100
+            )
+        )
+        return True, "1"
+
+
+@pytest.mark.parametrize(
+    "pipeline", [feedforward_codegen_pipeline, feedforward_cypher_pipeline]
+)
+def test_two_phase_pipelines_record_shaped_tool_results(pipeline, monkeypatch):
+    monkeypatch.setattr(pipeline, "AgentContext", ShapingContext)
+    monkeypatch.setattr(pipeline, "generate_prompt", lambda *args, **kwargs: None)
+    if pipeline is feedforward_cypher_pipeline:
+        monkeypatch.setattr(pipeline, "cypher_generation_prompt", lambda *args: None)
+        monkeypatch.setattr(pipeline, "query_db", lambda *args: (True, "[]"))
+    else:
+        usage = ResourceUsage(wall_time_s=0.1)
+        monkeypatch.setattr(
+            pipeline, "execute_generated_code_timed", lambda *args: (True, 1, usage)
+        )
+    phases = {name: None for name in ("generate-code", "generate-cypher", "refine")}
+    exp = SimpleNamespace(phases=phases, dsg_interface=None)
+    aq = pipeline.analyze_question(exp, make_question(0))
+    assert aq.analysis.correct
+    # One from each phase
+    assert len(aq.analysis.shaped_tool_results) == 2
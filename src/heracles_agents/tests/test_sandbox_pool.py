@@ -0,0 +1,275 @@
+"""
+Unit tests for running functions in reusable sandbox worker processes.
+"""
+
+import os
+import pickle
+import resource
+import threading
+import time
+
+import pytest
+
+from heracles_agents.dsg_interfaces import PythonDsgInterface
+from heracles_agents.llm_interface import QuestionAnalysis
+from heracles_agents.pipelines.codegen_utils import (
+    CodeExecutionLimits,
+    DsgLoadCache,
+    execute_generated_code_timed,
+)
+from heracles_agents.pipelines.synthetic_dsg import make_synthetic_scene_graph
+from heracles_agents.tools.timeouts import (
+    FunctionTimeoutError,
+    ResourceLimitError,
+    ResourceLimits,
+    ResourceUsage,
+    SandboxPool,
+    run_with_timeout,
+)
+
+API_FILEPATH = "$HERACLES_AGENTS_PATH/examples/prompts/spark_dsg_api_prompt.yaml"
+
+COUNT_OBJECTS = """
+def solve_task(G):
+    return G.get_layer(spark_dsg.DsgLayers.OBJECTS).num_nodes()
+"""
+
+BIG_OUTPUT = """
+def solve_task(G):
+    return "x" * 1000
+"""
+
+BIG_ALLOCATION = """
+def solve_task(G):
+    return len([0] * 100_000_000)
+"""
+
+REMOVE_OBJECTS = """
+def solve_task(G):
+    objects = G.get_layer(spark_dsg.DsgLayers.OBJECTS)
+    for node_id in [node.id.value for node in objects.nodes][:10]:
+        G.remove_node(node_id)
+    return objects.num_nodes()
+"""
+
+# Imported in solve_task, module level names aren't visible to it
+WORKER_PID = """
+def solve_task(G):
+    import os
+
+    return os.getpid()
+"""
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def fail():
+    raise ValueError("bad value")
+
+
+def crash():
+    os._exit(1)
+
+
+def allocate(n_mb):
+    return len(bytearray(n_mb * 1024 * 1024))
+
+
+def spin():
+    while True:
+        pass
+
+
+def set_hard_limits():
+    """Give the worker finite hard limits, like under ulimit or SLURM"""
+    hard_cpu = int(resource.getrusage(resource.RUSAGE_SELF).ru_utime) + 3600
+    resource.setrlimit(resource.RLIMIT_CPU, (hard_cpu, hard_cpu))
+    resource.setrlimit(resource.RLIMIT_AS, (64 * 1024**3, 64 * 1024**3))
+    return os.getpid()
+
+
+def get_limits():
+    return [resource.getrlimit(r) for r in (resource.RLIMIT_AS, resource.RLIMIT_CPU)]
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(max_workers=2)
+    yield pool
+    pool.close()
+
+
+class TestSandboxPool:
+    def test_result(self, pool):
+        assert pool.run(sleep, args=(0,), timeout=10) == 0
+        assert pool.run(sleep, kwargs={"seconds": 0.01}) == 0.01
+
+    def test_worker_reused(self, pool):
+        pid = pool.run(worker_pid)
+        assert pid != os.getpid()
+        assert pool.run(worker_pid) == pid
+
+    def test_exception(self, pool):
+        with pytest.raises(ValueError, match="bad value") as e:
+            pool.run(fail)
+        assert "Original traceback" in str(e.value)
+        # An exception in the function doesn't cost the worker
+        assert pool._n_workers == 1
+
+    def test_timeout_replaces_worker(self, pool):
+        pid = pool.run(worker_pid)
+        with pytest.raises(FunctionTimeoutError):
+            pool.run(sleep, args=(10,), timeout=0.2)
+        assert pool._n_workers == 0
+        assert pool.run(worker_pid) != pid
+
+    def test_crash_replaces_worker(self, pool):
+        with pytest.raises(RuntimeError, match="without returning"):
+            pool.run(crash, timeout=10)
+        assert pool.run(sleep, args=(0,)) == 0
+
+    def test_concurrent_jobs(self, pool):
+        results = []
+
+        def job():
+            results.append(pool.run(sleep, args=(0.2,), timeout=10))
+
+        threads = [threading.Thread(target=job) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [0.2] * 5
+        assert pool._n_workers <= pool.max_workers
+
+    def test_run_with_timeout(self):
+        assert run_with_timeout(sleep, args=(0,), timeout=10) == 0
+        with pytest.raises(FunctionTimeoutError):
+            run_with_timeout(sleep, args=(10,), timeout=0.2)
+
+
+class TestResourceLimits:
+    def test_usage(self, pool):
+        result, usage = pool.run_measured(allocate, args=(64,))
+        assert result == 64 * 1024 * 1024
+        assert usage.cpu_time_s >= 0 and usage.wall_time_s > 0
+        # The peak is measured per job, not over the worker's lifetime
+        _, idle_usage = pool.run_measured(sleep, args=(0,))
+        assert usage.peak_rss_mb >= idle_usage.peak_rss_mb + 60
+
+    def test_memory_limit(self, pool):
+        limits = ResourceLimits(memory_mb=32)
+        with pytest.raises(MemoryError):
+            pool.run(allocate, args=(256,), limits=limits)
+        assert pool.run(allocate, args=(1,), limits=limits) == 1024 * 1024
+        # The limit only applies to the job it was given with
+        assert pool.run(allocate, args=(256,)) == 256 * 1024 * 1024
+        assert pool._n_workers == 1
+
+    def test_cpu_time_limit(self, pool):
+        with pytest.raises(ResourceLimitError):
+            pool.run(spin, limits=ResourceLimits(cpu_time_s=1), timeout=30)
+        assert pool.run(sleep, args=(0,)) == 0
+        assert pool._n_workers == 1
+
+    def test_finite_hard_limits(self):
+        pool = SandboxPool(max_workers=1)
+        try:
+            pid = pool.run(set_hard_limits)
+            before = pool.run(get_limits)
+            limits = ResourceLimits(memory_mb=32, cpu_time_s=10)
+            with pytest.raises(MemoryError):
+                pool.run(allocate, args=(256,), limits=limits)
+            assert pool.run(allocate, args=(1,), limits=limits) == 1024 * 1024
+            # The worker survives, with its limits as they were
+            assert pool.run(worker_pid) == pid
+            assert pool.run(get_limits) == before
+        finally:
+            pool.close()
+
+    def test_question_analysis(self):
+        analysis = QuestionAnalysis(
+            valid_answer_format=True,
+            correct=True,
+            input_tokens=0,
+            output_tokens=0,
+            n_tool_calls=2,
+            code_executions=[
+                ResourceUsage(wall_time_s=1.0, cpu_time_s=0.5, peak_rss_mb=100),
+                ResourceUsage(wall_time_s=60.0, timed_out=True),
+            ],
+        )
+        dump = analysis.model_dump()
+        assert dump["code_wall_time_s"] == 61.0
+        assert dump["code_cpu_time_s"] == 0.5
+        assert dump["code_peak_rss_mb"] == 100
+        assert QuestionAnalysis.model_validate(dump) == analysis
+
+
+class TestGeneratedCode:
+    @pytest.fixture
+    def dsg_interface(self, tmp_path):
+        path = str(tmp_path / "dsg.json")
+        make_synthetic_scene_graph(25).save(path)
+        DsgLoadCache.clear()
+        return PythonDsgInterface(
+            dsg_interface_type="python",
+            dsg_filepath=path,
+            dsg_api_filepath=API_FILEPATH,
+        )
+
+    def test_sent_without_scene_graph(self, dsg_interface):
+        dsg_interface.get_dsg()
+        copy = pickle.loads(pickle.dumps(dsg_interface))
+        assert copy.model_dump() == dsg_interface.model_dump()
+        assert copy._dsg is None
+
+    def test_executed_in_worker(self, dsg_interface):
+        success, result, usage = execute_generated_code_timed(
+            COUNT_OBJECTS, dsg_interface
+        )
+        assert (success, result) == (True, 25)
+        assert usage.wall_time_s > 0 and usage.peak_rss_mb > 0
+        success, pid, _ = execute_generated_code_timed(WORKER_PID, dsg_interface)
+        assert success and pid != os.getpid()
+        # The scene graph is loaded in the worker, not here
+        assert len(DsgLoadCache.graphs) == 0
+
+    def test_changes_not_seen_by_later_jobs(self, dsg_interface, monkeypatch):
+        pool = SandboxPool(max_workers=1)
+        monkeypatch.setattr(SandboxPool, "shared", classmethod(lambda cls: pool))
+        success, first_pid, _ = execute_generated_code_timed(WORKER_PID, dsg_interface)
+        assert success
+        assert execute_generated_code_timed(REMOVE_OBJECTS, dsg_interface)[1] == 15
+        success, result, usage = execute_generated_code_timed(
+            COUNT_OBJECTS, dsg_interface
+        )
+        assert (success, result) == (True, 25) and not usage.cache_hit
+        _, pid, _ = execute_generated_code_timed(WORKER_PID, dsg_interface)
+        assert pid == first_pid
+
+    def test_limits(self, dsg_interface):
+        dsg_interface.code_execution_limits = CodeExecutionLimits(
+            max_output_chars=100, memory_mb=64
+        )
+        success, result, _ = execute_generated_code_timed(BIG_OUTPUT, dsg_interface)
+        assert success
+        assert result.startswith("x" * 100 + "... (output cut off")
+        success, result, _ = execute_generated_code_timed(BIG_ALLOCATION, dsg_interface)
+        assert (success, result) == (False, "Your code ran out of memory.")
+
+    def test_timeout(self, dsg_interface):
+        dsg_interface.code_execution_limits = CodeExecutionLimits(timeout_s=0.5)
+        success, result, usage = execute_generated_code_timed(
+            "def solve_task(G):\n    while True:\n        pass\n", dsg_interface
+        )
+        assert not success
+        assert result == "Your code timed out. In 0.5 seconds."
+        assert usage.timed_out
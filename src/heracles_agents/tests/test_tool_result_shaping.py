@@ -0,0 +1,124 @@
+"""
+Unit tests for summarizing long tool results before they are added to an agent's history.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from heracles_agents.llm_agent import ModelInfo
+from heracles_agents.llm_interface import AgentContext, QuestionAnalysis
+from heracles_agents.tool_result_shaping import describe_collection, shape_tool_result
+
+
+class WordEncoder:
+    """Counts whitespace separated words as tokens"""
+
+    def encode(self, text):
+        return text.split()
+
+
+ENCODER = WordEncoder()
+
+
+def n_tokens(text):
+    return len(ENCODER.encode(text))
+
+
+class TestShapeToolResult:
+    def test_short_result_unchanged(self):
+        result = [("R1", "kitchen"), ("R2", "bedroom")]
+        text, shown, full = shape_tool_result(result, ENCODER, 100)
+        assert text == str(result)
+        assert shown == full == n_tokens(str(result))
+
+    def test_list(self):
+        result = [f"object {i}" for i in range(1000)]
+        text, shown, full = shape_tool_result(result, ENCODER, 60)
+        assert full == 2000
+        assert shown == n_tokens(text) <= 60
+        lines = text.splitlines()
+        assert lines[0] == "list of 1000 items (1000 str)"
+        assert lines[1] == "object 0" and lines[-1] == "object 999"
+        # Head and tail are about as long as each other
+        head = lines[1 : lines.index(next(s for s in lines if "omitted" in s))]
+        tail = lines[len(head) + 2 :]
+        assert abs(len(head) - len(tail)) <= 1
+        omitted = 1000 - len(head) - len(tail)
+        assert f"... ({omitted} items omitted) ..." in lines
+
+    def test_dict(self):
+        result = {f"O{i}": "chair" if i % 3 == 0 else i for i in range(500)}
+        text, shown, _ = shape_tool_result(result, ENCODER, 40)
+        assert shown <= 40
+        assert text.startswith("dict of 500 keys (333 int, 167 str)\n'O0': chair\n")
+        assert text.endswith("'O499': 499")
+        assert "keys omitted" in text
+
+    def test_text(self):
+        result = "\n".join(f"row {i}: a b c" for i in range(300))
+        text, shown, _ = shape_tool_result(result, ENCODER, 50)
+        assert shown <= 50
+        assert text.startswith("str of 300 lines\nrow 0: a b c\n")
+        assert text.endswith("row 299: a b c")
+        assert "lines omitted" in text
+
+    def test_single_long_line(self):
+        result = " ".join(str(i) for i in range(10000))
+        text, shown, full = shape_tool_result(result, ENCODER, 30)
+        assert full == 10000
+        assert shown <= 30
+        assert text.startswith("0 1 2") and text.endswith("9998 9999")
+        assert "characters omitted" in text
+
+    def test_long_items(self):
+        # No item fits, so the text is cut instead
+        result = ["x " * 100, "y " * 100]
+        text, shown, _ = shape_tool_result(result, ENCODER, 30)
+        assert shown <= 30
+        assert "characters omitted" in text
+
+    def test_describe_collection(self):
+        assert describe_collection((1, "a", 2)) == "tuple of 3 items (2 int, 1 str)"
+        assert describe_collection({"a": [1]}) == "dict of 1 keys (1 list)"
+
+
+class TestAgentContext:
+    def make_context(self, monkeypatch, max_tokens):
+        monkeypatch.setattr(
+            "heracles_agents.llm_interface.get_token_encoder",
+            lambda model_name: ENCODER,
+        )
+        agent = SimpleNamespace(
+            model_info=ModelInfo(model="gpt-4.1-nano"),
+            agent_info=SimpleNamespace(tool_result_max_tokens=max_tokens),
+        )
+        return AgentContext(agent)
+
+    def test_full_result_kept_out_of_band(self, monkeypatch):
+        cxt = self.make_context(monkeypatch, 50)
+        cxt.n_tool_calls = 2
+        result = list(range(1000))
+        shaped = cxt.shape_tool_result(result)
+        assert shaped.startswith("list of 1000 items (1000 int)")
+        (record,) = cxt.shaped_tool_results
+        assert record.tool_call == 1
+        assert record.full_result == str(result)
+        assert record.n_tokens == 1000 and record.n_tokens_shown <= 50
+
+        analysis = QuestionAnalysis(
+            valid_answer_format=True,
+            correct=True,
+            input_tokens=0,
+            output_tokens=0,
+            n_tool_calls=2,
+            shaped_tool_results=cxt.shaped_tool_results,
+        )
+        assert QuestionAnalysis.model_validate(analysis.model_dump()) == analysis
+
+    @pytest.mark.parametrize("max_tokens", [None, 5000])
+    def test_result_unchanged(self, monkeypatch, max_tokens):
+        cxt = self.make_context(monkeypatch, max_tokens)
+        result = list(range(1000))
+        assert cxt.shape_tool_result(result) is result
+        assert cxt.shaped_tool_results == []
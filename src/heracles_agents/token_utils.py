@@ -1,4 +1,5 @@
 import logging
+import re
 
 import tiktoken
 
@@ -16,3 +17,42 @@ def get_token_encoder(model_name):
         )
         enc = tiktoken.get_encoding("cl100k_base")
     return enc
+
+
+# Splits text before every newline, keeping the newlines
+LINE_STARTS = re.compile(r"(?=\n)")
+
+
+def count_tokens(chunks, token_encoder):
+    """Number of tokens in the text made of `chunks`, counted chunk by chunk.
+
+    Chunks that break at line starts (like the ones of the streaming scene
+    graph encoders) add up to (almost exactly) the count of the joined text.
+    """
+    return sum(len(token_encoder.encode(chunk)) for chunk in chunks)
+
+
+def join_within_tokens(chunks, token_encoder, max_tokens):
+    """Join `chunks` until the text would exceed `max_tokens` tokens.
+
+    The chunk that doesn't fit is split into lines, and the lines that still
+    fit are kept. Chunks after it are never requested, so a streaming encoder
+    stops encoding there. Returns the text, its number of tokens and whether
+    all of the chunks fit.
+    """
+    parts = []
+    n_tokens = 0
+    for chunk in chunks:
+        cost = len(token_encoder.encode(chunk))
+        if n_tokens + cost <= max_tokens:
+            parts.append(chunk)
+            n_tokens += cost
+            continue
+        for line in LINE_STARTS.split(chunk):
+            cost = len(token_encoder.encode(line))
+            if n_tokens + cost > max_tokens:
+                break
+            parts.append(line)
+            n_tokens += cost
+        return "".join(parts), n_tokens, False
+    return "".join(parts), n_tokens, True
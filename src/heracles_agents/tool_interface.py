@@ -5,6 +5,7 @@ from typing import Any, Callable, Optional
 from pydantic import BaseModel, PrivateAttr, model_validator
 
 from heracles_agents.tool_registry import ToolRegistry
+from heracles_agents.tools.timeouts import ResourceUsage
 
 
 def type_to_string(typ):
@@ -64,6 +65,17 @@ class FunctionParameter:
         return self.to_openai_responses()
 
 
+@dataclass
+class ToolResult:
+    """What a tool returns, plus information about the call for the question's analysis.
+
+    Only `value` is shown to the LLM.
+    """
+
+    value: Any
+    resource_usage: Optional[ResourceUsage] = None
+
+
 class ToolDescription(BaseModel):
     """Description of a tool / function"""
 
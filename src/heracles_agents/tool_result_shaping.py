@@ -0,0 +1,137 @@
+"""Tool results shortened to a token budget before they are added to an agent's history.
+
+Providers turn a tool's result into the tool response with `str(result)`, and
+the response is sent again with every later request of the conversation, so a
+Cypher query or generated code that returns thousands of rows fills the
+context with them. `shape_tool_result` keeps a result within a token budget:
+lists, tuples, sets and dicts are summarized by their length and the types of
+their items and show their first and last items, and anything else shows its
+first and last lines (or characters, for a single long line). The agent
+context keeps the full result in the question's analysis instead.
+"""
+
+from collections import Counter
+
+COLLECTION_TYPES = (list, tuple, set, frozenset, dict)
+
+
+def _n_tokens(text, token_encoder):
+    return len(token_encoder.encode(text))
+
+
+def describe_collection(result):
+    """Length and item types of a list, tuple, set or dict, e.g. "list of 3 items (2 int, 1 str)" """
+    values = result.values() if isinstance(result, dict) else result
+    types = Counter(type(value).__name__ for value in values)
+    type_summary = ", ".join(f"{count} {name}" for name, count in types.most_common())
+    unit = "keys" if isinstance(result, dict) else "items"
+    return f"{type(result).__name__} of {len(result)} {unit} ({type_summary})"
+
+
+def _omitted(n, unit):
+    return f"... ({n} {unit} omitted) ..."
+
+
+def _head_and_tail(lines, max_tokens, token_encoder):
+    """Indices of the first and last `lines` that fit in `max_tokens` tokens.
+
+    Lines are taken from both ends in turn, so the head and tail are about as
+    long as each other.
+    """
+    head, tail = [], []
+    n_tokens = 0
+    first, last = 0, len(lines) - 1
+    from_head = True
+    while first <= last:
+        row = first if from_head else last
+        # Plus the newline that joins it to the others
+        cost = _n_tokens(lines[row], token_encoder) + 1
+        if n_tokens + cost > max_tokens:
+            break
+        n_tokens += cost
+        if from_head:
+            head.append(row)
+            first += 1
+        else:
+            tail.append(row)
+            last -= 1
+        from_head = not from_head
+    return head, tail[::-1]
+
+
+def _join_head_and_tail(header, lines, unit, max_tokens, token_encoder):
+    """`header` and the first and last `lines` that fit, or None if no line fits"""
+    budget = max_tokens - _n_tokens(header, token_encoder)
+    budget -= _n_tokens(_omitted(len(lines), unit), token_encoder) + 2
+    while budget > 0:
+        head, tail = _head_and_tail(lines, budget, token_encoder)
+        if not head:
+            return None
+        shown = [header] + [lines[i] for i in head]
+        n_omitted = len(lines) - len(head) - len(tail)
+        if n_omitted > 0:
+            shown.append(_omitted(n_omitted, unit))
+        shown += [lines[i] for i in tail]
+        text = "\n".join(shown)
+        overshoot = _n_tokens(text, token_encoder) - max_tokens
+        if overshoot <= 0:
+            return text
+        # Joined lines can tokenize differently than on their own
+        budget -= overshoot
+    return None
+
+
+def _prefix_within(text, max_tokens, token_encoder, from_end=False):
+    """The longest start (or end) of `text` that fits in `max_tokens` tokens"""
+    low, high = 0, len(text)
+    while low < high:
+        n_chars = (low + high + 1) // 2
+        part = text[len(text) - n_chars :] if from_end else text[:n_chars]
+        if _n_tokens(part, token_encoder) <= max_tokens:
+            low = n_chars
+        else:
+            high = n_chars - 1
+    return text[len(text) - low :] if from_end else text[:low]
+
+
+def _cut_characters(text, max_tokens, token_encoder):
+    """The start and end of `text`, split evenly within `max_tokens` tokens"""
+    budget = max_tokens - _n_tokens(_omitted(len(text), "characters"), token_encoder)
+    budget = max(budget - 2, 0)
+    head = _prefix_within(text, budget // 2, token_encoder)
+    tail = _prefix_within(text[len(head) :], budget - budget // 2, token_encoder, True)
+    n_omitted = len(text) - len(head) - len(tail)
+    return f"{head}\n{_omitted(n_omitted, 'characters')}\n{tail}"
+
+
+def shape_tool_result(result, token_encoder, max_tokens):
+    """`str(result)`, or a summary of it that fits in `max_tokens` tokens.
+
+    Returns the text, its number of tokens and the number of tokens of
+    `str(result)`, which is more than `max_tokens` if the text is a summary.
+    """
+    text = str(result)
+    n_tokens = _n_tokens(text, token_encoder)
+    if n_tokens <= max_tokens:
+        return text, n_tokens, n_tokens
+
+    shaped = None
+    if isinstance(result, COLLECTION_TYPES) and len(result) > 0:
+        if isinstance(result, dict):
+            lines = [f"{key!r}: {value}" for key, value in result.items()]
+        else:
+            lines = [str(item) for item in result]
+        unit = "keys" if isinstance(result, dict) else "items"
+        shaped = _join_head_and_tail(
+            describe_collection(result), lines, unit, max_tokens, token_encoder
+        )
+    if shaped is None:
+        lines = text.splitlines()
+        if len(lines) > 1:
+            header = f"{type(result).__name__} of {len(lines)} lines"
+            shaped = _join_head_and_tail(
+                header, lines, "lines", max_tokens, token_encoder
+            )
+    if shaped is None:
+        shaped = _cut_characters(text, max_tokens, token_encoder)
+    return shaped, _n_tokens(shaped, token_encoder), n_tokens
@@ -1,58 +1,294 @@
 import logging
+import math
 import multiprocessing as mp
+import resource
+import signal
+import threading
+import time
 import traceback
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+
 
 class FunctionTimeoutError(TimeoutError):
     """Raised when a function call exceeds its allowed timeout."""
 
 
-def run_with_timeout(func, args=(), kwargs=None, timeout=None):
-    """
-    Run `func(*args, **kwargs)` in a separate process.
+class ResourceLimitError(RuntimeError):
+    """Raised in a sandboxed function that exceeds its CPU time limit."""
 
-    If the function takes longer than `timeout` seconds, kill it and raise FunctionTimeoutError.
+
+class ResourceLimits(BaseModel):
+    """Limits on a function run in a sandbox worker"""
+
+    # Wall-clock time, in seconds
+    timeout_s: float = Field(default=60, gt=0)
+    # Memory the function may allocate on top of what its worker already uses
+    # (e.g. the loaded scene graph), in MB. Allocations beyond it raise MemoryError.
+    memory_mb: Optional[float] = Field(default=None, gt=0)
+    # CPU time, in seconds (rounded up to whole seconds)
+    cpu_time_s: Optional[float] = Field(default=None, gt=0)
+
+
+class ResourceUsage(BaseModel):
+    """Resources used by one function run in a sandbox worker"""
+
+    wall_time_s: float
+    # Unknown for functions that timed out, since their worker was killed
+    cpu_time_s: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    timed_out: bool = False
+    # Whether a cached result was used instead of running the function
+    cache_hit: bool = False
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss():
+    """Start measuring the peak RSS from now, if the OS supports it"""
+    try:
+        with open("/proc/self/clear_refs", "w") as fo:
+            fo.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(was_reset):
+    if was_reset:
+        with open("/proc/self/status", "r") as fo:
+            for line in fo:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024 / MB
+    # Peak over the worker's lifetime, in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / MB
+
+
+def _address_space():
+    with open("/proc/self/statm", "r") as fo:
+        return int(fo.read().split()[0]) * resource.getpagesize()
+
+
+def _raise_cpu_limit(signum, frame):
+    raise ResourceLimitError("CPU time limit exceeded")
+
+
+def _set_soft_limit(limit, value):
+    """Lower the soft limit to `value` (within the current limits), and return the current limits"""
+    soft, hard = resource.getrlimit(limit)
+    for bound in (soft, hard):
+        if bound != resource.RLIM_INFINITY:
+            value = min(value, bound)
+    resource.setrlimit(limit, (value, hard))
+    return soft, hard
+
+
+def _run_limited(func, args, kwargs, limits):
+    """Run `func` with `limits` applied to this process.
+
+    Returns whether it succeeded, its result (or the exception and its
+    traceback) and the resources it used.
     """
-    logger.debug("In run_with_timeout")
-    if kwargs is None:
-        kwargs = {}
+    memory_mb = limits.memory_mb if limits is not None else None
+    cpu_time_s = limits.cpu_time_s if limits is not None else None
+    peak_rss_reset = _reset_peak_rss()
+    start_cpu = _cpu_time()
+    start = time.perf_counter()
+    # limit -> (soft, hard) limits to restore after the job
+    previous = {}
+    try:
+        if memory_mb is not None:
+            previous[resource.RLIMIT_AS] = _set_soft_limit(
+                resource.RLIMIT_AS, _address_space() + int(memory_mb * MB)
+            )
+        if cpu_time_s is not None:
+            previous[resource.RLIMIT_CPU] = _set_soft_limit(
+                resource.RLIMIT_CPU, math.ceil(start_cpu + cpu_time_s)
+            )
+        result = (True, func(*args, **kwargs))
+    except Exception as e:
+        logger.debug("Function exception!")
+        result = (False, (e, traceback.format_exc()))
+    finally:
+        # The worker runs other jobs after this one. Restoring the exact
+        # limits works under a finite hard limit too (e.g. from ulimit or SLURM)
+        for limit, limits in previous.items():
+            resource.setrlimit(limit, limits)
+    usage = ResourceUsage(
+        wall_time_s=time.perf_counter() - start,
+        cpu_time_s=_cpu_time() - start_cpu,
+        peak_rss_mb=_peak_rss_mb(peak_rss_reset),
+    )
+    return (*result, usage)
 
-    def wrapper(q, *a, **kw):
-        logger.debug("In timer wrapper")
+
+def _sandbox_worker(conn):
+    """Run the jobs sent over `conn` until it is closed"""
+    # Exceeding the soft CPU time limit of a job raises an exception in the job
+    # instead of killing the worker
+    signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        ok, payload, usage = _run_limited(*job)
         try:
-            val = func(*a, **kw)
-            logger.debug(f"Function returned: {val}")
-            q.put((True, val))
+            conn.send((ok, payload, usage))
         except Exception as e:
-            logger.debug("Function exception!")
-            q.put((False, (e, traceback.format_exc())))
-
-    q = mp.Queue()
-    p = mp.Process(target=wrapper, args=(q, *args), kwargs=kwargs)
-    p.start()
-    logger.debug("started worker thread")
-    p.join(timeout)
-    logger.debug("joined")
-
-    if p.is_alive():
-        logger.debug("p was still alive")
-        p.terminate()
-        p.join()
-        raise FunctionTimeoutError(f"Function exceeded timeout of {timeout} seconds")
-
-    if not q.empty():
-        logger.debug("p was dead")
-        ok, payload = q.get_nowait()
-        logger.debug("got payload")
+            # e.g. a result that can't be pickled
+            error = (RuntimeError(str(e)), traceback.format_exc())
+            conn.send((False, error, usage))
+
+
+class SandboxWorker:
+    """A long-lived process that runs one job at a time"""
+
+    def __init__(self, mp_context):
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(
+            target=_sandbox_worker, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def run(self, func, args, kwargs, timeout, limits):
+        self.conn.send((func, args, kwargs, limits))
+        if not self.conn.poll(timeout):
+            raise FunctionTimeoutError(
+                f"Function exceeded timeout of {timeout} seconds"
+            )
+        try:
+            return self.conn.recv()
+        except EOFError:
+            raise RuntimeError("Worker exited without returning anything")
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+FORKSERVER_PRELOAD = ["heracles_agents.pipelines.codegen_utils"]
+
+
+class SandboxPool:
+    """Worker processes that run functions with a timeout, and are reused between calls.
+
+    Starting a process (and, under forkserver or spawn, re-importing everything and
+    unpickling the arguments) costs more than many of the functions that are
+    run, so workers are only replaced when a function times out or crashes
+    its worker. Anything a worker caches, e.g. the scene graphs loaded by
+    `load_dsg`, is kept for the next function it runs. Functions and their
+    arguments are pickled, so they have to be defined at module level.
+
+    Workers are started with forkserver by default: the experiment runners
+    call the pool from many threads, and a forked worker can inherit a lock
+    that another thread was holding.
+    """
+
+    max_workers = 4
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_workers=None, mp_context=None):
+        if max_workers is not None:
+            self.max_workers = max_workers
+        self.mp_context = mp.get_context(mp_context or "forkserver")
+        if self.mp_context.get_start_method() == "forkserver":
+            # Imported once by the server instead of by every new worker
+            self.mp_context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        self._idle = []
+        self._n_workers = 0
+        self._available = threading.Condition()
+
+    @classmethod
+    def shared(cls):
+        """The pool that `run_with_timeout` uses"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _acquire(self):
+        with self._available:
+            while not self._idle and self._n_workers >= self.max_workers:
+                self._available.wait()
+            if self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.kill()
+            else:
+                self._n_workers += 1
+            # Started while holding the lock, so that no other new worker
+            # inherits this worker's end of the pipe
+            try:
+                return SandboxWorker(self.mp_context)
+            except BaseException:
+                self._n_workers -= 1
+                self._available.notify()
+                raise
+
+    def _release(self, worker):
+        with self._available:
+            if worker is None:
+                self._n_workers -= 1
+            else:
+                self._idle.append(worker)
+            self._available.notify()
+
+    def run(self, func, args=(), kwargs=None, timeout=None, limits=None):
+        """
+        Run `func(*args, **kwargs)` in a worker process.
+
+        If the function takes longer than `timeout` seconds, kill its worker and raise FunctionTimeoutError.
+        """
+        return self.run_measured(func, args, kwargs, timeout, limits)[0]
+
+    def run_measured(self, func, args=(), kwargs=None, timeout=None, limits=None):
+        """Like `run`, but also returns the `ResourceUsage` of the function"""
+        worker = self._acquire()
+        try:
+            ok, payload, usage = worker.run(func, args, kwargs or {}, timeout, limits)
+        except BaseException:
+            logger.debug("Replacing sandbox worker")
+            worker.kill()
+            self._release(None)
+            raise
+        self._release(worker)
         if ok:
-            return payload
-        else:
-            err, tb = payload
-            raise err.__class__(f"{err}\nOriginal traceback:\n{tb}")
-    else:
-        raise RuntimeError("Worker exited without returning anything")
+            return payload, usage
+        err, tb = payload
+        raise err.__class__(f"{err}\nOriginal traceback:\n{tb}")
+
+    def close(self):
+        """Stop the idle workers"""
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._n_workers -= len(idle)
+        for worker in idle:
+            worker.kill()
+
+
+def run_with_timeout(func, args=(), kwargs=None, timeout=None, limits=None):
+    """
+    Run `func(*args, **kwargs)` in a separate process, from the shared `SandboxPool`.
+
+    If the function takes longer than `timeout` seconds, kill it and raise FunctionTimeoutError.
+    """
+    logger.debug("In run_with_timeout")
+    return SandboxPool.shared().run(func, args, kwargs, timeout, limits)
 
 
 # ---------------- example ----------------